@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+import capacidade
+import db
+import fluxo
+import serializacao
+
+# Realocação de funcionários entre etapas para reduzir a maior sobrecarga.
+# Sobrecarga de uma etapa = demanda / producao_media alocada, em dias para
+# zerar a fila; a demanda é a quantidade das ordens paradas na etapa mais a
+# das tarefas em aberto nela (ordens em Producao que já têm tarefas entram só
+# pelas tarefas das sub-etapas).
+#
+# Busca local a partir da alocação atual: a cada passo, todas as mudanças de
+# uma pessoa para a etapa gargalo e todas as trocas de uma pessoa do gargalo
+# por outra de fora são avaliadas de uma vez com arrays, e a melhor é
+# aplicada. Para quando nada melhora, quando o limite de mudanças é atingido
+# ou quando o tempo acaba (devolve o melhor plano até ali). Um novo cálculo
+# com as mesmas opções parte do último plano, então pequenas mudanças nos
+# dados custam poucos passos.
+
+# Etapa com demanda e ninguém alocado fica acima de qualquer prazo, pela demanda
+PESO_SEM_CAPACIDADE = 1e9
+
+TEMPO_LIMITE_MAXIMO = 5.0
+
+
+class Problema:
+    def __init__(self, etapas, demanda, funcionarios):
+        self.etapa_ids = np.array([e[0] for e in etapas], dtype=np.int64)
+        self.etapa_nomes = [e[1] for e in etapas]
+        self.demanda = np.asarray(demanda, dtype=np.float64)
+        indice = {etapa_id: i for i, etapa_id in enumerate(self.etapa_ids.tolist())}
+        self.indice_etapa = indice
+        self.funcionario_ids = np.array([f[0] for f in funcionarios], dtype=np.int64)
+        self.funcionario_nomes = [f[1] for f in funcionarios]
+        self.atual = np.array([indice[f[2]] for f in funcionarios], dtype=np.int64)
+        self.producao = np.array([f[3] or 0 for f in funcionarios], dtype=np.float64)
+
+
+class Solucao:
+    def __init__(self, destino, iteracoes, segundos, tempo_esgotado, incremental):
+        self.destino = destino
+        self.iteracoes = iteracoes
+        self.segundos = segundos
+        self.tempo_esgotado = tempo_esgotado
+        self.incremental = incremental
+
+
+def carregar(conn, etapa_ids=None):
+    # Etapas em aberto (fora do setor 'Fim'), opcionalmente só as pedidas;
+    # funcionários de outras etapas ficam onde estão
+    cursor = serializacao.cursor_tuplas(conn)
+    etapas = cursor.execute('''
+        SELECT e.id, e.nome, COALESCE(c.quantidade_ordens, 0)
+        FROM etapa e
+        LEFT JOIN etapa_capacidade c ON c.etapa_id = e.id
+        WHERE e.setor IS NULL OR e.setor != 'Fim'
+        ORDER BY e.id
+    ''').fetchall()
+    if etapa_ids:
+        etapas = [e for e in etapas if e[0] in etapa_ids]
+
+    tarefas = dict(cursor.execute('SELECT etapa_id, SUM(quantidade) FROM ordem_carga_aberta GROUP BY etapa_id'))
+    em_tarefas = dict(cursor.execute('''
+        SELECT op.etapa_id, SUM(op.quantidade)
+        FROM ordem_producao op
+        JOIN ordem_tarefas_resumo r ON r.ordem_id = op.id
+        WHERE r.total > 0
+          AND op.etapa_id IN (SELECT id FROM etapa WHERE nome = ?)
+        GROUP BY op.etapa_id
+    ''', (fluxo.ETAPA_PRODUCAO,)))
+    demanda = [
+        max(quantidade - em_tarefas.get(etapa_id, 0), 0) + tarefas.get(etapa_id, 0)
+        for etapa_id, _, quantidade in etapas
+    ]
+
+    funcionarios = cursor.execute(f'''
+        SELECT id, nome, etapa_id, producao_media
+        FROM funcionarios
+        WHERE etapa_id IN ({', '.join('?' * len(etapas))})
+        ORDER BY id
+    ''', [e[0] for e in etapas]).fetchall() if etapas else []
+    return Problema([e[:2] for e in etapas], demanda, funcionarios)
+
+
+def sobrecarga(demanda, producao):
+    com_gente = producao > 1e-9
+    return np.where(com_gente, demanda / np.where(com_gente, producao, 1), demanda * PESO_SEM_CAPACIDADE)
+
+
+def _objetivo(problema, destino):
+    valores = sobrecarga(problema.demanda, np.bincount(destino, problema.producao, len(problema.demanda)))
+    return (valores.max(initial=0), float((valores ** 2).sum()))
+
+
+def resolver(problema, max_movimentos=None, fixos=None, tempo_limite=0.5, inicio=None):
+    # fixos: {índice do funcionário: índice da etapa}; quem está fixo não
+    # conta no limite de mudanças
+    inicio_relogio = time.perf_counter()
+    prazo = inicio_relogio + tempo_limite
+    d, p, atual = problema.demanda, problema.producao, problema.atual
+    n_etapas = len(d)
+    movel = np.ones(len(p), dtype=bool)
+    limite = np.inf if max_movimentos is None else max_movimentos
+
+    def com_fixos(destino):
+        destino = destino.copy()
+        for funcionario, etapa in (fixos or {}).items():
+            destino[funcionario] = etapa
+        return destino
+
+    for funcionario in fixos or {}:
+        movel[funcionario] = False
+    destino = com_fixos(atual)
+    incremental = False
+    if inicio is not None:
+        candidato = com_fixos(inicio)
+        if (((candidato != atual) & movel).sum() <= limite
+                and _objetivo(problema, candidato) < _objetivo(problema, destino)):
+            destino, incremental = candidato, True
+
+    c = np.bincount(destino, p, n_etapas) if n_etapas else np.zeros(0)
+    movimentos = int(((destino != atual) & movel).sum())
+    iteracoes = 0
+    tempo_esgotado = False
+    while n_etapas > 1:
+        if time.perf_counter() >= prazo:
+            tempo_esgotado = True
+            break
+        v = sobrecarga(d, c)
+        b = int(np.argmax(v))
+        pior = v[b]
+        if pior <= 0:
+            break
+        quadrados = float((v ** 2).sum())
+
+        # Maior sobrecarga fora do gargalo e da etapa de origem, por origem
+        outras = v.copy()
+        outras[b] = -1
+        primeira, segunda = np.argsort(-outras, kind='stable')[:2]
+        fora = np.where(np.arange(n_etapas) == primeira, max(outras[segunda], 0), max(outras[primeira], 0))
+
+        def avaliar(e, f, ganho):
+            s = destino[e]
+            vb = sobrecarga(d[b], c[b] + ganho)
+            vs = sobrecarga(d[s], c[s] - ganho)
+            novo_max = np.maximum(np.maximum(vb, vs), fora[s])
+            novo_q = quadrados - v[s] ** 2 - pior ** 2 + vs ** 2 + vb ** 2
+            delta = (b != atual[e]).astype(np.int64) - (s != atual[e])
+            if f is not None:
+                delta += (s != atual[f]).astype(np.int64) - (b != atual[f])
+            valido = (ganho > 0) & (movimentos + delta <= limite) & (
+                (novo_max < pior * (1 - 1e-12)) | ((novo_max <= pior) & (novo_q < quadrados * (1 - 1e-12)))
+            )
+            if not valido.any():
+                return None
+            i = np.flatnonzero(valido)[np.lexsort((novo_q[valido], novo_max[valido]))[0]]
+            return e[i], None if f is None else f[i], s[i], ganho[i], delta[i]
+
+        doadores = np.flatnonzero(movel & (destino != b))
+        receptores = np.flatnonzero(movel & (destino == b))
+        # Mudança: doador vai para o gargalo. Troca (doador vai para o
+        # gargalo e alguém do gargalo vai para a etapa do doador) só quando
+        # nenhuma mudança simples melhora: conta como duas mudanças e a
+        # matriz doadores x receptores é o passo caro
+        melhor = avaliar(doadores, None, p[doadores]) if doadores.size else None
+        if melhor is None and doadores.size and receptores.size:
+            e, f = np.meshgrid(doadores, receptores, indexing='ij')
+            melhor = avaliar(e.ravel(), f.ravel(), (p[e] - p[f]).ravel())
+
+        if melhor is None:
+            break
+        e, f, s, ganho, delta = melhor
+        destino[e] = b
+        if f is not None:
+            destino[f] = s
+        c[b] += ganho
+        c[s] -= ganho
+        movimentos += int(delta)
+        iteracoes += 1
+
+    return Solucao(destino, iteracoes, time.perf_counter() - inicio_relogio, tempo_esgotado, incremental)
+
+
+def _dias(demanda, producao):
+    if demanda <= 0:
+        return 0.0
+    if producao <= 0:
+        return None
+    return round(demanda / producao, 2)
+
+
+def plano(problema, solucao):
+    destino, atual = solucao.destino, problema.atual
+    n_etapas = len(problema.demanda)
+    antes = np.bincount(atual, problema.producao, n_etapas) if n_etapas else np.zeros(0)
+    depois = np.bincount(destino, problema.producao, n_etapas) if n_etapas else np.zeros(0)
+    etapa_ids = problema.etapa_ids.tolist()
+    movidos = np.flatnonzero(destino != atual)
+    etapas = [{
+        'etapa_id': etapa_ids[i],
+        'nome': problema.etapa_nomes[i],
+        'demanda': float(problema.demanda[i]),
+        'capacidade_antes': float(antes[i]),
+        'capacidade_depois': float(depois[i]),
+        'dias_antes': _dias(problema.demanda[i], antes[i]),
+        'dias_depois': _dias(problema.demanda[i], depois[i]),
+        'status_antes': capacidade.status(problema.demanda[i], antes[i]),
+        'status_depois': capacidade.status(problema.demanda[i], depois[i]),
+    } for i in range(n_etapas)]
+
+    def pior(coluna):
+        dias = [etapa[coluna] for etapa in etapas]
+        return None if None in dias else max(dias, default=0.0)
+
+    return {
+        'movimentos': [{
+            'funcionario_id': int(problema.funcionario_ids[i]),
+            'nome': problema.funcionario_nomes[i],
+            'producao_media': float(problema.producao[i]),
+            'de_etapa_id': etapa_ids[atual[i]],
+            'para_etapa_id': etapa_ids[destino[i]],
+        } for i in movidos],
+        'dias_max_antes': pior('dias_antes'),
+        'dias_max_depois': pior('dias_depois'),
+        'etapas': etapas,
+        'iteracoes': solucao.iteracoes,
+        'tempo_ms': round(solucao.segundos * 1000, 1),
+        'tempo_esgotado': solucao.tempo_esgotado,
+        'incremental': solucao.incremental,
+    }
+
+
+def otimizar(conn, app, max_movimentos=None, fixos=None, etapa_ids=None, tempo_limite=None):
+    # fixos: {funcionario_id: etapa_id ou None (fica onde está)}. O último
+    # plano de cada conjunto de opções fica guardado e serve de ponto de
+    # partida do próximo cálculo.
+    estado = db.estado('alocacao', lambda path: {'trava': threading.Lock(), 'planos': {}}, app)
+    tempo_limite = min(tempo_limite or app.config['ALOCACAO_TEMPO_LIMITE'], TEMPO_LIMITE_MAXIMO)
+    problema = carregar(conn, etapa_ids)
+
+    indice_funcionario = {f: i for i, f in enumerate(problema.funcionario_ids.tolist())}
+    fixos_idx = {}
+    for funcionario_id, etapa_id in (fixos or {}).items():
+        if funcionario_id not in indice_funcionario:
+            raise ValueError(f'Funcionário {funcionario_id} não está nas etapas consideradas')
+        i = indice_funcionario[funcionario_id]
+        if etapa_id is None:
+            fixos_idx[i] = int(problema.atual[i])
+        elif etapa_id in problema.indice_etapa:
+            fixos_idx[i] = problema.indice_etapa[etapa_id]
+        else:
+            raise ValueError(f'Etapa {etapa_id} não está entre as etapas consideradas')
+
+    chave = (max_movimentos, tuple(sorted((fixos or {}).items(), key=str)), tuple(sorted(etapa_ids or ())))
+    inicio = None
+    with estado['trava']:
+        anterior = estado['planos'].get(chave)
+    if anterior:
+        # Só aproveita o destino de quem continua onde estava no plano anterior
+        inicio = problema.atual.copy()
+        etapa_ids_lista = problema.etapa_ids.tolist()
+        for i, funcionario_id in enumerate(problema.funcionario_ids.tolist()):
+            de, para = anterior.get(funcionario_id, (None, None))
+            if de == etapa_ids_lista[problema.atual[i]] and para in problema.indice_etapa:
+                inicio[i] = problema.indice_etapa[para]
+
+    solucao = resolver(problema, max_movimentos, fixos_idx, tempo_limite, inicio)
+    etapa_ids_lista = problema.etapa_ids.tolist()
+    with estado['trava']:
+        estado['planos'][chave] = {
+            funcionario_id: (etapa_ids_lista[problema.atual[i]], etapa_ids_lista[solucao.destino[i]])
+            for i, funcionario_id in enumerate(problema.funcionario_ids.tolist())
+        }
+        # Poucas combinações de opções guardadas; as mais antigas saem
+        while len(estado['planos']) > 16:
+            estado['planos'].pop(next(iter(estado['planos'])))
+    return plano(problema, solucao)
+
+
+def init_app(app):
+    # Segundos de busca por cálculo (o pedido pode baixar, ou subir até TEMPO_LIMITE_MAXIMO)
+    app.config.setdefault('ALOCACAO_TEMPO_LIMITE', float(os.environ.get('KANBAN_ALOCACAO_TEMPO_LIMITE', 0.5)))
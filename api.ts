@@ -1,4 +1,7 @@
-const API_BASE = "http://127.0.0.1:5000";
+const API_ROOT = "http://127.0.0.1:5000";
+// Modo multiplanta: a planta vai no prefixo da URL (o EventSource não manda headers)
+const PLANT = process.env.NEXT_PUBLIC_KANBAN_PLANTA;
+const API_BASE = PLANT ? `${API_ROOT}/plantas/${encodeURIComponent(PLANT)}` : API_ROOT;
 
 export interface Stage {
   id: number;
@@ -7,6 +10,8 @@ export interface Stage {
   status: string;
   capacidade_alocada: number;
   capacidade_necessaria: number;
+  total_ordens?: number;
+  total_funcionarios?: number;
 }
 
 export interface Order {
@@ -48,7 +53,250 @@ export interface Task {
   data_fim?: string | null;
 }
 
+export interface BoardStage extends Stage {
+  ordens: Array<Order & { tarefas: Task[] }>;
+  funcionarios: Employee[];
+}
+
+export interface BoardResponse {
+  versao: number;
+  etapas: BoardStage[];
+  sem_etapa: {
+    ordens: Array<Order & { tarefas: Task[] }>;
+    funcionarios: Employee[];
+  };
+}
+
+export interface SyncResponse {
+  versao: number;
+  completo: boolean;
+  produtos: Order[];
+  tarefas: Task[];
+  funcionarios: Employee[];
+  etapas: Stage[];
+  removidos: {
+    produtos: number[];
+    tarefas: number[];
+    funcionarios: number[];
+  };
+}
+
+export interface OrderForecast {
+  id: number;
+  OS: number;
+  etapa_id: number | null;
+  data_entrega: string;
+  data_prevista: string | null;
+  folga_dias: number | null;
+  atrasada: boolean;
+  sem_capacidade: boolean;
+}
+
+export interface ForecastResponse {
+  versao: number;
+  data_base: string;
+  resumo: { ordens: number; atrasadas: number; sem_capacidade: number };
+  etapas: Array<{
+    etapa_id: number;
+    nome: string;
+    producao_diaria: number;
+    carga: number;
+    ordens: number;
+    dias_fila: number | null;
+  }>;
+  ordens: OrderForecast[];
+}
+
+export interface StageIndicator {
+  pecas_entrada: number;
+  pecas_saida: number;
+  itens_entrada: number;
+  itens_saida: number;
+  wip: number;
+  permanencia_mediana_s: number | null;
+  permanencia_p90_s: number | null;
+}
+
+export interface StageIndicatorsResponse {
+  granularidade: 'hora' | 'dia';
+  de: string;
+  ate: string;
+  etapas: Array<{
+    etapa_id: number;
+    nome: string;
+    total: StageIndicator;
+    serie: Array<StageIndicator & { periodo: string }>;
+  }>;
+}
+
+export interface Transition {
+  id: number;
+  momento: string;
+  entidade: 'ordem' | 'tarefa';
+  registro_id: number;
+  evento: 'criacao' | 'alteracao' | 'remocao';
+  de_etapa_id: number | null;
+  para_etapa_id: number | null;
+  de_status: string | null;
+  para_status: string | null;
+  permanencia_segundos: number | null;
+}
+
+export interface PlantsStagesResponse {
+  etapas: Array<Omit<Stage, 'id'>>;
+  plantas: Array<{ planta: string; etapas: Stage[] }>;
+  falhas: Array<{ planta: string; error: string }>;
+}
+
+export interface AllocationMove {
+  funcionario_id: number;
+  nome: string;
+  producao_media: number;
+  de_etapa_id: number;
+  para_etapa_id: number;
+}
+
+export interface AllocationPlan {
+  versao: number;
+  aplicado: boolean;
+  movimentos: AllocationMove[];
+  dias_max_antes: number | null;
+  dias_max_depois: number | null;
+  etapas: Array<{
+    etapa_id: number;
+    nome: string;
+    demanda: number;
+    capacidade_antes: number;
+    capacidade_depois: number;
+    dias_antes: number | null;
+    dias_depois: number | null;
+    status_antes: string;
+    status_depois: string;
+  }>;
+  iteracoes: number;
+  tempo_ms: number;
+  tempo_esgotado: boolean;
+  incremental: boolean;
+}
+
+export interface AllocationOptions {
+  max_movimentos?: number;
+  fixos?: Record<number, number | null> | number[];
+  etapa_ids?: number[];
+  tempo_limite_ms?: number;
+  aplicar?: boolean;
+}
+
+export const BOARD_EVENT_TYPES = [
+  'produto_adicionado',
+  'funcionario_adicionado',
+  'ordem_movida',
+  'ordens_movidas',
+  'tarefas_criadas',
+  'tarefa_atualizada',
+  'tarefas_atualizadas',
+  'funcionarios_realocados',
+  'ordens_arquivadas',
+  'ordem_restaurada',
+  'produtos_importados',
+  'funcionarios_importados',
+  'importacao_concluida',
+  'reset',
+];
+
 export const api = {
+  // Assina o feed /eventos (SSE); o EventSource reconecta sozinho e
+  // retoma a partir do último id recebido. Retorna a função para fechar.
+  subscribeEvents: (onEvent: (type: string, data: any) => void): (() => void) => {
+    const source = new EventSource(`${API_BASE}/eventos`);
+    BOARD_EVENT_TYPES.forEach(type => {
+      source.addEventListener(type, (event) => {
+        onEvent(type, JSON.parse((event as MessageEvent).data));
+      });
+    });
+    return () => source.close();
+  },
+
+  // Etapas, ordens, funcionários e tarefas de um único snapshot do banco
+  fetchBoard: async (): Promise<BoardResponse> => {
+    const response = await fetch(`${API_BASE}/board`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  fetchForecast: async (params: { atrasadas?: boolean; etapa_id?: number[] } = {}): Promise<ForecastResponse> => {
+    const query = new URLSearchParams();
+    if (params.atrasadas) query.set('atrasadas', '1');
+    if (params.etapa_id?.length) query.set('etapa_id', params.etapa_id.join(','));
+    const response = await fetch(`${API_BASE}/previsao?${query}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  fetchStageIndicators: async (params: { granularidade?: 'hora' | 'dia'; de?: string; ate?: string; etapa_id?: number[] } = {}): Promise<StageIndicatorsResponse> => {
+    const query = new URLSearchParams();
+    if (params.granularidade) query.set('granularidade', params.granularidade);
+    if (params.de) query.set('de', params.de);
+    if (params.ate) query.set('ate', params.ate);
+    if (params.etapa_id?.length) query.set('etapa_id', params.etapa_id.join(','));
+    const response = await fetch(`${API_BASE}/indicadores/etapas?${query}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  fetchOrderHistory: async (produtoId: number): Promise<Transition[]> => {
+    const response = await fetch(`${API_BASE}/produtos/${produtoId}/historico`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  optimizeAllocation: async (options: AllocationOptions = {}): Promise<AllocationPlan> => {
+    const response = await fetch(`${API_BASE}/funcionarios/alocacao`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(options),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  applyAllocation: async (movimentos: AllocationMove[]): Promise<{ message: string; versao: number }> => {
+    const response = await fetch(`${API_BASE}/funcionarios/alocacao/aplicar`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ movimentos }),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  // Capacidade por etapa somada entre as plantas (ou só as informadas)
+  fetchPlantsStages: async (plantas: string[] = []): Promise<PlantsStagesResponse> => {
+    const query = new URLSearchParams();
+    if (plantas.length) query.set('plantas', plantas.join(','));
+    const response = await fetch(`${API_ROOT}/agregado/etapas?${query}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+
   fetchStages: async (): Promise<Stage[]> => {
     const response = await fetch(`${API_BASE}/etapas`);
     if (!response.ok) {
@@ -73,6 +321,16 @@ export const api = {
     return response.json();
   },
   
+  // Alterações depois da versão informada; guarde "versao" para a próxima chamada
+  fetchChanges: async (since?: number): Promise<SyncResponse> => {
+    const query = since ? `?since=${since}` : '';
+    const response = await fetch(`${API_BASE}/sync${query}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+  
   fetchTasks: async (): Promise<Task[]> => {
     const response = await fetch(`${API_BASE}/tarefas`);
     if (!response.ok) {
@@ -125,6 +383,20 @@ export const api = {
     return response.json();
   },
   
+  updateTasks: async (updates: Array<Partial<Task> & { id: number }>, allOrNothing = false) => {
+    const response = await fetch(`${API_BASE}/tarefas`, {
+      method: 'PATCH',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ tarefas: updates, tudo_ou_nada: allOrNothing }),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  },
+  
   updateOrder: async (orderId: number, updates: Partial<Order>) => {
     try {
       console.log(`Atualizando ordem ${orderId} com:`, updates);
@@ -174,5 +446,19 @@ export const api = {
       console.log('Erro na função updateOrder:', error);
       throw error;
     }
+  },
+  
+  moveOrders: async (stageId: number, selection: { ids?: number[]; filtro?: Record<string, string | number> }) => {
+    const response = await fetch(`${API_BASE}/produtos/mover`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ etapa_id: stageId, ...selection }),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
   }
 }; 
\ No newline at end of file
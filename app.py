@@ -1,12 +1,44 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context, url_for
 import sqlite3
+import json
 from flask_cors import CORS
-import pandas as pd
+from io import BytesIO
 import os
-from werkzeug.utils import secure_filename
+
+import alocacao
+import arquivo
+import capacidade
+import catalogo
+import db
+import escrita
+import eventos
+import exportacao
+import fluxo
+import importacao
+import jobs
+import metricas
+import migrations
+import paginacao
+import plantas
+import previsao
+import serializacao
+import transicoes
+import versao
+from db import get_db_connection
 
 app = Flask(__name__)
 CORS(app)
+db.init_app(app)
+escrita.init_app(app)
+metricas.init_app(app)
+capacidade.init_app(app)
+migrations.init_app(app)
+jobs.init_app(app)
+eventos.init_app(app)
+serializacao.init_app(app)
+alocacao.init_app(app)
+arquivo.init_app(app)
+plantas.init_app(app)
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
 
@@ -15,15 +47,14 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('KANBAN_IMPORT_BATCH_SIZE', 5000))
+# Mensagens de erro devolvidas por importação; as demais só são contadas
+app.config['IMPORT_MAX_ERRORS'] = int(os.environ.get('KANBAN_IMPORT_MAX_ERRORS', 1000))
+app.config['PAGE_MAX_LIMIT'] = int(os.environ.get('KANBAN_PAGE_MAX_LIMIT', 1000))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_db_connection():
-    conn = sqlite3.connect('KanbanProjeto/kanban.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -92,34 +123,36 @@ def init_db():
     ''')
     
     conn.commit()
-    conn.close()
-
-# Adicione esta função para criar a tabela de tarefas
+    # Etapas semeadas: o catálogo em memória deste processo recarrega
+    catalogo.invalidar()
 
 @app.route('/produtos', methods=['POST'])
 def adicionar_produto():
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
     # First, get the etapa_id for the given stage name
-    cursor.execute('SELECT id FROM etapa WHERE nome = ?', (data.get('etapa', 'Não atribuido'),))
-    etapa_result = cursor.fetchone()
+    etapa_id = catalogo.obter().id_por_nome(data.get('etapa', 'Não atribuido'))
     
-    if etapa_result is None:
-        conn.close()
+    if etapa_id is None:
         return jsonify({'error': 'Etapa não encontrada'}), 400
-        
-    etapa_id = etapa_result['id']
-    
-    cursor.execute('''
-        INSERT INTO ordem_producao (OS, produto, estampa, quantidade, data_entrega, cliente_final, etapa_id) 
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (data['OS'], data['produto'], data['estampa'], data['quantidade'], 
-          data['data_entrega'], data.get('cliente_final', ''), etapa_id))
     
-    conn.commit()
-    conn.close()
+    def inserir(conn):
+        # O índice único só cobre as ordens quentes; com a OS repetida, a
+        # arquivada não poderia mais ser restaurada
+        if conn.execute('SELECT 1 FROM ordem_producao_arquivo WHERE OS = ?', (data['OS'],)).fetchone():
+            raise escrita.OperacaoRecusada(f"OS '{data['OS']}' já existe no sistema. Não é possível duplicar.", 409)
+        cursor = conn.execute('''
+            INSERT INTO ordem_producao (OS, produto, estampa, quantidade, data_entrega, cliente_final, etapa_id) 
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (data['OS'], data['produto'], data['estampa'], data['quantidade'], 
+              data['data_entrega'], data.get('cliente_final', ''), etapa_id))
+        eventos.publicar(conn, 'produto_adicionado', {'id': cursor.lastrowid, 'OS': data['OS'], 'etapa_id': etapa_id})
+        versao.bump(conn)
+    
+    try:
+        escrita.executar(inserir)
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f"OS '{data['OS']}' já existe no sistema. Não é possível duplicar."}), 409
     return jsonify({'message': 'Produto adicionado'}), 201
 
 @app.route('/funcionarios', methods=['POST'])
@@ -129,119 +162,349 @@ def adicionar_funcionario():
     cursor = conn.cursor()
     
     # Primeiro, pega o etapa_id baseado no nome da etapa
-    cursor.execute('SELECT id FROM etapa WHERE nome = ?', (data.get('etapa', 'Não atribuido'),))
-    etapa_result = cursor.fetchone()
+    etapa_id = catalogo.obter(conn).id_por_nome(data.get('etapa', 'Não atribuido'))
     
-    if etapa_result is None:
-        conn.close()
+    if etapa_id is None:
         return jsonify({'error': 'Etapa não encontrada'}), 400
-        
-    etapa_id = etapa_result['id']
     
     cursor.execute('''
         INSERT INTO funcionarios (nome, etapa_id, producao_media) 
         VALUES (?, ?, ?)
     ''', (data['nome'], etapa_id, data['producao_media']))
     
+    eventos.publicar(conn, 'funcionario_adicionado', {'id': cursor.lastrowid, 'etapa_id': etapa_id})
+    versao.bump(conn)
     conn.commit()
-    conn.close()
     return jsonify({'message': 'Funcionário adicionado'}), 201
     
 
+FILTROS_PRODUTOS = {
+    'etapa_id': paginacao.em_lista('op.etapa_id'),
+    'OS': paginacao.igual('op.OS'),
+    'data_entrega_de': paginacao.data_de('op.data_entrega'),
+    'data_entrega_ate': paginacao.data_ate('op.data_entrega'),
+    # Ordens em aberto x já entregues/canceladas (etapas do setor 'Fim')
+    'status': paginacao.opcoes({
+        'aberta': "e.setor IS NULL OR e.setor != 'Fim'",
+        'finalizada': "e.setor = 'Fim'"
+    })
+}
+
+FILTROS_FUNCIONARIOS = {
+    'etapa_id': paginacao.em_lista('f.etapa_id')
+}
+
+FILTROS_TAREFAS = {
+    'etapa_id': paginacao.em_lista('t.etapa_id'),
+    'status': paginacao.em_lista('t.status', str),
+    'ordem_id': paginacao.em_lista('t.ordem_id'),
+    'OS': paginacao.igual('op.OS'),
+    'data_entrega_de': paginacao.data_de('op.data_entrega'),
+    'data_entrega_ate': paginacao.data_ate('op.data_entrega')
+}
+
+# Fração das linhas que o /sync espera ver num delta (dica para o planner)
+SYNC_SELETIVIDADE = 0.01
+
+# Colunas de cada lista, na ordem do SELECT (ver serializacao.Colunas)
+PRODUTO = serializacao.Colunas(
+    id='op.id',
+    produto='op.produto',
+    estampa='op.estampa',
+    quantidade='op.quantidade',
+    OS='op.OS',
+    data_entrega='op.data_entrega',
+    cliente_final='op.cliente_final',
+    etapa="COALESCE(e.nome, 'OS no email')",
+    etapa_id='op.etapa_id'
+)
+
+FUNCIONARIO = serializacao.Colunas(
+    id='f.id',
+    nome='f.nome',
+    etapa="COALESCE(e.nome, 'OS no email')",
+    etapa_id='e.id',
+    producao_media='f.producao_media'
+)
+
+TAREFA = serializacao.Colunas(
+    id='t.id',
+    ordem_id='t.ordem_id',
+    etapa_id='t.etapa_id',
+    etapa_nome='e.nome',
+    descricao='t.descricao',
+    quantidade='t.quantidade',
+    status='t.status',
+    data_criacao='t.data_criacao',
+    data_atualizacao='t.data_atualizacao'
+)
+
+# Com ?include_archived=1: as mesmas colunas mais arquivado_em (NULL nas
+# linhas que ainda estão nas tabelas quentes)
+PRODUTO_HISTORICO = serializacao.Colunas(
+    id='op.id',
+    produto='op.produto',
+    estampa='op.estampa',
+    quantidade='op.quantidade',
+    OS='op.OS',
+    data_entrega='op.data_entrega',
+    cliente_final='op.cliente_final',
+    etapa="COALESCE(e.nome, 'OS no email')",
+    etapa_id='op.etapa_id',
+    arquivado_em='op.arquivado_em'
+)
+
+TAREFA_LISTA = serializacao.Colunas(
+    id='t.id',
+    ordem_id='t.ordem_id',
+    OS='op.OS',
+    produto='op.produto',
+    etapa_id='t.etapa_id',
+    etapa_nome='e.nome',
+    descricao='t.descricao',
+    quantidade='t.quantidade',
+    status='t.status',
+    data_criacao='t.data_criacao',
+    data_atualizacao='t.data_atualizacao'
+)
+
+TAREFA_LISTA_HISTORICO = serializacao.Colunas(
+    id='t.id',
+    ordem_id='t.ordem_id',
+    OS='op.OS',
+    produto='op.produto',
+    etapa_id='t.etapa_id',
+    etapa_nome='e.nome',
+    descricao='t.descricao',
+    quantidade='t.quantidade',
+    status='t.status',
+    data_criacao='t.data_criacao',
+    data_atualizacao='t.data_atualizacao',
+    arquivado_em='t.arquivado_em'
+)
+
+TAREFA_ETAPA = serializacao.Colunas(
+    id='t.id',
+    ordem_id='t.ordem_id',
+    OS='op.OS',
+    produto='op.produto',
+    estampa='op.estampa',
+    data_entrega='op.data_entrega',
+    etapa_id='t.etapa_id',
+    etapa_nome='e.nome',
+    descricao='t.descricao',
+    quantidade='t.quantidade',
+    status='t.status',
+    data_criacao='t.data_criacao',
+    data_atualizacao='t.data_atualizacao'
+)
+
+# Entidades de /exportar: colunas, FROM, coluna da ordenação e filtros (os
+# mesmos das listas)
+EXPORTACOES = {
+    'produtos': (PRODUTO, '''
+        FROM ordem_producao op
+        LEFT JOIN etapa e ON op.etapa_id = e.id
+    ''', 'op.id', FILTROS_PRODUTOS),
+    'funcionarios': (FUNCIONARIO, '''
+        FROM funcionarios f
+        LEFT JOIN etapa e ON f.etapa_id = e.id
+    ''', 'f.id', FILTROS_FUNCIONARIOS),
+    'tarefas': (TAREFA_LISTA, '''
+        FROM tarefas t
+        JOIN etapa e ON t.etapa_id = e.id
+        JOIN ordem_producao op ON t.ordem_id = op.id
+    ''', 't.id', FILTROS_TAREFAS),
+}
+
+def _incluir_arquivadas():
+    return request.args.get('include_archived', '').lower() in ('1', 'true')
+
+def _resposta_lista(colunas, rows, proximo_cursor, paginado):
+    # Sem ?limit a resposta continua sendo a lista completa
+    itens = serializacao.lista(colunas, rows)
+    if not paginado:
+        return jsonify(itens)
+    return jsonify({'items': itens, 'next_cursor': proximo_cursor})
+
+def _etapa_dict(row):
+    return {
+        "id": row["id"],
+        "nome": row["nome"],
+        "setor": row["setor"],
+        "capacidade_necessaria": row["capacidade_necessaria"],
+        "capacidade_alocada": row["capacidade_alocada"],
+        "total_ordens": row["total_ordens"],
+        "total_funcionarios": row["total_funcionarios"],
+        "status": capacidade.status(row["capacidade_necessaria"], row["capacidade_alocada"])
+    }
+
+@app.errorhandler(paginacao.ParametroInvalido)
+def parametro_invalido(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(escrita.OperacaoRecusada)
+def operacao_recusada(e):
+    return jsonify({'error': str(e)}), e.status
+
 @app.route('/produtos', methods=['GET'])
+@versao.condicional
 def listar_produtos():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    produtos = cursor.execute('''
-        SELECT op.*, e.nome as etapa_nome, e.id as etapa_id
-        FROM ordem_producao op
+    # ?include_archived=1 junta as ordens do arquivo (ver arquivo.py)
+    historico = _incluir_arquivadas()
+    colunas = PRODUTO_HISTORICO if historico else PRODUTO
+    conn = get_db_connection(readonly=True)
+    produtos, proximo, paginado = paginacao.consultar(serializacao.cursor_tuplas(conn), f'''
+        SELECT {colunas.select}
+        FROM {arquivo.ORDENS_COM_HISTORICO if historico else 'ordem_producao'} op
         LEFT JOIN etapa e ON op.etapa_id = e.id
-    ''').fetchall()
-    conn.close()
-    return jsonify([{
-        "id": row["id"], 
-        "produto": row["produto"], 
-        "estampa": row["estampa"],
-        "quantidade": row["quantidade"], 
-        "OS": row["OS"],
-        "data_entrega": row["data_entrega"],
-        "cliente_final": row["cliente_final"] if "cliente_final" in row.keys() else "",
-        "etapa": row["etapa_nome"] or "OS no email",
-        "etapa_id": row["etapa_id"]
-    } for row in produtos])
+    ''', 'op.id', request.args, FILTROS_PRODUTOS, app.config['PAGE_MAX_LIMIT'])
+    return _resposta_lista(colunas, produtos, proximo, paginado)
 
 
 @app.route('/funcionarios', methods=['GET'])
+@versao.condicional
 def listar_funcionarios():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    funcionarios = cursor.execute('''
-        SELECT f.id, f.nome, e.nome AS etapa, e.id AS etapa_id, f.producao_media 
+    conn = get_db_connection(readonly=True)
+    funcionarios, proximo, paginado = paginacao.consultar(serializacao.cursor_tuplas(conn), f'''
+        SELECT {FUNCIONARIO.select}
         FROM funcionarios f
         LEFT JOIN etapa e ON f.etapa_id = e.id
-    ''').fetchall()
-    conn.close()
-    return jsonify([{
-        "id": row["id"], 
-        "nome": row["nome"], 
-        "etapa": row["etapa"] or "OS no email",
-        "etapa_id": row["etapa_id"],
-        "producao_media": row["producao_media"]
-    } for row in funcionarios])
+    ''', 'f.id', request.args, FILTROS_FUNCIONARIOS, app.config['PAGE_MAX_LIMIT'])
+    return _resposta_lista(FUNCIONARIO, funcionarios, proximo, paginado)
+
+def _opcoes_alocacao(data):
+    max_movimentos = data.get('max_movimentos')
+    if max_movimentos is not None and (not isinstance(max_movimentos, int) or max_movimentos < 0):
+        raise ValueError("'max_movimentos' deve ser um inteiro >= 0")
+    fixos = data.get('fixos') or {}
+    if isinstance(fixos, list):
+        fixos = {funcionario_id: None for funcionario_id in fixos}
+    if not isinstance(fixos, dict):
+        raise ValueError("'fixos' deve ser um objeto {funcionario_id: etapa_id} ou uma lista de ids")
+    try:
+        fixos = {int(k): None if v is None else int(v) for k, v in fixos.items()}
+    except (TypeError, ValueError):
+        raise ValueError("'fixos' deve ter ids numéricos")
+    etapa_ids = data.get('etapa_ids')
+    if etapa_ids is not None and (not isinstance(etapa_ids, list) or not all(isinstance(i, int) for i in etapa_ids)):
+        raise ValueError("'etapa_ids' deve ser uma lista de números")
+    tempo_limite_ms = data.get('tempo_limite_ms')
+    if tempo_limite_ms is not None and (not isinstance(tempo_limite_ms, (int, float)) or tempo_limite_ms <= 0):
+        raise ValueError("'tempo_limite_ms' deve ser um número positivo")
+    return {
+        'max_movimentos': max_movimentos,
+        'fixos': fixos,
+        'etapa_ids': set(etapa_ids) if etapa_ids else None,
+        'tempo_limite': tempo_limite_ms / 1000 if tempo_limite_ms else None
+    }
+
+def _aplicar_realocacao(conn, movimentos):
+    # Na transação de escrita de quem chamou; devolve os conflitos (quem já
+    # não está na etapa de origem do plano) sem gravar nada se houver algum
+    atuais = dict(conn.execute(
+        'SELECT id, etapa_id FROM funcionarios WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps([m['funcionario_id'] for m in movimentos]),)
+    ).fetchall())
+    conflitos = [
+        m['funcionario_id'] for m in movimentos
+        if m['funcionario_id'] not in atuais or atuais[m['funcionario_id']] != m['de_etapa_id']
+    ]
+    if conflitos or not movimentos:
+        return conflitos
+    conn.executemany(
+        'UPDATE funcionarios SET etapa_id = ? WHERE id = ?',
+        [(m['para_etapa_id'], m['funcionario_id']) for m in movimentos]
+    )
+    eventos.publicar(conn, 'funcionarios_realocados', {
+        'movimentos': [{'id': m['funcionario_id'], 'etapa_id': m['para_etapa_id']} for m in movimentos]
+    })
+    versao.bump(conn)
+    return []
+
+@app.route('/funcionarios/alocacao', methods=['POST'])
+def otimizar_alocacao():
+    # Plano de realocação que reduz a maior sobrecarga entre as etapas (ver
+    # alocacao.py). Opções: {"max_movimentos": 5, "fixos": {"12": 4, "15": null},
+    # "etapa_ids": [...], "tempo_limite_ms": 300, "aplicar": false}. Com
+    # "aplicar": true o plano é gravado em seguida, numa transação curta: o
+    # cálculo roda num snapshot de leitura, fora do lock de escrita, e a
+    # gravação confere como /aplicar se alguém mudou de etapa nesse meio
+    # tempo (409 com os conflitos, sem gravar nada).
+    data = request.get_json(silent=True) or {}
+    try:
+        opcoes = _opcoes_alocacao(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection(readonly=True)
+    with db.snapshot(conn):
+        versao_atual = versao.atual(conn)
+        try:
+            resultado = alocacao.otimizar(conn, app, **opcoes)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if not data.get('aplicar'):
+        return jsonify({**resultado, 'versao': versao_atual, 'aplicado': False})
+    
+    conn = get_db_connection()
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    conflitos = _aplicar_realocacao(conn, resultado['movimentos'])
+    if conflitos:
+        conn.rollback()
+        return jsonify({'error': 'Funcionários mudaram de etapa desde o cálculo do plano', 'conflitos': conflitos}), 409
+    conn.commit()
+    return jsonify({**resultado, 'versao': versao.atual(conn), 'aplicado': True})
+
+@app.route('/funcionarios/alocacao/aplicar', methods=['POST'])
+def aplicar_alocacao():
+    # Grava um plano já revisado: {"movimentos": [{"funcionario_id", "de_etapa_id",
+    # "para_etapa_id"}, ...]}. Tudo ou nada: se alguém mudou de etapa desde
+    # o cálculo, responde 409 com os ids em conflito e não grava nada.
+    data = request.get_json(silent=True) or {}
+    movimentos = data.get('movimentos')
+    campos = ('funcionario_id', 'de_etapa_id', 'para_etapa_id')
+    if not isinstance(movimentos, list) or not all(
+        isinstance(m, dict) and all(isinstance(m.get(campo), int) for campo in campos) for m in movimentos
+    ):
+        return jsonify({'error': f"'movimentos' deve ser uma lista de objetos com {', '.join(campos)}"}), 400
+    
+    conn = get_db_connection()
+    etapas = catalogo.obter(conn)
+    desconhecidas = sorted({m['para_etapa_id'] for m in movimentos if not etapas.existe(m['para_etapa_id'])})
+    if desconhecidas:
+        return jsonify({'error': f'Etapas não encontradas: {desconhecidas}'}), 404
+    
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    conflitos = _aplicar_realocacao(conn, movimentos)
+    if conflitos:
+        conn.rollback()
+        return jsonify({'error': 'Funcionários mudaram de etapa desde o cálculo do plano', 'conflitos': conflitos}), 409
+    conn.commit()
+    return jsonify({'message': f'{len(movimentos)} funcionários realocados', 'versao': versao.atual(conn)})
 
 @app.route('/etapas', methods=['GET'])
+@versao.condicional
 def listar_etapas():
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     cursor = conn.cursor()
     
-    # Query que calcula ambas as capacidades para cada etapa
-    etapas = cursor.execute('''
-        SELECT 
-            e.id,
-            e.nome,
-            e.setor,
-            COALESCE(SUM(o.quantidade), 0) as capacidade_necessaria,
-            COALESCE(SUM(f.producao_media), 0) as capacidade_alocada
-        FROM etapa e
-        LEFT JOIN ordem_producao o ON e.id = o.etapa_id
-        LEFT JOIN funcionarios f ON e.id = f.etapa_id
-        GROUP BY e.id, e.nome, e.setor
-        ORDER BY e.id
-    ''').fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        "id": row["id"],
-        "nome": row["nome"],
-        "setor": row["setor"],
-        "capacidade_necessaria": row["capacidade_necessaria"],
-        "capacidade_alocada": row["capacidade_alocada"],
-        "status": "Sobrecarregado" if row["capacidade_necessaria"] > row["capacidade_alocada"] 
-                 else "Ocioso" if row["capacidade_necessaria"] < row["capacidade_alocada"]
-                 else "Balanceado"
-    } for row in etapas])
+    # Capacidades lidas do resumo mantido por triggers (ver capacidade.py)
+    etapas = cursor.execute(capacidade.ETAPAS_QUERY + ' ORDER BY e.id').fetchall()
+    
+    return jsonify([_etapa_dict(row) for row in etapas])
 
 # Opcional: Rota para obter detalhes de uma etapa específica
 @app.route('/etapas/<int:etapa_id>', methods=['GET'])
+@versao.condicional
 def detalhe_etapa(etapa_id):
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     cursor = conn.cursor()
     
     # Busca informações básicas da etapa
-    etapa = cursor.execute('''
-        SELECT 
-            e.id,
-            e.nome,
-            e.setor,
-            COALESCE(SUM(o.quantidade), 0) as capacidade_necessaria,
-            COALESCE(SUM(f.producao_media), 0) as capacidade_alocada
-        FROM etapa e
-        LEFT JOIN ordem_producao o ON e.id = o.etapa_id
-        LEFT JOIN funcionarios f ON e.id = f.etapa_id
-        WHERE e.id = ?
-        GROUP BY e.id, e.nome, e.setor
-    ''', (etapa_id,)).fetchone()
+    etapa = cursor.execute(capacidade.ETAPAS_QUERY + ' WHERE e.id = ?', (etapa_id,)).fetchone()
     
     if etapa is None:
         return jsonify({"error": "Etapa não encontrada"}), 404
@@ -260,17 +523,15 @@ def detalhe_etapa(etapa_id):
         WHERE etapa_id = ?
     ''', (etapa_id,)).fetchall()
     
-    conn.close()
-    
     return jsonify({
         "id": etapa["id"],
         "nome": etapa["nome"],
         "setor": etapa["setor"],
         "capacidade_necessaria": etapa["capacidade_necessaria"],
         "capacidade_alocada": etapa["capacidade_alocada"],
-        "status": "Sobrecarregado" if etapa["capacidade_necessaria"] > etapa["capacidade_alocada"]
-                 else "Ocioso" if etapa["capacidade_necessaria"] < etapa["capacidade_alocada"]
-                 else "Balanceado",
+        "total_ordens": etapa["total_ordens"],
+        "total_funcionarios": etapa["total_funcionarios"],
+        "status": capacidade.status(etapa["capacidade_necessaria"], etapa["capacidade_alocada"]),
         "ordens": [{
             "id": ordem["id"],
             "produto": ordem["produto"],
@@ -287,345 +548,621 @@ def detalhe_etapa(etapa_id):
 @app.route('/produtos/<int:produto_id>', methods=['PATCH'])
 def atualizar_produto(produto_id):
     data = request.get_json()
+    
+    if not catalogo.obter().existe(data.get('etapa_id')):
+        return jsonify({'error': 'Etapa não encontrada'}), 404
+    
+    def mover(conn):
+        conn.execute('''
+            UPDATE ordem_producao 
+            SET etapa_id = ? 
+            WHERE id = ?
+        ''', (data['etapa_id'], produto_id))
+        eventos.publicar(conn, 'ordem_movida', {'ordem_id': produto_id, 'etapa_id': data['etapa_id']})
+        versao.bump(conn)
+    
+    escrita.executar(mover)
+    return jsonify({'message': 'Produto atualizado com sucesso'})
+
+@app.route('/produtos/<int:produto_id>/restaurar', methods=['POST'])
+def restaurar_produto(produto_id):
+    # Devolve uma ordem arquivada (e as tarefas dela) às tabelas quentes
+    restaurada = escrita.executar(lambda conn: arquivo.restaurar(conn, produto_id))
+    return jsonify({'message': 'Ordem restaurada', **restaurada})
+
+@app.route('/produtos/mover', methods=['POST'])
+def mover_produtos():
+    # Move várias ordens de uma vez: {"etapa_id": 7, "ids": [...]} ou
+    # {"etapa": "Romaneio", "filtro": {"etapa_id": 6, "data_entrega_ate": "2026-05-01"}},
+    # com os mesmos filtros de GET /produtos
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    filtro = data.get('filtro')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({'error': "'ids' deve ser uma lista de números"}), 400
+    if not ids and not filtro:
+        return jsonify({'error': "Informe 'ids' ou um 'filtro' com as ordens a mover"}), 400
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        UPDATE ordem_producao 
-        SET etapa_id = ? 
-        WHERE id = ?
-    ''', (data['etapa_id'], produto_id))
+    etapas = catalogo.obter(conn)
+    if 'etapa_id' in data:
+        etapa = etapas.etapa(data['etapa_id'])
+    else:
+        etapa = etapas.etapa(etapas.id_por_nome(data.get('etapa')))
+    if not etapa:
+        return jsonify({'error': 'Etapa não encontrada'}), 404
+    
+    condicoes, params = [], []
+    if filtro:
+        if not isinstance(filtro, dict):
+            return jsonify({'error': "'filtro' deve ser um objeto"}), 400
+        # Chave desconhecida seria ignorada e o filtro pegaria o quadro inteiro
+        desconhecidos = sorted(set(filtro) - set(FILTROS_PRODUTOS))
+        if desconhecidos:
+            return jsonify({'error': f"Filtro desconhecido: {', '.join(desconhecidos)}"}), 400
+        valores = {
+            nome: ','.join(str(v) for v in valor) if isinstance(valor, list) else str(valor)
+            for nome, valor in filtro.items() if valor is not None
+        }
+        condicoes, params = paginacao.montar_filtros(valores, FILTROS_PRODUTOS)
+        if not condicoes:
+            return jsonify({'error': "'filtro' não tem nenhuma condição"}), 400
+    if ids:
+        condicoes.append('op.id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(ids))
+    condicoes.append('op.etapa_id IS NOT ?')
+    params.append(etapa['id'])
+    
+    # Trava de escrita antes de escolher as ordens, para a lista devolvida
+    # ser exatamente a que o UPDATE alterou
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    movidos = [row[0] for row in cursor.execute(f'''
+        SELECT op.id
+        FROM ordem_producao op
+        LEFT JOIN etapa e ON op.etapa_id = e.id
+        WHERE {' AND '.join(f'({c})' for c in condicoes)}
+        ORDER BY op.id
+    ''', params)]
     
+    if movidos:
+        cursor.execute('''
+            UPDATE ordem_producao
+            SET etapa_id = ?
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (etapa['id'], json.dumps(movidos)))
+        eventos.publicar(conn, 'ordens_movidas', {'ids': movidos, 'etapa_id': etapa['id']})
+        versao.bump(conn)
     conn.commit()
-    conn.close()
-    return jsonify({'message': 'Produto atualizado com sucesso'})
+    
+    return jsonify({
+        'message': f'{len(movidos)} ordens movidas para {etapa["nome"]}',
+        'etapa_id': etapa['id'],
+        'ids': movidos
+    })
 
-@app.route('/importar/funcionarios', methods=['POST'])
-def importar_funcionarios():
+def _abrir_upload():
+    # Multipart com o campo "file" ou, no modo streaming, o corpo cru da
+    # requisição com ?formato=csv|xlsx (sem passar por arquivo temporário)
     if 'file' not in request.files:
-        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        formato = request.args.get('formato', '').lower()
+        if formato in ALLOWED_EXTENSIONS and request.content_length:
+            return request.stream, formato, None
+        return None, None, (jsonify({'error': 'Nenhum arquivo enviado'}), 400)
     
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+        return None, None, (jsonify({'error': 'Nenhum arquivo selecionado'}), 400)
     
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    if not allowed_file(file.filename):
+        return None, None, (jsonify({'error': 'Tipo de arquivo não permitido'}), 400)
+    
+    return file.stream, file.filename.rsplit('.', 1)[1].lower(), None
+
+def _importar_planilha(colunas, importar_lote, entidade):
+    stream, extensao, erro = _abrir_upload()
+    if erro:
+        return erro
+    
+    tamanho_lote = max(request.args.get('tamanho_lote', app.config['IMPORT_BATCH_SIZE'], type=int), 1)
+    
+    # Modo job: enfileira e responde na hora com o id para acompanhar
+    if request.args.get('modo') == 'job':
+        job = jobs.get_manager().submit(stream, extensao, entidade, colunas, importar_lote, tamanho_lote)
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('status_importacao', job_id=job.id)
+        }), 202
+    
+    streaming = request.args.get('modo') == 'streaming' or 'file' not in request.files
+    try:
+        conn = get_db_connection()
         
-        try:
-            # Ler o arquivo Excel
-            df = pd.read_excel(filepath)
-            
-            # Verificar se as colunas necessárias existem
-            required_columns = ['nome', 'etapa', 'producao_media']
-            if not all(col in df.columns for col in required_columns):
-                return jsonify({'error': 'O arquivo deve conter as colunas: nome, etapa, producao_media'}), 400
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Contador de registros inseridos
-            inserted_count = 0
-            errors = []
-            
-            for _, row in df.iterrows():
-                try:
-                    # Obter o ID da etapa
-                    cursor.execute('SELECT id FROM etapa WHERE nome = ?', (row['etapa'],))
-                    etapa_result = cursor.fetchone()
-                    
-                    if etapa_result is None:
-                        errors.append(f"Etapa '{row['etapa']}' não encontrada para funcionário '{row['nome']}'")
-                        continue
-                    
-                    etapa_id = etapa_result['id']
-                    
-                    # Inserir funcionário
-                    cursor.execute('''
-                        INSERT INTO funcionarios (nome, etapa_id, producao_media) 
-                        VALUES (?, ?, ?)
-                    ''', (row['nome'], etapa_id, row['producao_media']))
-                    
-                    inserted_count += 1
-                except Exception as e:
-                    errors.append(f"Erro ao inserir funcionário '{row['nome']}': {str(e)}")
-            
+        if streaming:
+            lotes = importacao.ler_em_lotes(stream, extensao, tamanho_lote)
+            with metricas.importacao(entidade, 'streaming') as medicao:
+                resultado = importacao.importar_em_lotes(
+                    conn, lotes, colunas, importar_lote, trava=jobs.get_manager().trava_escrita,
+                    max_erros=app.config['IMPORT_MAX_ERRORS']
+                )
+                medicao.linhas(resultado['linhas_processadas'], resultado['inseridas'])
+            eventos.publicar(conn, 'importacao_concluida', {
+                'entidade': entidade,
+                'inseridas': resultado['inseridas'],
+                'rejeitadas': resultado['linhas_rejeitadas']
+            })
             conn.commit()
-            conn.close()
-            
             return jsonify({
-                'message': f'{inserted_count} funcionários importados com sucesso',
-                'errors': errors
+                'message': f"{resultado['inseridas']} {entidade} importados com sucesso",
+                'errors': resultado['erros'],
+                'erros_omitidos': resultado['erros_omitidos'],
+                'linhas_processadas': resultado['linhas_processadas'],
+                'linhas_rejeitadas': resultado['linhas_rejeitadas'],
+                'tempo_segundos': resultado['tempo_segundos']
             }), 201
+        
+        with metricas.importacao(entidade, 'arquivo') as medicao:
+            df = importacao.ler_planilha(stream, extensao)
+            importacao.verificar_colunas(df, colunas)
             
-        except Exception as e:
-            return jsonify({'error': f'Erro ao processar o arquivo: {str(e)}'}), 500
-        finally:
-            # Remover o arquivo após processamento
-            if os.path.exists(filepath):
-                os.remove(filepath)
-    
-    return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
+            inserted_count, errors = importar_lote(conn, df)
+            medicao.linhas(len(df), inserted_count)
+        eventos.publicar(conn, 'importacao_concluida', {
+            'entidade': entidade,
+            'inseridas': inserted_count,
+            'rejeitadas': len(df) - inserted_count
+        })
+        conn.commit()
+        
+        errors, omitidos = importacao.limitar_erros(errors, app.config['IMPORT_MAX_ERRORS'])
+        return jsonify({
+            'message': f'{inserted_count} {entidade} importados com sucesso',
+            'errors': errors,
+            'erros_omitidos': omitidos
+        }), 201
+    
+    except importacao.ColunasFaltando as e:
+        return jsonify({'error': f'O arquivo deve conter as colunas: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro ao processar o arquivo: {str(e)}'}), 500
+
+@app.route('/importar/funcionarios', methods=['POST'])
+def importar_funcionarios():
+    return _importar_planilha(importacao.COLUNAS_FUNCIONARIOS, importacao.importar_funcionarios, 'funcionários')
 
 @app.route('/importar/produtos', methods=['POST'])
 def importar_produtos():
-    if 'file' not in request.files:
-        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+    return _importar_planilha(importacao.COLUNAS_PRODUTOS, importacao.importar_produtos, 'produtos')
+
+@app.route('/importar/jobs/<job_id>', methods=['GET'])
+def status_importacao(job_id):
+    job = jobs.get_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job de importação não encontrado'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/eventos', methods=['GET'])
+def stream_eventos():
+    # Server-Sent Events; o navegador reenvia Last-Event-ID ao reconectar
+    desde = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    if desde is not None:
+        try:
+            desde = int(desde)
+        except ValueError:
+            return jsonify({'error': 'Last-Event-ID inválido'}), 400
+    
+    return Response(
+        eventos.get_broker().assinar(desde),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/sync', methods=['GET'])
+def sincronizar():
+    # Só o que mudou depois de ?since=<versao> (a "versao" devolvida na
+    # chamada anterior), mais os ids removidos. Sem since, ou com uma versão
+    # que o banco não conhece, devolve tudo com "completo": true.
+    try:
+        desde = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': "Valor inválido para 'since'"}), 400
+    
+    conn = get_db_connection(readonly=True)
+    cursor = serializacao.cursor_tuplas(conn)
+    
+    # As listas e a versão vêm do mesmo snapshot
+    with db.snapshot(conn):
+        versao_atual = versao.atual(conn)
+        completo = desde <= 0 or desde > versao_atual
+        if completo:
+            desde = -1
+        
+        # No delta, sem estatísticas o SQLite acha que "versao > ?" pega boa
+        # parte da tabela e prefere varrer pela ordem do id; likelihood() diz
+        # que o delta é pequeno e ele usa o índice de versao. Completo: varre.
+        params = () if completo else (desde,)
+        
+        def alterados(coluna):
+            return '' if completo else f'WHERE likelihood({coluna} > ?, {SYNC_SELETIVIDADE})'
+        
+        produtos = cursor.execute(f'''
+            SELECT {PRODUTO.select}
+            FROM ordem_producao op
+            LEFT JOIN etapa e ON op.etapa_id = e.id
+            {alterados('op.versao')}
+            ORDER BY op.id
+        ''', params).fetchall()
+        tarefas = cursor.execute(f'''
+            SELECT {TAREFA_LISTA.select}
+            FROM tarefas t
+            JOIN etapa e ON t.etapa_id = e.id
+            JOIN ordem_producao op ON t.ordem_id = op.id
+            {alterados('t.versao')}
+            ORDER BY t.id
+        ''', params).fetchall()
+        funcionarios = cursor.execute(f'''
+            SELECT {FUNCIONARIO.select}
+            FROM funcionarios f
+            LEFT JOIN etapa e ON f.etapa_id = e.id
+            {alterados('f.versao')}
+            ORDER BY f.id
+        ''', params).fetchall()
+        etapas = conn.execute(
+            capacidade.ETAPAS_QUERY + (' ORDER BY e.id' if completo else ' WHERE c.versao > ? ORDER BY e.id'), params
+        ).fetchall()
+        
+        removidos = {'produtos': [], 'tarefas': [], 'funcionarios': []}
+        if not completo:
+            chaves = {'ordem_producao': 'produtos', 'tarefas': 'tarefas', 'funcionarios': 'funcionarios'}
+            for tabela, registro_id in cursor.execute(
+                'SELECT tabela, registro_id FROM remocoes WHERE versao > ? ORDER BY registro_id',
+                (desde,)
+            ):
+                removidos[chaves[tabela]].append(registro_id)
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+    return jsonify({
+        'versao': versao_atual,
+        'completo': completo,
+        'produtos': PRODUTO.objetos(produtos),
+        'tarefas': TAREFA_LISTA.objetos(tarefas),
+        'funcionarios': FUNCIONARIO.objetos(funcionarios),
+        'etapas': [_etapa_dict(row) for row in etapas],
+        'removidos': removidos
+    })
+
+@app.route('/board', methods=['GET'])
+@versao.condicional
+def quadro():
+    # Quadro inteiro numa resposta, lido de um único snapshot: etapas com as
+    # ordens e os funcionários de cada uma, e cada ordem com suas tarefas.
+    # Aceita os filtros de GET /produtos (aplicados às ordens e, no caso de
+    # etapa_id, também às etapas e aos funcionários) e os de GET /tarefas
+    # com o prefixo "tarefa_" (ex.: ?tarefa_status=pendente).
+    condicoes_ordens, params_ordens = paginacao.montar_filtros(request.args, FILTROS_PRODUTOS)
+    condicoes_tarefas, params_tarefas = paginacao.montar_filtros(
+        {nome[len('tarefa_'):]: valor for nome, valor in request.args.items() if nome.startswith('tarefa_')},
+        FILTROS_TAREFAS
+    )
+    condicoes_etapas, params_etapas = paginacao.montar_filtros(
+        request.args, {'etapa_id': paginacao.em_lista('e.id')}
+    )
+    condicoes_funcionarios, params_funcionarios = paginacao.montar_filtros(request.args, FILTROS_FUNCIONARIOS)
     
-    if file and allowed_file(file.filename):
+    def where(condicoes):
+        return ' WHERE ' + ' AND '.join(f'({c})' for c in condicoes) if condicoes else ''
+    
+    conn = get_db_connection(readonly=True)
+    cursor = serializacao.cursor_tuplas(conn)
+    etapas = []
+    por_etapa = {}
+    sem_etapa = {'ordens': [], 'funcionarios': []}
+    ordens = {}
+    
+    with db.snapshot(conn):
+        versao_atual = versao.atual(conn)
+        
+        for row in conn.execute(capacidade.ETAPAS_QUERY + where(condicoes_etapas) + ' ORDER BY e.id', params_etapas):
+            etapa = _etapa_dict(row)
+            etapa['ordens'] = []
+            etapa['funcionarios'] = []
+            etapas.append(etapa)
+            por_etapa[etapa['id']] = etapa
+        
+        for row in cursor.execute(f'''
+            SELECT {PRODUTO.select}
+            FROM ordem_producao op
+            LEFT JOIN etapa e ON op.etapa_id = e.id
+        ''' + where(condicoes_ordens) + ' ORDER BY op.id', params_ordens):
+            ordem = PRODUTO.objeto(row)
+            ordem['tarefas'] = []
+            ordens[ordem['id']] = ordem
+            por_etapa.get(ordem['etapa_id'], sem_etapa)['ordens'].append(ordem)
+        
+        # Só tarefas das ordens selecionadas, mais os filtros das tarefas
+        ordens_selecionadas = f'''
+            t.ordem_id IN (
+                SELECT op.id
+                FROM ordem_producao op
+                LEFT JOIN etapa e ON op.etapa_id = e.id
+                {where(condicoes_ordens)}
+            )
+        '''
+        for row in cursor.execute(f'''
+            SELECT {TAREFA_LISTA.select}
+            FROM tarefas t
+            JOIN etapa e ON t.etapa_id = e.id
+            JOIN ordem_producao op ON t.ordem_id = op.id
+        ''' + where([ordens_selecionadas] + condicoes_tarefas) + ' ORDER BY t.id', params_ordens + params_tarefas):
+            tarefa = TAREFA_LISTA.objeto(row)
+            ordens[tarefa['ordem_id']]['tarefas'].append(tarefa)
+        
+        for row in cursor.execute(f'''
+            SELECT {FUNCIONARIO.select}
+            FROM funcionarios f
+            LEFT JOIN etapa e ON f.etapa_id = e.id
+        ''' + where(condicoes_funcionarios) + ' ORDER BY f.id', params_funcionarios):
+            funcionario = FUNCIONARIO.objeto(row)
+            por_etapa.get(funcionario['etapa_id'], sem_etapa)['funcionarios'].append(funcionario)
+    
+    return jsonify({
+        'versao': versao_atual,
+        'etapas': etapas,
+        'sem_etapa': sem_etapa
+    })
+
+@app.route('/previsao', methods=['GET'])
+# A previsão conta a partir de hoje: o mesmo dado muda de um dia para outro
+@versao.condicional(sufixo=lambda: previsao.hoje().isoformat())
+def prever_entregas():
+    # Data prevista e folga (dias entre a previsão e data_entrega) de cada
+    # ordem em aberto, na ordem de atendimento da simulação (ver previsao.py).
+    # ?atrasadas=1 traz só as que não chegam a tempo; ?etapa_id=3,4 filtra
+    # pela etapa atual da ordem.
+    etapa_ids = request.args.get('etapa_id')
+    if etapa_ids:
         try:
-            # Ler o arquivo Excel diretamente do objeto file
-            df = pd.read_excel(file)
-            
-            # Verificar se as colunas necessárias existem
-            required_columns = ['OS', 'produto', 'estampa', 'quantidade', 'data_entrega', 'etapa']
-            if not all(col in df.columns for col in required_columns):
-                return jsonify({'error': 'O arquivo deve conter as colunas: OS, produto, estampa, quantidade, data_entrega, etapa'}), 400
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Contador de registros inseridos
-            inserted_count = 0
-            errors = []
-            
-            for _, row in df.iterrows():
-                try:
-                    # Verificar se a OS já existe
-                    cursor.execute('SELECT id FROM ordem_producao WHERE OS = ?', (row['OS'],))
-                    os_exists = cursor.fetchone()
-                    
-                    if os_exists:
-                        errors.append(f"OS '{row['OS']}' já existe no sistema. Não é possível duplicar.")
-                        continue
-                    
-                    # Obter o ID da etapa
-                    cursor.execute('SELECT id FROM etapa WHERE nome = ?', (row['etapa'],))
-                    etapa_result = cursor.fetchone()
-                    
-                    if etapa_result is None:
-                        errors.append(f"Etapa '{row['etapa']}' não encontrada para produto '{row['produto']}'")
-                        continue
-                    
-                    etapa_id = etapa_result['id']
-                    
-                    # Verificar se a coluna cliente_final existe no DataFrame
-                    cliente_final = row.get('cliente_final', '') if 'cliente_final' in row else ''
-                    
-                    # Inserir produto
-                    cursor.execute('''
-                        INSERT INTO ordem_producao (OS, produto, estampa, quantidade, data_entrega, cliente_final, etapa_id) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (row['OS'], row['produto'], row['estampa'], row['quantidade'], 
-                          row['data_entrega'], cliente_final, etapa_id))
-                    
-                    inserted_count += 1
-                except Exception as e:
-                    errors.append(f"Erro ao inserir produto '{row['produto']}': {str(e)}")
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({
-                'message': f'{inserted_count} produtos importados com sucesso',
-                'errors': errors
-            }), 201
-            
-        except Exception as e:
-            return jsonify({'error': f'Erro ao processar o arquivo: {str(e)}'}), 500
+            etapa_ids = [int(v) for v in etapa_ids.split(',')]
+        except ValueError:
+            raise paginacao.ParametroInvalido(f"Valor inválido para 'etapa_id': {etapa_ids}")
+    apenas_atrasadas = request.args.get('atrasadas', '').lower() in ('1', 'true')
     
-    return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
+    resultado = previsao.obter(get_db_connection(readonly=True), app)
+    return jsonify({
+        'versao': resultado.versao,
+        'data_base': resultado.data_base.isoformat(),
+        'resumo': resultado.resumo(),
+        'etapas': resultado.etapas,
+        'ordens': resultado.ordens_json(resultado.filtro(apenas_atrasadas, etapa_ids))
+    })
+
+def _janela_indicadores():
+    # Sem ?de/?ate a janela anda com o relógio, e os resumos mudam quando a
+    # thread de manutenção consolida o log sem escrita nova: os dois entram
+    # no ETag
+    _, de, ate, _ = transicoes.opcoes(request.args)
+    consolidado = transicoes.consolidado(get_db_connection(readonly=True))
+    return f"{de.isoformat(timespec='seconds')}_{ate.isoformat(timespec='seconds')}_{consolidado}"
+
+@app.route('/indicadores/etapas', methods=['GET'])
+@versao.condicional(sufixo=_janela_indicadores)
+def indicadores_etapas():
+    # Entrada/saída de peças, WIP e permanência (mediana/p90) por etapa, em
+    # série por ?granularidade=dia|hora entre ?de e ?ate (UTC), lidos só dos
+    # resumos que a thread de manutenção consolida (arquivo.py)
+    granularidade, de, ate, etapa_ids = transicoes.opcoes(request.args)
+    etapas = transicoes.indicadores(get_db_connection(readonly=True), granularidade, de, ate, etapa_ids)
+    return jsonify({
+        'granularidade': granularidade,
+        'de': de.isoformat(sep=' ', timespec='seconds'),
+        'ate': ate.isoformat(sep=' ', timespec='seconds'),
+        'etapas': etapas
+    })
+
+@app.route('/produtos/<int:produto_id>/historico', methods=['GET'])
+@versao.condicional
+def historico_produto(produto_id):
+    # Trocas de etapa/status da ordem e das tarefas dela, do log de transições
+    return jsonify(transicoes.historico(get_db_connection(readonly=True), produto_id))
+
+@app.route('/plantas', methods=['GET'])
+@plantas.sem_planta
+def listar_plantas():
+    if not plantas.ativo():
+        return jsonify({'error': 'Modo multiplanta desligado (KANBAN_PLANTAS_DIR)'}), 404
+    registro = plantas.get_registro()
+    abertas = set(registro.abertas())
+    return jsonify([{'nome': nome, 'aberta': nome in abertas} for nome in registro.nomes()])
+
+@app.route('/agregado/etapas', methods=['GET'])
+@plantas.sem_planta
+def agregado_etapas():
+    # A consulta de /etapas em todas as plantas (ou ?plantas=a,b) em
+    # paralelo; as etapas são somadas pelo nome, já que os ids podem
+    # divergir entre os bancos
+    if not plantas.ativo():
+        return jsonify({'error': 'Modo multiplanta desligado (KANBAN_PLANTAS_DIR)'}), 404
+    registro = plantas.get_registro()
+    nomes = registro.nomes()
+    if request.args.get('plantas'):
+        nomes = [nome.strip() for nome in request.args['plantas'].split(',') if nome.strip()]
+        desconhecidas = [nome for nome in nomes if not registro.conhecida(nome)]
+        if desconhecidas:
+            return jsonify({'error': f"Plantas não encontradas: {', '.join(desconhecidas)}"}), 404
+
+    def consultar():
+        cursor = get_db_connection(readonly=True).cursor()
+        return [_etapa_dict(row) for row in cursor.execute(capacidade.ETAPAS_QUERY + ' ORDER BY e.id')]
+
+    totais = {}
+    por_planta = []
+    falhas = []
+    for nome, etapas, erro in registro.em_paralelo(consultar, nomes):
+        if erro is not None:
+            app.logger.error('Falha ao consultar a planta %s: %s', nome, erro)
+            falhas.append({'planta': nome, 'error': str(erro)})
+            continue
+        por_planta.append({'planta': nome, 'etapas': etapas})
+        for etapa in etapas:
+            total = totais.setdefault(etapa['nome'], {
+                'nome': etapa['nome'],
+                'setor': etapa['setor'],
+                'capacidade_necessaria': 0,
+                'capacidade_alocada': 0,
+                'total_ordens': 0,
+                'total_funcionarios': 0,
+            })
+            for chave in ('capacidade_necessaria', 'capacidade_alocada', 'total_ordens', 'total_funcionarios'):
+                total[chave] += etapa[chave]
+    for total in totais.values():
+        total['status'] = capacidade.status(total['capacidade_necessaria'], total['capacidade_alocada'])
+
+    return jsonify({'etapas': list(totais.values()), 'plantas': por_planta, 'falhas': falhas})
 
 @app.route('/template/funcionarios', methods=['GET'])
 def template_funcionarios():
-    # Criar um DataFrame de exemplo
-    df = pd.DataFrame({
-        'nome': ['Nome do Funcionário'],
-        'etapa': ['Nome da Etapa'],
-        'producao_media': [100]
-    })
-    
-    # Garantir que a pasta existe
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-    
-    # Salvar como Excel
-    template_path = os.path.join(UPLOAD_FOLDER, 'template_funcionarios.xlsx')
-    df.to_excel(template_path, index=False)
-    
-    return send_file(template_path, as_attachment=True, download_name='template_funcionarios.xlsx')
+    return send_file(
+        BytesIO(exportacao.template('funcionarios')),
+        as_attachment=True,
+        download_name='template_funcionarios.xlsx',
+        mimetype=exportacao.FORMATOS['xlsx']
+    )
 
 @app.route('/template/produtos', methods=['GET'])
 def template_produtos():
-    # Criar um DataFrame de exemplo
-    df = pd.DataFrame({
-        'OS': [1001],
-        'produto': ['Nome do Produto'],
-        'estampa': ['Descrição da Estampa'],
-        'quantidade': [100],
-        'data_entrega': ['2023-12-31'],
-        'cliente_final': ['Nome do Cliente'],
-        'etapa': ['Nome da Etapa']
-    })
-    
-    # Criar um buffer de memória
-    from io import BytesIO
-    buffer = BytesIO()
-    
-    # Salvar o DataFrame no buffer
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
-    
-    # Mover o cursor para o início do buffer
-    buffer.seek(0)
-    
-    # Enviar o arquivo diretamente da memória
     return send_file(
-        buffer,
+        BytesIO(exportacao.template('produtos')),
         as_attachment=True,
         download_name='template_produtos.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        mimetype=exportacao.FORMATOS['xlsx']
+    )
+
+@app.route('/exportar/<entidade>', methods=['GET'])
+@versao.condicional
+def exportar(entidade):
+    # ?formato=csv (padrão) ou xlsx, com os filtros da lista da entidade
+    if entidade not in EXPORTACOES:
+        return jsonify({'error': f'Entidade desconhecida: {entidade}'}), 404
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        raise paginacao.ParametroInvalido(f"Valor inválido para 'formato': {formato}")
+    colunas, origem, coluna_id, filtros = EXPORTACOES[entidade]
+    condicoes, params = paginacao.montar_filtros(request.args, filtros)
+    sql = f'SELECT {colunas.select} {origem}'
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(f'({c})' for c in condicoes)
+    sql += f' ORDER BY {coluna_id}'
+    
+    conn = get_db_connection(readonly=True)
+    return Response(
+        stream_with_context(exportacao.gerar(formato, conn, colunas, sql, params, entidade)),
+        mimetype=exportacao.FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename={entidade}.{formato}'}
     )
 
 
 @app.route('/tarefas', methods=['GET'])
+@versao.condicional
 def listar_tarefas():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    historico = _incluir_arquivadas()
+    colunas = TAREFA_LISTA_HISTORICO if historico else TAREFA_LISTA
+    conn = get_db_connection(readonly=True)
     
-    tarefas = cursor.execute('''
-        SELECT t.*, e.nome as etapa_nome, op.OS, op.produto
-        FROM tarefas t
+    tarefas, proximo, paginado = paginacao.consultar(serializacao.cursor_tuplas(conn), f'''
+        SELECT {colunas.select}
+        FROM {arquivo.TAREFAS_COM_HISTORICO if historico else 'tarefas'} t
         JOIN etapa e ON t.etapa_id = e.id
-        JOIN ordem_producao op ON t.ordem_id = op.id
-    ''').fetchall()
-    
-    conn.close()
+        JOIN {arquivo.ORDENS_COM_HISTORICO if historico else 'ordem_producao'} op ON t.ordem_id = op.id
+    ''', 't.id', request.args, FILTROS_TAREFAS, app.config['PAGE_MAX_LIMIT'])
     
-    return jsonify([{
-        "id": row["id"],
-        "ordem_id": row["ordem_id"],
-        "OS": row["OS"],
-        "produto": row["produto"],
-        "etapa_id": row["etapa_id"],
-        "etapa_nome": row["etapa_nome"],
-        "descricao": row["descricao"],
-        "quantidade": row["quantidade"],
-        "status": row["status"],
-        "data_criacao": row["data_criacao"],
-        "data_atualizacao": row["data_atualizacao"]
-    } for row in tarefas])
+    return _resposta_lista(colunas, tarefas, proximo, paginado)
 
 @app.route('/produtos/<int:produto_id>/tarefas', methods=['GET'])
+@versao.condicional
 def listar_tarefas_ordem(produto_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = get_db_connection(readonly=True)
+    cursor = serializacao.cursor_tuplas(conn)
     
-    tarefas = cursor.execute('''
-        SELECT t.*, e.nome as etapa_nome
+    tarefas = cursor.execute(f'''
+        SELECT {TAREFA.select}
         FROM tarefas t
         JOIN etapa e ON t.etapa_id = e.id
         WHERE t.ordem_id = ?
     ''', (produto_id,)).fetchall()
     
-    conn.close()
-    
-    return jsonify([{
-        "id": row["id"],
-        "ordem_id": row["ordem_id"],
-        "etapa_id": row["etapa_id"],
-        "etapa_nome": row["etapa_nome"],
-        "descricao": row["descricao"],
-        "quantidade": row["quantidade"],
-        "status": row["status"],
-        "data_criacao": row["data_criacao"],
-        "data_atualizacao": row["data_atualizacao"]
-    } for row in tarefas])
+    return jsonify(serializacao.lista(TAREFA, tarefas))
 
 @app.route('/produtos/<int:produto_id>/tarefas', methods=['POST'])
 def criar_tarefas_ordem(produto_id):
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Verificar se a ordem existe
-    cursor.execute('SELECT * FROM ordem_producao WHERE id = ?', (produto_id,))
-    ordem = cursor.fetchone()
-    
-    if not ordem:
-        conn.close()
-        return jsonify({'error': 'Ordem de produção não encontrada'}), 404
-    
-    tarefas_criadas = []
     
+    # Verificar se as etapas existem antes de gravar qualquer tarefa
+    etapas = catalogo.obter()
     for tarefa_data in data:
-        # Verificar se a etapa existe
-        cursor.execute('SELECT * FROM etapa WHERE id = ?', (tarefa_data.get('etapa_id'),))
-        etapa = cursor.fetchone()
-        
-        if not etapa:
-            conn.close()
+        if not etapas.existe(tarefa_data.get('etapa_id')):
             return jsonify({'error': f'Etapa {tarefa_data.get("etapa_id")} não encontrada'}), 404
+    
+    def criar(conn):
+        cursor = conn.cursor()
         
-        # Inserir a tarefa
-        cursor.execute('''
-            INSERT INTO tarefas (ordem_id, etapa_id, descricao, quantidade, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            produto_id,
-            tarefa_data.get('etapa_id'),
-            tarefa_data.get('descricao'),
-            tarefa_data.get('quantidade', ordem['quantidade']),
-            'pendente'
-        ))
+        # Verificar se a ordem existe
+        cursor.execute('SELECT * FROM ordem_producao WHERE id = ?', (produto_id,))
+        ordem = cursor.fetchone()
         
-        tarefa_id = cursor.lastrowid
+        if not ordem:
+            raise escrita.OperacaoRecusada('Ordem de produção não encontrada', 404)
         
-        # Buscar a tarefa recém-criada
-        cursor.execute('''
-            SELECT t.*, e.nome as etapa_nome
-            FROM tarefas t
-            JOIN etapa e ON t.etapa_id = e.id
-            WHERE t.id = ?
-        ''', (tarefa_id,))
+        tarefas_criadas = []
         
-        tarefa = cursor.fetchone()
-        tarefas_criadas.append({
-            "id": tarefa["id"],
-            "ordem_id": tarefa["ordem_id"],
-            "etapa_id": tarefa["etapa_id"],
-            "etapa_nome": tarefa["etapa_nome"],
-            "descricao": tarefa["descricao"],
-            "quantidade": tarefa["quantidade"],
-            "status": tarefa["status"],
-            "data_criacao": tarefa["data_criacao"],
-            "data_atualizacao": tarefa["data_atualizacao"]
+        for tarefa_data in data:
+            # Inserir a tarefa
+            cursor.execute('''
+                INSERT INTO tarefas (ordem_id, etapa_id, descricao, quantidade, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                produto_id,
+                tarefa_data.get('etapa_id'),
+                tarefa_data.get('descricao'),
+                tarefa_data.get('quantidade', ordem['quantidade']),
+                'pendente'
+            ))
+            
+            tarefa_id = cursor.lastrowid
+            
+            # Buscar a tarefa recém-criada
+            cursor.execute('''
+                SELECT t.*, e.nome as etapa_nome
+                FROM tarefas t
+                JOIN etapa e ON t.etapa_id = e.id
+                WHERE t.id = ?
+            ''', (tarefa_id,))
+            
+            tarefa = cursor.fetchone()
+            tarefas_criadas.append({
+                "id": tarefa["id"],
+                "ordem_id": tarefa["ordem_id"],
+                "etapa_id": tarefa["etapa_id"],
+                "etapa_nome": tarefa["etapa_nome"],
+                "descricao": tarefa["descricao"],
+                "quantidade": tarefa["quantidade"],
+                "status": tarefa["status"],
+                "data_criacao": tarefa["data_criacao"],
+                "data_atualizacao": tarefa["data_atualizacao"]
+            })
+        
+        eventos.publicar(conn, 'tarefas_criadas', {
+            'ordem_id': produto_id,
+            'ids': [t['id'] for t in tarefas_criadas]
         })
+        versao.bump(conn)
+        return tarefas_criadas
     
-    conn.commit()
-    conn.close()
-    
-    return jsonify(tarefas_criadas), 201
+    return jsonify(escrita.executar(criar)), 201
 
 @app.route('/tarefas/<int:tarefa_id>', methods=['PUT'])
 def atualizar_tarefa(tarefa_id):
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Verificar se a tarefa existe
-    cursor.execute('SELECT * FROM tarefas WHERE id = ?', (tarefa_id,))
-    tarefa = cursor.fetchone()
-    
-    if not tarefa:
-        conn.close()
-        return jsonify({'error': 'Tarefa não encontrada'}), 404
     
     # Campos que podem ser atualizados
     campos_atualizaveis = ['status', 'etapa_id', 'quantidade', 'descricao']
@@ -637,86 +1174,220 @@ def atualizar_tarefa(tarefa_id):
             campos_atualizados.append(f"{campo} = ?")
             valores_atualizados.append(data[campo])
     
-    if not campos_atualizados:
-        conn.close()
-        return jsonify({'error': 'Nenhum campo para atualizar'}), 400
-    
-    # Adicionar data de atualização
-    campos_atualizados.append("data_atualizacao = CURRENT_TIMESTAMP")
-    
-    # Construir a query de atualização
-    query = f'''
-        UPDATE tarefas
-        SET {', '.join(campos_atualizados)}
-        WHERE id = ?
-    '''
+    def atualizar(conn):
+        cursor = conn.cursor()
+        
+        # Verificar se a tarefa existe
+        cursor.execute('SELECT * FROM tarefas WHERE id = ?', (tarefa_id,))
+        tarefa = cursor.fetchone()
+        
+        if not tarefa:
+            raise escrita.OperacaoRecusada('Tarefa não encontrada', 404)
+        
+        if not campos_atualizados:
+            raise escrita.OperacaoRecusada('Nenhum campo para atualizar', 400)
+        
+        # Construir a query de atualização, com a data de atualização
+        query = f'''
+            UPDATE tarefas
+            SET {', '.join(campos_atualizados + ["data_atualizacao = CURRENT_TIMESTAMP"])}
+            WHERE id = ?
+        '''
+        
+        cursor.execute(query, valores_atualizados + [tarefa_id])
+        
+        # Buscar a tarefa atualizada
+        cursor.execute('''
+            SELECT t.*, e.nome as etapa_nome
+            FROM tarefas t
+            JOIN etapa e ON t.etapa_id = e.id
+            WHERE t.id = ?
+        ''', (tarefa_id,))
+        
+        tarefa_atualizada = cursor.fetchone()
+        
+        # Se era a última tarefa em aberto, a ordem avança na mesma transação
+        ordem_avancada = None
+        if 'status' in data:
+            movidas = fluxo.avancar_ordens_concluidas(conn, [tarefa['ordem_id']])
+            if movidas:
+                ordem_avancada = {'ordem_id': movidas[0][0], 'etapa_id': movidas[0][1]}
+        
+        eventos.publicar(conn, 'tarefa_atualizada', {
+            'id': tarefa_id,
+            'ordem_id': tarefa_atualizada['ordem_id'],
+            'etapa_id': tarefa_atualizada['etapa_id'],
+            'status': tarefa_atualizada['status']
+        })
+        if ordem_avancada:
+            eventos.publicar(conn, 'ordem_movida', ordem_avancada)
+        versao.bump(conn)
+        
+        return {
+            "id": tarefa_atualizada["id"],
+            "ordem_id": tarefa_atualizada["ordem_id"],
+            "etapa_id": tarefa_atualizada["etapa_id"],
+            "etapa_nome": tarefa_atualizada["etapa_nome"],
+            "descricao": tarefa_atualizada["descricao"],
+            "quantidade": tarefa_atualizada["quantidade"],
+            "status": tarefa_atualizada["status"],
+            "data_criacao": tarefa_atualizada["data_criacao"],
+            "data_atualizacao": tarefa_atualizada["data_atualizacao"],
+            "ordem_avancada": ordem_avancada
+        }
+    
+    return jsonify(escrita.executar(atualizar))
+
+CAMPOS_TAREFA = ['status', 'etapa_id', 'quantidade', 'descricao']
+STATUS_TAREFA = ('pendente', 'em_andamento', 'concluido')
+
+def _erro_campos_tarefa(item):
+    # Tipos que a tabela recusaria (NOT NULL) ou que o sqlite3 nem consegue
+    # passar como parâmetro (listas, objetos) viram erro do item, não do lote
+    if 'quantidade' in item and (not isinstance(item['quantidade'], int) or isinstance(item['quantidade'], bool)):
+        return 'Quantidade inválida'
+    if 'descricao' in item and not isinstance(item['descricao'], str):
+        return 'Descrição inválida'
+    if 'status' in item and item['status'] not in STATUS_TAREFA:
+        return f"Status inválido, use um de: {', '.join(STATUS_TAREFA)}"
+    return None
+
+def _validar_lote_tarefas(cursor, itens):
+    # Valida o lote inteiro com uma consulta por tabela; devolve as
+    # alterações válidas e a lista de erros por item
+    erros = []
+    candidatos = []
+    vistos = set()
+    for indice, item in enumerate(itens):
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+            erros.append({'indice': indice, 'id': None, 'error': 'Item sem id numérico'})
+            continue
+        campos = [campo for campo in CAMPOS_TAREFA if campo in item]
+        erro_campos = _erro_campos_tarefa(item)
+        if not campos:
+            erros.append({'indice': indice, 'id': item['id'], 'error': 'Nenhum campo para atualizar'})
+        elif item['id'] in vistos:
+            erros.append({'indice': indice, 'id': item['id'], 'error': 'Tarefa repetida no lote'})
+        elif erro_campos:
+            erros.append({'indice': indice, 'id': item['id'], 'error': erro_campos})
+        else:
+            vistos.add(item['id'])
+            candidatos.append((indice, item, tuple(campos)))
+    
+    ids = [item['id'] for _, item, _ in candidatos]
+    ordens = dict(cursor.execute(
+        'SELECT id, ordem_id FROM tarefas WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(ids),)
+    ).fetchall())
+    etapas = catalogo.obter(cursor.connection)
+    
+    validos = []
+    for indice, item, campos in candidatos:
+        if item['id'] not in ordens:
+            erros.append({'indice': indice, 'id': item['id'], 'error': 'Tarefa não encontrada'})
+        elif 'etapa_id' in item and not etapas.existe(item['etapa_id']):
+            erros.append({'indice': indice, 'id': item['id'], 'error': f"Etapa {item['etapa_id']} não encontrada"})
+        else:
+            validos.append((item, campos, ordens[item['id']]))
+    
+    erros.sort(key=lambda erro: erro['indice'])
+    return validos, erros
+
+@app.route('/tarefas', methods=['PATCH'])
+def atualizar_tarefas_em_lote():
+    data = request.get_json(silent=True)
+    # Aceita a lista de alterações direto ou {"tarefas": [...], "tudo_ou_nada": true}
+    tudo_ou_nada = False
+    if isinstance(data, dict):
+        tudo_ou_nada = bool(data.get('tudo_ou_nada', False))
+        data = data.get('tarefas')
+    if not isinstance(data, list) or not data:
+        return jsonify({'error': 'Envie uma lista de alterações de tarefas'}), 400
     
-    # Adicionar o ID da tarefa aos valores
-    valores_atualizados.append(tarefa_id)
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
-    cursor.execute(query, valores_atualizados)
+    validos, erros = _validar_lote_tarefas(cursor, data)
+    if erros and tudo_ou_nada:
+        return jsonify({'error': 'Lote rejeitado', 'errors': erros}), 400
     
-    # Buscar a tarefa atualizada
-    cursor.execute('''
-        SELECT t.*, e.nome as etapa_nome
+    # Um UPDATE com executemany para cada combinação de campos alterados
+    grupos = {}
+    for item, campos, _ in validos:
+        grupos.setdefault(campos, []).append(
+            tuple(item[campo] for campo in campos) + (item['id'],)
+        )
+    for campos, linhas in grupos.items():
+        atribuicoes = ', '.join(f"{campo} = ?" for campo in campos)
+        cursor.executemany(f'''
+            UPDATE tarefas
+            SET {atribuicoes}, data_atualizacao = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', linhas)
+    
+    ids = [item['id'] for item, _, _ in validos]
+    ordens_com_status = [ordem_id for item, campos, ordem_id in validos if 'status' in campos]
+    movidas = fluxo.avancar_ordens_concluidas(conn, ordens_com_status)
+    ordens_avancadas = [{'ordem_id': ordem_id, 'etapa_id': etapa_id} for ordem_id, etapa_id in movidas]
+    
+    tarefas = serializacao.cursor_tuplas(conn).execute(f'''
+        SELECT {TAREFA.select}
         FROM tarefas t
         JOIN etapa e ON t.etapa_id = e.id
-        WHERE t.id = ?
-    ''', (tarefa_id,))
-    
-    tarefa_atualizada = cursor.fetchone()
-    
+        WHERE t.id IN (SELECT value FROM json_each(?))
+        ORDER BY t.id
+    ''', (json.dumps(ids),)).fetchall()
+    
+    if ids:
+        eventos.publicar(conn, 'tarefas_atualizadas', {'ids': ids})
+        for ordem in ordens_avancadas:
+            eventos.publicar(conn, 'ordem_movida', ordem)
+        versao.bump(conn)
     conn.commit()
-    conn.close()
     
     return jsonify({
-        "id": tarefa_atualizada["id"],
-        "ordem_id": tarefa_atualizada["ordem_id"],
-        "etapa_id": tarefa_atualizada["etapa_id"],
-        "etapa_nome": tarefa_atualizada["etapa_nome"],
-        "descricao": tarefa_atualizada["descricao"],
-        "quantidade": tarefa_atualizada["quantidade"],
-        "status": tarefa_atualizada["status"],
-        "data_criacao": tarefa_atualizada["data_criacao"],
-        "data_atualizacao": tarefa_atualizada["data_atualizacao"]
+        'tarefas': TAREFA.objetos(tarefas),
+        'ordens_avancadas': ordens_avancadas,
+        'errors': erros
     })
 
 @app.route('/etapas/<int:etapa_id>/tarefas', methods=['GET'])
+@versao.condicional
 def listar_tarefas_etapa(etapa_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = get_db_connection(readonly=True)
+    cursor = serializacao.cursor_tuplas(conn)
     
-    tarefas = cursor.execute('''
-        SELECT t.*, e.nome as etapa_nome, op.OS, op.produto, op.estampa, op.data_entrega
+    tarefas = cursor.execute(f'''
+        SELECT {TAREFA_ETAPA.select}
         FROM tarefas t
         JOIN etapa e ON t.etapa_id = e.id
         JOIN ordem_producao op ON t.ordem_id = op.id
         WHERE t.etapa_id = ? AND t.status != 'concluido'
     ''', (etapa_id,)).fetchall()
     
-    conn.close()
-    
-    return jsonify([{
-        "id": row["id"],
-        "ordem_id": row["ordem_id"],
-        "OS": row["OS"],
-        "produto": row["produto"],
-        "estampa": row["estampa"],
-        "data_entrega": row["data_entrega"],
-        "etapa_id": row["etapa_id"],
-        "etapa_nome": row["etapa_nome"],
-        "descricao": row["descricao"],
-        "quantidade": row["quantidade"],
-        "status": row["status"],
-        "data_criacao": row["data_criacao"],
-        "data_atualizacao": row["data_atualizacao"]
-    } for row in tarefas])
+    return jsonify(serializacao.lista(TAREFA_ETAPA, tarefas))
+
+def preparar_banco(db_path):
+    # Cria (com o seed das etapas) e migra um arquivo de banco: o DATABASE
+    # ou o de uma planta, na primeira vez que o processo a abre
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+    with app.app_context():
+        db.usar(db_path)
+        if not os.path.exists(db_path):
+            init_db()
+        conn = get_db_connection()
+        migrations.migrate(conn)
+        capacidade.install(conn)
+
+app.extensions['kanban_preparar_banco'] = preparar_banco
 
 def initialize_app():
-    import os
-    db_path = 'KanbanProjeto/kanban.db'
-    if not os.path.exists(db_path):
-        init_db()
+    # No modo multiplanta cada planta é preparada quando é aberta
+    if not plantas.ativo(app):
+        preparar_banco(app.config['DATABASE'])
+    arquivo.get_arquivador(app).iniciar()
 
 
 if __name__ == '__main__':
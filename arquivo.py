@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import escrita
+import eventos
+import plantas
+import transicoes
+import versao
+from db import get_db_connection
+from migrations import ETAPAS_TERMINAIS
+
+# Arquivo frio das ordens entregues/canceladas. Uma ordem que está numa
+# etapa do setor 'Fim' há mais de ARQUIVO_IDADE_DIAS sai de ordem_producao,
+# com as tarefas, para ordem_producao_arquivo/tarefas_arquivo, em lotes de
+# transações curtas para não segurar o lock de escrita. As rotas do dia a
+# dia só enxergam as tabelas quentes; ?include_archived=1 nas listas junta
+# o histórico, e restaurar() devolve uma ordem às tabelas quentes.
+
+COLUNAS_ORDEM = ('id', 'OS', 'produto', 'estampa', 'quantidade', 'data_entrega', 'cliente_final', 'etapa_id')
+COLUNAS_TAREFA = ('id', 'ordem_id', 'etapa_id', 'descricao', 'quantidade', 'status', 'data_criacao',
+                  'data_atualizacao')
+
+_ORDEM = ', '.join(COLUNAS_ORDEM)
+_TAREFA = ', '.join(COLUNAS_TAREFA)
+
+# Tabelas quentes e frias juntas, com o mesmo alias que as listas usam;
+# arquivado_em fica NULL nas linhas quentes
+ORDENS_COM_HISTORICO = f'''(
+    SELECT {_ORDEM}, NULL AS arquivado_em FROM ordem_producao
+    UNION ALL
+    SELECT {_ORDEM}, arquivado_em FROM ordem_producao_arquivo
+)'''
+TAREFAS_COM_HISTORICO = f'''(
+    SELECT {_TAREFA}, NULL AS arquivado_em FROM tarefas
+    UNION ALL
+    SELECT {_TAREFA}, arquivado_em FROM tarefas_arquivo
+)'''
+
+
+def arquivar_lote(conn, idade_dias, limite):
+    # Um lote numa transação; devolve (ordens, tarefas) arquivadas
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    ids = [row[0] for row in conn.execute(f'''
+        SELECT f.ordem_id
+        FROM ordem_finalizada f
+        JOIN ordem_producao op ON op.id = f.ordem_id
+        WHERE f.finalizada_em <= datetime('now', ?)
+          AND op.etapa_id IN {ETAPAS_TERMINAIS}
+        ORDER BY f.finalizada_em
+        LIMIT ?
+    ''', (f'-{idade_dias} days', limite))]
+    if not ids:
+        conn.rollback()
+        return 0, 0
+
+    lista = json.dumps(ids)
+    # Fora das tabelas quentes a linha não ocupa etapa: sai de estadia (a
+    # restauração a recoloca)
+    conn.execute('''
+        DELETE FROM estadia
+        WHERE entidade = 'tarefa' AND registro_id IN (
+            SELECT id FROM tarefas WHERE ordem_id IN (SELECT value FROM json_each(?))
+        )
+    ''', (lista,))
+    conn.execute("DELETE FROM estadia WHERE entidade = 'ordem' AND registro_id IN (SELECT value FROM json_each(?))",
+                 (lista,))
+    with transicoes.silencio(conn):
+        tarefas = conn.execute(f'''
+            INSERT INTO tarefas_arquivo ({_TAREFA}, arquivado_em)
+            SELECT {_TAREFA}, CURRENT_TIMESTAMP FROM tarefas
+            WHERE ordem_id IN (SELECT value FROM json_each(?))
+        ''', (lista,)).rowcount
+        conn.execute('DELETE FROM tarefas WHERE ordem_id IN (SELECT value FROM json_each(?))', (lista,))
+        conn.execute(f'''
+            INSERT INTO ordem_producao_arquivo ({_ORDEM}, finalizada_em, arquivado_em)
+            SELECT {', '.join(f'op.{coluna}' for coluna in COLUNAS_ORDEM)}, f.finalizada_em, CURRENT_TIMESTAMP
+            FROM ordem_producao op
+            JOIN ordem_finalizada f ON f.ordem_id = op.id
+            WHERE op.id IN (SELECT value FROM json_each(?))
+        ''', (lista,))
+        conn.execute('DELETE FROM ordem_producao WHERE id IN (SELECT value FROM json_each(?))', (lista,))
+    conn.execute('DELETE FROM ordem_tarefas_resumo WHERE ordem_id IN (SELECT value FROM json_each(?))', (lista,))
+
+    eventos.publicar(conn, 'ordens_arquivadas', {'ids': ids})
+    versao.bump(conn)
+    conn.commit()
+    return len(ids), tarefas
+
+
+def arquivar(conn, idade_dias, lote, pausa=0.0):
+    # Lotes até acabar o que está na idade; a pausa entre eles deixa as
+    # outras escritas passarem
+    ordens = tarefas = 0
+    while True:
+        n_ordens, n_tarefas = arquivar_lote(conn, idade_dias, lote)
+        ordens += n_ordens
+        tarefas += n_tarefas
+        if n_ordens < lote:
+            return ordens, tarefas
+        time.sleep(pausa)
+
+
+def restaurar(conn, ordem_id):
+    # Operação de escrita (escrita.executar): a ordem volta com o mesmo id,
+    # as tarefas voltam junto e a contagem de idade recomeça
+    arquivada = conn.execute('SELECT OS FROM ordem_producao_arquivo WHERE id = ?', (ordem_id,)).fetchone()
+    if arquivada is None:
+        raise escrita.OperacaoRecusada('Ordem arquivada não encontrada', 404)
+    if conn.execute('SELECT 1 FROM ordem_producao WHERE OS = ?', (arquivada[0],)).fetchone():
+        raise escrita.OperacaoRecusada(
+            f"OS '{arquivada[0]}' já existe no sistema. Não é possível restaurar.", 409
+        )
+
+    with transicoes.silencio(conn):
+        conn.execute(f'''
+            INSERT INTO ordem_producao ({_ORDEM})
+            SELECT {_ORDEM} FROM ordem_producao_arquivo WHERE id = ?
+        ''', (ordem_id,))
+        tarefas = conn.execute(f'''
+            INSERT INTO tarefas ({_TAREFA})
+            SELECT {_TAREFA} FROM tarefas_arquivo WHERE ordem_id = ?
+        ''', (ordem_id,)).rowcount
+    # A ordem está na etapa final desde finalizada_em; das tarefas em aberto
+    # não se sabe desde quando (permanência desconhecida, como na migração 9)
+    conn.execute('''
+        INSERT OR REPLACE INTO estadia (entidade, registro_id, etapa_id, quantidade, desde)
+        SELECT 'ordem', id, etapa_id, quantidade, finalizada_em FROM ordem_producao_arquivo
+        WHERE id = ? AND etapa_id IS NOT NULL
+    ''', (ordem_id,))
+    conn.execute('''
+        INSERT OR REPLACE INTO estadia (entidade, registro_id, etapa_id, quantidade, desde)
+        SELECT 'tarefa', id, etapa_id, quantidade, NULL FROM tarefas_arquivo
+        WHERE ordem_id = ? AND etapa_id IS NOT NULL AND COALESCE(status, '') != 'concluido'
+    ''', (ordem_id,))
+    conn.execute('DELETE FROM tarefas_arquivo WHERE ordem_id = ?', (ordem_id,))
+    conn.execute('DELETE FROM ordem_producao_arquivo WHERE id = ?', (ordem_id,))
+
+    etapa_id = conn.execute('SELECT etapa_id FROM ordem_producao WHERE id = ?', (ordem_id,)).fetchone()[0]
+    eventos.publicar(conn, 'ordem_restaurada', {'ordem_id': ordem_id, 'etapa_id': etapa_id})
+    versao.bump(conn)
+    return {'id': ordem_id, 'etapa_id': etapa_id, 'tarefas': tarefas}
+
+
+class Arquivador:
+    # Uma thread de manutenção por processo: o arquivo e a consolidação do
+    # log de transições (transicoes.py), cada um no seu intervalo. Processos
+    # concorrentes só disputam o lock e quem chega depois não encontra nada
+    # para arquivar ou consolidar.
+    def __init__(self, app):
+        self.app = app
+        self._thread = None
+        self._trava = threading.Lock()
+
+    def _tarefas(self):
+        config = self.app.config
+        tarefas = [(config['ARQUIVO_INTERVALO'], self._arquivar), (config['TRANSICOES_INTERVALO'], self._consolidar)]
+        return [(intervalo, tarefa) for intervalo, tarefa in tarefas if intervalo > 0]
+
+    def iniciar(self):
+        with self._trava:
+            if self._thread is None and self._tarefas():
+                self._thread = threading.Thread(target=self._rodar, name='manutencao', daemon=True)
+                self._thread.start()
+
+    def _plantas(self):
+        # Cada planta (ou o banco único)
+        return plantas.get_registro(self.app).nomes() if plantas.ativo(self.app) else [None]
+
+    def executar(self, idade_dias=None):
+        config = self.app.config
+        if idade_dias is None:
+            idade_dias = config['ARQUIVO_IDADE_DIAS']
+        ordens = tarefas = 0
+        for nome in self._plantas():
+            with self.app.app_context():
+                plantas.abrir(nome)
+                n_ordens, n_tarefas = arquivar(get_db_connection(), idade_dias, config['ARQUIVO_LOTE'],
+                                               config['ARQUIVO_PAUSA'])
+            ordens += n_ordens
+            tarefas += n_tarefas
+        return ordens, tarefas
+
+    def consolidar(self):
+        total = 0
+        for nome in self._plantas():
+            with self.app.app_context():
+                plantas.abrir(nome)
+                conn = get_db_connection()
+                if transicoes.pendente(conn):
+                    total += transicoes.consolidar(conn)
+        return total
+
+    def _arquivar(self):
+        try:
+            ordens, tarefas = self.executar()
+        except Exception:
+            self.app.logger.exception('Falha ao arquivar ordens finalizadas')
+            return
+        if ordens:
+            self.app.logger.info('Arquivadas %d ordens e %d tarefas', ordens, tarefas)
+
+    def _consolidar(self):
+        try:
+            self.consolidar()
+        except Exception:
+            self.app.logger.exception('Falha ao consolidar o log de transições')
+
+    def _rodar(self):
+        tarefas = self._tarefas()
+        proxima = [time.monotonic() + intervalo for intervalo, _ in tarefas]
+        while True:
+            indice = min(range(len(tarefas)), key=proxima.__getitem__)
+            time.sleep(max(proxima[indice] - time.monotonic(), 0))
+            intervalo, tarefa = tarefas[indice]
+            tarefa()
+            proxima[indice] = time.monotonic() + intervalo
+
+
+def get_arquivador(app=None):
+    return (app or current_app).extensions['kanban_arquivo']
+
+
+@click.command('arquivar')
+@click.option('--idade-dias', type=float, help='Idade mínima na etapa final (padrão: ARQUIVO_IDADE_DIAS).')
+@with_appcontext
+def arquivar_command(idade_dias):
+    ordens, tarefas = get_arquivador().executar(idade_dias)
+    click.echo(f'{ordens} ordens e {tarefas} tarefas arquivadas')
+
+
+@click.command('consolidar-transicoes')
+@with_appcontext
+def consolidar_transicoes_command():
+    total = get_arquivador().consolidar()
+    click.echo(f'{total} transições consolidadas')
+
+
+def init_app(app):
+    # Dias numa etapa do setor 'Fim' antes de a ordem ir para o arquivo
+    app.config.setdefault('ARQUIVO_IDADE_DIAS', float(os.environ.get('KANBAN_ARQUIVO_IDADE_DIAS', 90)))
+    app.config.setdefault('ARQUIVO_LOTE', int(os.environ.get('KANBAN_ARQUIVO_LOTE', 500)))
+    # Segundos entre os lotes de uma passada
+    app.config.setdefault('ARQUIVO_PAUSA', float(os.environ.get('KANBAN_ARQUIVO_PAUSA', 0.05)))
+    # Segundos entre as passadas da thread de cada processo (0 desliga)
+    app.config.setdefault('ARQUIVO_INTERVALO', float(os.environ.get('KANBAN_ARQUIVO_INTERVALO', 3600)))
+    # Segundos entre as consolidações do log de transições (0 desliga)
+    app.config.setdefault('TRANSICOES_INTERVALO', float(os.environ.get('KANBAN_TRANSICOES_INTERVALO', 60)))
+    app.extensions['kanban_arquivo'] = Arquivador(app)
+    app.cli.add_command(arquivar_command)
+    app.cli.add_command(consolidar_transicoes_command)
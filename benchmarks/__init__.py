@@ -0,0 +1,4 @@
+# Gerador de dados sintéticos e harness de carga do backend.
+#
+#   python -m benchmarks gerar --saida /tmp/bench.db
+#   python -m benchmarks rodar --banco /tmp/bench.db [--servidor] [--salvar-baseline]
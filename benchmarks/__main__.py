@@ -0,0 +1,112 @@
+import json
+import os
+
+import click
+
+from benchmarks import gerador, harness
+
+BASELINE_PADRAO = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command('gerar')
+@click.option('--saida', required=True, help='Arquivo .db a criar (não pode existir).')
+@click.option('--ordens', default=100000, show_default=True)
+@click.option('--tarefas', default=1000000, show_default=True)
+@click.option('--funcionarios', default=500, show_default=True)
+@click.option('--semente', default=42, show_default=True)
+@click.option('--planilhas', default=0, show_default=True,
+              help='Também gera produtos/funcionarios .csv e .xlsx com N linhas ao lado do banco.')
+def gerar_command(saida, ordens, tarefas, funcionarios, semente, planilhas):
+    totais = gerador.gerar_banco(saida, ordens, tarefas, funcionarios, semente)
+    click.echo(f"{saida}: {totais['ordens']} ordens, {totais['tarefas']} tarefas, "
+               f"{totais['funcionarios']} funcionários")
+    if planilhas:
+        pasta = os.path.dirname(os.path.abspath(saida))
+        for entidade in ('produtos', 'funcionarios'):
+            for extensao in ('csv', 'xlsx'):
+                caminho = gerador.gerar_planilha(
+                    os.path.join(pasta, f'{entidade}_{planilhas}.{extensao}'), planilhas,
+                    entidade=entidade, semente=semente,
+                )
+                click.echo(caminho)
+
+
+@cli.command('rodar')
+@click.option('--banco', required=True, help='Banco gerado por "gerar" (é copiado antes de rodar).')
+@click.option('--servidor', is_flag=True, help='Usa um servidor HTTP multi-thread em vez do test client.')
+@click.option('--concorrencia', default=4, show_default=True, help='Clientes simultâneos com --servidor.')
+@click.option('--repeticoes', default=1.0, show_default=True, help='Multiplicador das repetições de cada cenário.')
+@click.option('--cenario', 'nomes', multiple=True, help='Roda só os cenários informados.')
+@click.option('--linhas-importacao', default=1000, show_default=True)
+@click.option('--baseline', default=BASELINE_PADRAO, show_default=True)
+@click.option('--salvar-baseline', is_flag=True, help='Grava o resultado como novo baseline.')
+@click.option('--tolerancia', default=0.25, show_default=True)
+@click.option('--saida', help='Grava os resultados em JSON.')
+def rodar_command(banco, servidor, concorrencia, repeticoes, nomes, linhas_importacao,
+                  baseline, salvar_baseline, tolerancia, saida):
+    modo = f'servidor_c{concorrencia}' if servidor else 'test_client'
+    click.echo(f"{'cenário':<28}{'n':>6}{'falhas':>8}{'p50 ms':>10}{'p95 ms':>10}"
+               f"{'p99 ms':>10}{'req/s':>10}{'RSS MB':>9}")
+
+    def mostrar(nome, r):
+        click.echo(f"{nome:<28}{r['requisicoes']:>6}{r['falhas']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+                   f"{r['p99_ms']:>10}{r['req_s']:>10}{r['rss_pico_mb']:>9}")
+
+    resultados = harness.rodar(
+        banco, servidor=servidor, concorrencia=concorrencia, multiplicador=repeticoes,
+        nomes=set(nomes), linhas_importacao=linhas_importacao, progresso=mostrar,
+    )
+    if saida:
+        with open(saida, 'w') as arquivo:
+            json.dump({modo: resultados}, arquivo, indent=2, sort_keys=True)
+
+    if salvar_baseline:
+        harness.salvar_baseline(baseline, modo, resultados)
+        click.echo(f'Baseline ({modo}) gravado em {baseline}')
+        return
+
+    referencia = harness.carregar_baseline(baseline, modo)
+    if not referencia:
+        click.echo(f'Sem baseline ({modo}) em {baseline} para comparar.')
+        return
+    regressoes = harness.comparar(resultados, referencia, tolerancia)
+    for nome, metrica, antes, depois in regressoes:
+        click.echo(f'REGRESSÃO {nome}: {metrica} {antes} -> {depois}')
+    if regressoes:
+        raise SystemExit(1)
+    click.echo(f'Sem regressões em relação ao baseline ({modo}, tolerância {tolerancia:.0%}).')
+
+
+
+@cli.command('escrita')
+@click.option('--banco', required=True, help='Banco gerado por "gerar" (é copiado antes de cada rodada).')
+@click.option('--concorrencia', default=16, show_default=True, help='Clientes simultâneos.')
+@click.option('--repeticoes', default=4.0, show_default=True, help='Multiplicador das repetições de cada cenário.')
+@click.option('--cenario', 'nomes', multiple=True, help='Roda só os cenários informados.')
+@click.option('--synchronous', default='FULL', show_default=True,
+              type=click.Choice(['OFF', 'NORMAL', 'FULL'], case_sensitive=False),
+              help='PRAGMA synchronous das duas rodadas (FULL = fsync a cada commit).')
+def escrita_command(banco, concorrencia, repeticoes, nomes, synchronous):
+    # Vazão das escritas com commit por requisição x group commit (KANBAN_GROUP_COMMIT)
+    click.echo(f"{'cenário':<22}{'group commit':>14}{'falhas':>8}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+
+    def mostrar(nome, group_commit, r):
+        click.echo(f"{nome:<22}{'sim' if group_commit else 'não':>14}{r['falhas']:>8}{r['p50_ms']:>10}"
+                   f"{r['p95_ms']:>10}{r['req_s']:>10}")
+
+    resultados = harness.comparar_group_commit(
+        banco, concorrencia=concorrencia, multiplicador=repeticoes, nomes=set(nomes), progresso=mostrar,
+        synchronous=synchronous.upper(),
+    )
+    for nome, (sem, com) in resultados.items():
+        ganho = com['req_s'] / sem['req_s'] if sem['req_s'] else 0.0
+        click.echo(f'{nome}: {sem["req_s"]} -> {com["req_s"]} req/s ({ganho:.2f}x)')
+
+
+if __name__ == '__main__':
+    cli()
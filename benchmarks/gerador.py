@@ -0,0 +1,137 @@
+import datetime
+import os
+import random
+
+import pandas as pd
+
+import db
+import fluxo
+import transicoes
+import versao
+
+# Dados sintéticos com o formato do chão de fábrica: ordens espalhadas pelas
+# etapas semeadas por init_db, ~10 tarefas por ordem nas sub-etapas de
+# Producao e funcionários em todas as etapas. Mesma semente, mesmo banco.
+
+DATA_BASE = datetime.date(2026, 1, 1)
+PRODUTOS = ['Lençol casal', 'Lençol solteiro', 'Fronha', 'Jogo de cama queen', 'Edredom', 'Protetor de colchão']
+ESTAMPAS = ['Liso branco', 'Listrado', 'Floral', 'Xadrez', 'Poá', 'Geométrico']
+CLIENTES = ['Loja Centro', 'Atacado Sul', 'Hotel Mar Azul', 'Pousada Serra', '']
+STATUS_TAREFA = ['pendente', 'em_andamento', 'concluido']
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Giovana', 'Heitor', 'Inês', 'João']
+
+LOTE_INSERT = 50000
+
+
+def gerar_banco(caminho, ordens=100000, tarefas=1000000, funcionarios=500, semente=42):
+    # Cria o schema pelo próprio app (init_db + migrações) e preenche em
+    # lotes de executemany; os triggers de resumo rodam como em produção
+    import app as kanban
+
+    if os.path.exists(caminho):
+        raise FileExistsError(caminho)
+    kanban.app.config['DATABASE'] = caminho
+    kanban.initialize_app()
+    db.close_pools(kanban.app)
+
+    rnd = random.Random(semente)
+    conn = db.connect(caminho)
+    try:
+        conn.execute('PRAGMA synchronous = OFF')
+        etapas = dict(conn.execute('SELECT nome, id FROM etapa').fetchall())
+        todas = sorted(etapas.values())
+        sub_etapas = [etapas[nome] for nome in fluxo.SUB_ETAPAS_PRODUCAO if nome in etapas]
+
+        conn.execute('BEGIN')
+        _em_lotes(conn, '''
+            INSERT INTO ordem_producao (OS, produto, estampa, quantidade, data_entrega, cliente_final, etapa_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            (
+                100000 + i,
+                rnd.choice(PRODUTOS),
+                rnd.choice(ESTAMPAS),
+                rnd.randint(10, 500),
+                (DATA_BASE + datetime.timedelta(days=rnd.randint(0, 120))).isoformat(),
+                rnd.choice(CLIENTES),
+                rnd.choice(todas),
+            )
+            for i in range(ordens)
+        ))
+
+        ordem_ids = [row[0] for row in conn.execute('SELECT id FROM ordem_producao ORDER BY id')]
+        if ordem_ids and sub_etapas:
+            _em_lotes(conn, '''
+                INSERT INTO tarefas (ordem_id, etapa_id, descricao, quantidade, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                (
+                    ordem_ids[i * len(ordem_ids) // tarefas],
+                    rnd.choice(sub_etapas),
+                    f'Tarefa {i + 1}',
+                    rnd.randint(1, 100),
+                    rnd.choice(STATUS_TAREFA),
+                )
+                for i in range(tarefas)
+            ))
+
+        _em_lotes(conn, '''
+            INSERT INTO funcionarios (nome, etapa_id, producao_media)
+            VALUES (?, ?, ?)
+        ''', (
+            (f'{rnd.choice(NOMES)} {i + 1}', rnd.choice(todas), rnd.randint(20, 200))
+            for i in range(funcionarios)
+        ))
+        versao.bump(conn)
+        conn.commit()
+        # Log de transições da carga já nos resumos, como depois de uma
+        # passada da thread de manutenção
+        transicoes.consolidar(conn, app=kanban.app)
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    return {'ordens': ordens, 'tarefas': tarefas, 'funcionarios': funcionarios}
+
+
+def _em_lotes(conn, sql, linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == LOTE_INSERT:
+            conn.executemany(sql, lote)
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+
+
+def gerar_planilha(caminho, linhas, entidade='produtos', etapas=None, semente=42, os_inicial=900000):
+    # Planilha no formato dos templates de importação (.csv ou .xlsx pela
+    # extensão do caminho)
+    rnd = random.Random(semente)
+    etapas = etapas or fluxo.ETAPAS_PRINCIPAIS
+    if entidade == 'produtos':
+        df = pd.DataFrame({
+            'OS': range(os_inicial, os_inicial + linhas),
+            'produto': [rnd.choice(PRODUTOS) for _ in range(linhas)],
+            'estampa': [rnd.choice(ESTAMPAS) for _ in range(linhas)],
+            'quantidade': [rnd.randint(10, 500) for _ in range(linhas)],
+            'data_entrega': [(DATA_BASE + datetime.timedelta(days=rnd.randint(0, 120))).isoformat()
+                             for _ in range(linhas)],
+            'etapa': [rnd.choice(etapas) for _ in range(linhas)],
+            'cliente_final': [rnd.choice(CLIENTES) for _ in range(linhas)],
+        })
+    elif entidade == 'funcionarios':
+        df = pd.DataFrame({
+            'nome': [f'{rnd.choice(NOMES)} {i + 1}' for i in range(linhas)],
+            'etapa': [rnd.choice(etapas) for _ in range(linhas)],
+            'producao_media': [rnd.randint(20, 200) for _ in range(linhas)],
+        })
+    else:
+        raise ValueError(f'Entidade desconhecida: {entidade}')
+
+    if caminho.endswith('.csv'):
+        df.to_csv(caminho, index=False)
+    else:
+        df.to_excel(caminho, index=False)
+    return caminho
@@ -0,0 +1,376 @@
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import db
+import escrita
+import fluxo
+import paginacao
+from benchmarks import gerador
+
+# Cada cenário monta as requisições antes de medir (o custo de preparar o
+# corpo não entra na latência) e as envia pelo test client do Flask ou por
+# HTTP contra um servidor werkzeug multi-thread. Os cenários de escrita
+# rodam sobre uma cópia do banco gerado, então cada execução parte do mesmo
+# estado.
+
+
+class Cenario:
+    # antes(contexto), se houver, roda antes de cada requisição, fora da
+    # medição (ex.: descartar um cache para medir o cálculo a frio)
+    def __init__(self, nome, montar, repeticoes=50, esperado=(200,), antes=None):
+        self.nome = nome
+        self.montar = montar
+        self.repeticoes = repeticoes
+        self.esperado = esperado
+        self.antes = antes
+
+
+class Contexto:
+    def __init__(self, app, caminho, semente, linhas_importacao):
+        self.app = app
+        self.caminho = caminho
+        self.rnd = random.Random(semente)
+        self.linhas_importacao = linhas_importacao
+        conn = db.connect(caminho, readonly=True)
+        try:
+            self.max_ordem = conn.execute('SELECT COALESCE(MAX(id), 1) FROM ordem_producao').fetchone()[0]
+            self.max_tarefa = conn.execute('SELECT COALESCE(MAX(id), 1) FROM tarefas').fetchone()[0]
+            self.max_os = conn.execute('SELECT COALESCE(MAX(OS), 0) FROM ordem_producao').fetchone()[0]
+            etapas = dict(conn.execute('SELECT nome, id FROM etapa').fetchall())
+            self.versao = conn.execute('SELECT versao FROM versao_dados WHERE id = 1').fetchone()[0]
+        finally:
+            conn.close()
+        self.etapas = sorted(etapas.values())
+        self.sub_etapas = [etapas[nome] for nome in fluxo.SUB_ETAPAS_PRODUCAO if nome in etapas] or self.etapas
+        self.nomes_etapas = sorted(etapas)
+        self.os = itertools.count(self.max_os + 1)
+
+    def ordem(self):
+        return self.rnd.randint(1, self.max_ordem)
+
+    def tarefa(self):
+        return self.rnd.randint(1, self.max_tarefa)
+
+    def etapa(self):
+        return self.rnd.choice(self.etapas)
+
+    def planilha_produtos(self):
+        inicio = next(self.os)
+        for _ in range(self.linhas_importacao - 1):
+            next(self.os)
+        return self._planilha('produtos', semente=inicio, os_inicial=inicio)
+
+    def planilha_funcionarios(self):
+        return self._planilha('funcionarios', semente=self.rnd.randint(0, 2 ** 31))
+
+    def _planilha(self, entidade, **kwargs):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = gerador.gerar_planilha(
+                os.path.join(pasta, f'{entidade}.csv'), self.linhas_importacao,
+                entidade=entidade, etapas=self.nomes_etapas, **kwargs,
+            )
+            with open(caminho, 'rb') as arquivo:
+                return arquivo.read()
+
+
+def cenarios():
+    # (método, url, corpo, headers); corpo dict/list vai como JSON, bytes cru
+    return [
+        Cenario('listar_produtos_pagina', lambda c: (
+            'GET', f'/produtos?limit=100&cursor={paginacao.encode_cursor(c.ordem())}', None, {})),
+        Cenario('listar_produtos_filtro', lambda c: (
+            'GET', '/produtos?status=aberta&data_entrega_ate=2026-02-01&limit=100', None, {})),
+        Cenario('listar_produtos_completo', lambda c: ('GET', '/produtos', None, {}), repeticoes=3),
+        Cenario('listar_funcionarios', lambda c: ('GET', '/funcionarios', None, {})),
+        Cenario('alocacao_plano', lambda c: ('POST', '/funcionarios/alocacao', {}, {}), repeticoes=5),
+        Cenario('listar_etapas', lambda c: ('GET', '/etapas', None, {})),
+        Cenario('etapas_condicional', lambda c: (
+            'GET', '/etapas', None, {'If-None-Match': f'"{c.versao}"'}), esperado=(304,)),
+        Cenario('detalhe_etapa', lambda c: ('GET', f'/etapas/{c.etapa()}', None, {}), repeticoes=10),
+        Cenario('listar_tarefas_pagina', lambda c: (
+            'GET', f'/tarefas?limit=100&cursor={paginacao.encode_cursor(c.tarefa())}', None, {})),
+        Cenario('listar_tarefas_filtro', lambda c: (
+            'GET', f'/tarefas?etapa_id={c.rnd.choice(c.sub_etapas)}&status=pendente&limit=100', None, {})),
+        Cenario('tarefas_da_ordem', lambda c: ('GET', f'/produtos/{c.ordem()}/tarefas', None, {})),
+        Cenario('historico_ordem', lambda c: ('GET', f'/produtos/{c.ordem()}/historico', None, {})),
+        Cenario('tarefas_da_etapa', lambda c: (
+            'GET', f'/etapas/{c.rnd.choice(c.sub_etapas)}/tarefas', None, {}), repeticoes=3),
+        Cenario('board_etapa', lambda c: ('GET', f'/board?etapa_id={c.etapa()}', None, {}), repeticoes=3),
+        Cenario('previsao_atrasadas', lambda c: ('GET', '/previsao?atrasadas=1', None, {}), repeticoes=5),
+        # Sem o cache: o cálculo inteiro sobre as ordens abertas (com o banco
+        # padrão do gerador, bem mais de 50 mil) a cada requisição
+        Cenario('previsao_recalculo', lambda c: ('GET', '/previsao?atrasadas=1', None, {}), repeticoes=3,
+                antes=lambda c: db.descartar(c.app, c.caminho, 'previsao')),
+        Cenario('indicadores_etapas_dia', lambda c: ('GET', '/indicadores/etapas', None, {})),
+        Cenario('indicadores_etapas_hora', lambda c: (
+            'GET', '/indicadores/etapas?granularidade=hora', None, {})),
+        Cenario('exportar_produtos_csv', lambda c: ('GET', '/exportar/produtos?status=aberta', None, {})),
+        Cenario('template_produtos', lambda c: ('GET', '/template/produtos', None, {}), repeticoes=10),
+        Cenario('template_funcionarios', lambda c: ('GET', '/template/funcionarios', None, {}), repeticoes=10),
+        Cenario('adicionar_produto', lambda c: ('POST', '/produtos', {
+            'OS': next(c.os), 'produto': 'Lençol casal', 'estampa': 'Floral', 'quantidade': 100,
+            'data_entrega': '2026-03-01', 'etapa': c.rnd.choice(c.nomes_etapas),
+        }, {}), esperado=(201,)),
+        Cenario('adicionar_funcionario', lambda c: ('POST', '/funcionarios', {
+            'nome': 'Bench', 'etapa': c.rnd.choice(c.nomes_etapas), 'producao_media': 100,
+        }, {}), esperado=(201,)),
+        Cenario('mover_produto', lambda c: (
+            'PATCH', f'/produtos/{c.ordem()}', {'etapa_id': c.etapa()}, {})),
+        Cenario('mover_produtos_lote', lambda c: ('POST', '/produtos/mover', {
+            'etapa_id': c.etapa(), 'ids': [c.ordem() for _ in range(100)],
+        }, {}), repeticoes=20),
+        Cenario('criar_tarefas', lambda c: ('POST', f'/produtos/{c.ordem()}/tarefas', [
+            {'etapa_id': etapa_id, 'descricao': 'Bench', 'quantidade': 10} for etapa_id in c.sub_etapas[:3]
+        ], {}), esperado=(201,)),
+        Cenario('atualizar_tarefa', lambda c: (
+            'PUT', f'/tarefas/{c.tarefa()}', {'status': c.rnd.choice(gerador.STATUS_TAREFA)}, {})),
+        Cenario('atualizar_tarefas_lote', lambda c: ('PATCH', '/tarefas', [
+            {'id': c.tarefa(), 'status': c.rnd.choice(gerador.STATUS_TAREFA)} for _ in range(50)
+        ], {}), repeticoes=20),
+        Cenario('importar_produtos_csv', lambda c: (
+            'POST', '/importar/produtos?formato=csv', c.planilha_produtos(), {'Content-Type': 'text/csv'}
+        ), repeticoes=5, esperado=(201,)),
+        Cenario('importar_funcionarios_csv', lambda c: (
+            'POST', '/importar/funcionarios?formato=csv', c.planilha_funcionarios(), {'Content-Type': 'text/csv'}
+        ), repeticoes=5, esperado=(201,)),
+        # Depois das escritas: só o que mudou durante a própria execução
+        Cenario('sync_recente', lambda c: ('GET', f'/sync?since={c.versao}', None, {})),
+    ]
+
+
+class ClienteTeste:
+    concorrente = False
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def enviar(self, metodo, url, corpo, headers):
+        if isinstance(corpo, (bytes, bytearray)):
+            response = self.client.open(url, method=metodo, data=corpo, headers=headers)
+        else:
+            response = self.client.open(url, method=metodo, json=corpo, headers=headers)
+        response.get_data()
+        return response.status_code
+
+    def fechar(self):
+        pass
+
+
+class _HandlerSilencioso(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ClienteHTTP:
+    # Servidor werkzeug com uma thread por requisição (HTTP/1.1, keep-alive);
+    # cada thread cliente mantém sua própria conexão
+    concorrente = True
+
+    def __init__(self, app):
+        self.servidor = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_HandlerSilencioso)
+        self.porta = self.servidor.server_port
+        self._thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def _conexao(self):
+        if not hasattr(self._local, 'conexao'):
+            self._local.conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=300)
+        return self._local.conexao
+
+    def enviar(self, metodo, url, corpo, headers):
+        headers = dict(headers)
+        if corpo is not None and not isinstance(corpo, (bytes, bytearray)):
+            corpo = json.dumps(corpo).encode()
+            headers['Content-Type'] = 'application/json'
+        conexao = self._conexao()
+        try:
+            conexao.request(metodo, url, body=corpo, headers=headers)
+            response = conexao.getresponse()
+            response.read()
+        except (http.client.HTTPException, ConnectionError):
+            # Conexão derrubada pelo servidor: abre outra na próxima
+            conexao.close()
+            del self._local.conexao
+            raise
+        return response.status
+
+    def fechar(self):
+        self.servidor.shutdown()
+
+
+def _zerar_pico_rss():
+    # Linux: "5" em clear_refs zera o VmHWM do processo
+    try:
+        with open('/proc/self/clear_refs', 'w') as arquivo:
+            arquivo.write('5')
+    except OSError:
+        pass
+
+
+def _pico_rss_mb():
+    try:
+        with open('/proc/self/status') as arquivo:
+            for linha in arquivo:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentil(valores, p):
+    # Nearest-rank sobre valores já ordenados
+    if not valores:
+        return 0.0
+    return valores[max(math.ceil(p / 100 * len(valores)) - 1, 0)]
+
+
+def medir(cenario, cliente, contexto, multiplicador=1.0, concorrencia=1):
+    n = max(int(cenario.repeticoes * multiplicador), 1)
+    requisicoes = [cenario.montar(contexto) for _ in range(n)]
+    latencias = []
+    falhas = [0]
+    trava = threading.Lock()
+
+    def executar(requisicao):
+        if cenario.antes:
+            cenario.antes(contexto)
+        inicio = time.perf_counter()
+        try:
+            status = cliente.enviar(*requisicao)
+        except Exception:
+            status = None
+        duracao = time.perf_counter() - inicio
+        with trava:
+            latencias.append(duracao)
+            if status not in cenario.esperado:
+                falhas[0] += 1
+
+    _zerar_pico_rss()
+    inicio = time.perf_counter()
+    if cliente.concorrente and concorrencia > 1:
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            list(executor.map(executar, requisicoes))
+    else:
+        for requisicao in requisicoes:
+            executar(requisicao)
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'requisicoes': n,
+        'falhas': falhas[0],
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+        'req_s': round(n / total, 1) if total > 0 else 0.0,
+        'rss_pico_mb': round(_pico_rss_mb(), 1),
+    }
+
+
+def preparar_app(banco, pasta):
+    # Cópia descartável do banco gerado; migrações pendentes rodam nela
+    import app as kanban
+
+    copia = os.path.join(pasta, 'kanban.db')
+    shutil.copyfile(banco, copia)
+    kanban.app.config['DATABASE'] = copia
+    kanban.initialize_app()
+    return kanban.app, copia
+
+
+def rodar(banco, servidor=False, concorrencia=4, multiplicador=1.0, nomes=None,
+          semente=42, linhas_importacao=1000, progresso=None, group_commit=None, synchronous=None):
+    with tempfile.TemporaryDirectory() as pasta:
+        app, copia = preparar_app(banco, pasta)
+        pragmas = app.config['SQLITE_PRAGMAS']
+        if synchronous is not None:
+            db.close_pools(app)
+            app.config['SQLITE_PRAGMAS'] = dict(pragmas, synchronous=synchronous)
+        if group_commit is not None:
+            app.config['GROUP_COMMIT'] = group_commit
+        contexto = Contexto(app, copia, semente, linhas_importacao)
+        cliente = ClienteHTTP(app) if servidor else ClienteTeste(app)
+        resultados = {}
+        try:
+            for cenario in cenarios():
+                if nomes and cenario.nome not in nomes:
+                    continue
+                resultados[cenario.nome] = medir(cenario, cliente, contexto, multiplicador, concorrencia)
+                if progresso:
+                    progresso(cenario.nome, resultados[cenario.nome])
+        finally:
+            cliente.fechar()
+            escrita.parar(app)
+            db.close_pools(app)
+            app.config['SQLITE_PRAGMAS'] = pragmas
+    return resultados
+
+
+# Escritas pequenas e frequentes que passam pelo escritor único
+CENARIOS_GROUP_COMMIT = ('atualizar_tarefa', 'mover_produto', 'adicionar_produto', 'criar_tarefas')
+
+
+def comparar_group_commit(banco, concorrencia=16, multiplicador=1.0, nomes=None, progresso=None,
+                          synchronous='FULL'):
+    # Mesmos cenários, mesmo banco de partida, no servidor HTTP: commit por
+    # requisição x escritor único. Com synchronous=FULL cada commit faz fsync
+    # do WAL, que é o custo que o group commit divide; com NORMAL o commit
+    # quase não custa e sobra só a disputa pelo lock. Devolve {cenário: (sem, com)}.
+    nomes = set(nomes or CENARIOS_GROUP_COMMIT)
+    resultados = {}
+    for group_commit in (False, True):
+        rodada = rodar(banco, servidor=True, concorrencia=concorrencia, multiplicador=multiplicador,
+                       nomes=nomes, group_commit=group_commit, synchronous=synchronous)
+        for nome, resultado in rodada.items():
+            resultados.setdefault(nome, []).append(resultado)
+            if progresso:
+                progresso(nome, group_commit, resultado)
+    return {nome: tuple(par) for nome, par in resultados.items()}
+
+
+def comparar(resultados, baseline, tolerancia=0.25):
+    # Regressão: p95 acima de (1 + tolerância) x baseline ou vazão abaixo de
+    # (1 - tolerância) x baseline
+    regressoes = []
+    for nome, atual in resultados.items():
+        base = baseline.get(nome)
+        if not base:
+            continue
+        if base['p95_ms'] > 0 and atual['p95_ms'] > base['p95_ms'] * (1 + tolerancia):
+            regressoes.append((nome, 'p95_ms', base['p95_ms'], atual['p95_ms']))
+        if base['req_s'] > 0 and atual['req_s'] < base['req_s'] * (1 - tolerancia):
+            regressoes.append((nome, 'req_s', base['req_s'], atual['req_s']))
+        if atual['falhas'] > base.get('falhas', 0):
+            regressoes.append((nome, 'falhas', base.get('falhas', 0), atual['falhas']))
+    return regressoes
+
+
+def carregar_baseline(caminho, modo):
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho) as arquivo:
+        return json.load(arquivo).get(modo, {})
+
+
+def salvar_baseline(caminho, modo, resultados):
+    dados = {}
+    if os.path.exists(caminho):
+        with open(caminho) as arquivo:
+            dados = json.load(arquivo)
+    dados[modo] = resultados
+    with open(caminho, 'w') as arquivo:
+        json.dump(dados, arquivo, indent=2, sort_keys=True)
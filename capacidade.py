@@ -0,0 +1,220 @@
+import click
+from flask.cli import with_appcontext
+
+from db import get_db_connection
+from versao import PROXIMA_VERSAO
+
+# Resumo de capacidade por etapa, mantido por triggers a cada insert, update
+# ou delete em ordem_producao e funcionarios. Os endpoints de etapas leem
+# daqui em O(#etapas) em vez de juntar ordens x funcionarios. A coluna versao
+# marca a última mudança de cada etapa para o /sync.
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS etapa_capacidade (
+        etapa_id INTEGER PRIMARY KEY,
+        quantidade_ordens INTEGER NOT NULL DEFAULT 0,
+        total_ordens INTEGER NOT NULL DEFAULT 0,
+        producao_alocada INTEGER NOT NULL DEFAULT 0,
+        total_funcionarios INTEGER NOT NULL DEFAULT 0,
+        versao INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_etapa
+    AFTER INSERT ON etapa
+    BEGIN
+        INSERT OR IGNORE INTO etapa_capacidade (etapa_id) VALUES (NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_ordem_insert
+    AFTER INSERT ON ordem_producao
+    WHEN NEW.etapa_id IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO etapa_capacidade (etapa_id) VALUES (NEW.etapa_id);
+        UPDATE etapa_capacidade
+        SET quantidade_ordens = quantidade_ordens + NEW.quantidade,
+            total_ordens = total_ordens + 1
+        WHERE etapa_id = NEW.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_ordem_delete
+    AFTER DELETE ON ordem_producao
+    WHEN OLD.etapa_id IS NOT NULL
+    BEGIN
+        UPDATE etapa_capacidade
+        SET quantidade_ordens = quantidade_ordens - OLD.quantidade,
+            total_ordens = total_ordens - 1
+        WHERE etapa_id = OLD.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_ordem_update
+    AFTER UPDATE OF etapa_id, quantidade ON ordem_producao
+    BEGIN
+        UPDATE etapa_capacidade
+        SET quantidade_ordens = quantidade_ordens - OLD.quantidade,
+            total_ordens = total_ordens - 1
+        WHERE etapa_id = OLD.etapa_id;
+        INSERT OR IGNORE INTO etapa_capacidade (etapa_id)
+        SELECT NEW.etapa_id WHERE NEW.etapa_id IS NOT NULL;
+        UPDATE etapa_capacidade
+        SET quantidade_ordens = quantidade_ordens + NEW.quantidade,
+            total_ordens = total_ordens + 1
+        WHERE etapa_id = NEW.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_funcionario_insert
+    AFTER INSERT ON funcionarios
+    WHEN NEW.etapa_id IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO etapa_capacidade (etapa_id) VALUES (NEW.etapa_id);
+        UPDATE etapa_capacidade
+        SET producao_alocada = producao_alocada + NEW.producao_media,
+            total_funcionarios = total_funcionarios + 1
+        WHERE etapa_id = NEW.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_funcionario_delete
+    AFTER DELETE ON funcionarios
+    WHEN OLD.etapa_id IS NOT NULL
+    BEGIN
+        UPDATE etapa_capacidade
+        SET producao_alocada = producao_alocada - OLD.producao_media,
+            total_funcionarios = total_funcionarios - 1
+        WHERE etapa_id = OLD.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_funcionario_update
+    AFTER UPDATE OF etapa_id, producao_media ON funcionarios
+    BEGIN
+        UPDATE etapa_capacidade
+        SET producao_alocada = producao_alocada - OLD.producao_media,
+            total_funcionarios = total_funcionarios - 1
+        WHERE etapa_id = OLD.etapa_id;
+        INSERT OR IGNORE INTO etapa_capacidade (etapa_id)
+        SELECT NEW.etapa_id WHERE NEW.etapa_id IS NOT NULL;
+        UPDATE etapa_capacidade
+        SET producao_alocada = producao_alocada + NEW.producao_media,
+            total_funcionarios = total_funcionarios + 1
+        WHERE etapa_id = NEW.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_versao_insert
+    AFTER INSERT ON etapa_capacidade
+    BEGIN
+        UPDATE etapa_capacidade SET versao = {PROXIMA_VERSAO} WHERE etapa_id = NEW.etapa_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_etapa_capacidade_versao_update
+    AFTER UPDATE ON etapa_capacidade
+    WHEN NEW.versao IS OLD.versao
+    BEGIN
+        UPDATE etapa_capacidade SET versao = {PROXIMA_VERSAO} WHERE etapa_id = NEW.etapa_id;
+    END;
+'''
+
+# Mesmo resumo calculado do zero, usado para reconstruir e para conferir
+RECALCULO_QUERY = '''
+    SELECT
+        ids.etapa_id,
+        COALESCE(o.quantidade_ordens, 0) AS quantidade_ordens,
+        COALESCE(o.total_ordens, 0) AS total_ordens,
+        COALESCE(f.producao_alocada, 0) AS producao_alocada,
+        COALESCE(f.total_funcionarios, 0) AS total_funcionarios
+    FROM (
+        SELECT id AS etapa_id FROM etapa
+        UNION SELECT etapa_id FROM ordem_producao WHERE etapa_id IS NOT NULL
+        UNION SELECT etapa_id FROM funcionarios WHERE etapa_id IS NOT NULL
+    ) ids
+    LEFT JOIN (
+        SELECT etapa_id, SUM(quantidade) AS quantidade_ordens, COUNT(*) AS total_ordens
+        FROM ordem_producao
+        GROUP BY etapa_id
+    ) o ON o.etapa_id = ids.etapa_id
+    LEFT JOIN (
+        SELECT etapa_id, SUM(producao_media) AS producao_alocada, COUNT(*) AS total_funcionarios
+        FROM funcionarios
+        GROUP BY etapa_id
+    ) f ON f.etapa_id = ids.etapa_id
+'''
+
+ETAPAS_QUERY = '''
+    SELECT
+        e.id,
+        e.nome,
+        e.setor,
+        COALESCE(c.quantidade_ordens, 0) AS capacidade_necessaria,
+        COALESCE(c.producao_alocada, 0) AS capacidade_alocada,
+        COALESCE(c.total_ordens, 0) AS total_ordens,
+        COALESCE(c.total_funcionarios, 0) AS total_funcionarios
+    FROM etapa e
+    LEFT JOIN etapa_capacidade c ON c.etapa_id = e.id
+'''
+
+COLUNAS = ('quantidade_ordens', 'total_ordens', 'producao_alocada', 'total_funcionarios')
+
+
+def install(conn):
+    existia = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'etapa_capacidade'"
+    ).fetchone()
+    if existia:
+        colunas = {row['name'] for row in conn.execute('PRAGMA table_info(etapa_capacidade)')}
+        if 'versao' not in colunas:
+            conn.execute('ALTER TABLE etapa_capacidade ADD COLUMN versao INTEGER NOT NULL DEFAULT 0')
+    conn.executescript(SCHEMA)
+    if not existia:
+        rebuild(conn)
+    conn.commit()
+
+
+def rebuild(conn):
+    conn.execute('DELETE FROM etapa_capacidade')
+    conn.execute(f'''
+        INSERT INTO etapa_capacidade (etapa_id, {', '.join(COLUNAS)})
+        {RECALCULO_QUERY}
+    ''')
+
+
+def check(conn):
+    # Lista as etapas cujo resumo diverge do valor recalculado
+    atual = {
+        row['etapa_id']: tuple(row[c] for c in COLUNAS)
+        for row in conn.execute('SELECT * FROM etapa_capacidade')
+    }
+    divergencias = []
+    for row in conn.execute(RECALCULO_QUERY):
+        esperado = tuple(row[c] for c in COLUNAS)
+        encontrado = atual.pop(row['etapa_id'], (0, 0, 0, 0))
+        if encontrado != esperado:
+            divergencias.append((row['etapa_id'], encontrado, esperado))
+    for etapa_id, encontrado in atual.items():
+        if any(encontrado):
+            divergencias.append((etapa_id, encontrado, (0, 0, 0, 0)))
+    return divergencias
+
+
+def status(necessaria, alocada):
+    if necessaria > alocada:
+        return "Sobrecarregado"
+    if necessaria < alocada:
+        return "Ocioso"
+    return "Balanceado"
+
+
+@click.command('verificar-capacidade')
+@click.option('--somente-verificar', is_flag=True, help='Apenas lista divergências, sem reconstruir.')
+@with_appcontext
+def verificar_capacidade_command(somente_verificar):
+    conn = get_db_connection()
+    divergencias = check(conn)
+    for etapa_id, encontrado, esperado in divergencias:
+        click.echo(f'Etapa {etapa_id}: resumo {encontrado} != recalculado {esperado}')
+    if not divergencias:
+        click.echo('Resumo de capacidade consistente.')
+    if somente_verificar:
+        return
+    rebuild(conn)
+    conn.commit()
+    click.echo('Resumo de capacidade reconstruído.')
+
+
+def init_app(app):
+    app.cli.add_command(verificar_capacidade_command)
@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+import db
+from db import get_db_connection
+
+# Cache do cadastro de etapas, compartilhado pelas threads do processo. As
+# rotas resolvem nome -> id e id -> etapa sem consultar a tabela etapa; a
+# cada requisição (uma vez por app context) o contador de etapa_versao
+# (migração 7, mantido por triggers) diz se outro processo mudou o cadastro
+# e o catálogo precisa ser recarregado. Quem altera etapas neste processo
+# chama invalidar() depois do commit. Um catálogo por arquivo de banco.
+
+
+class Catalogo:
+    def __init__(self, versao_etapas, etapas):
+        self.versao = versao_etapas
+        self.por_id = {etapa['id']: etapa for etapa in etapas}
+        self.por_nome = {etapa['nome']: etapa['id'] for etapa in etapas}
+
+    def id_por_nome(self, nome):
+        return self.por_nome.get(nome) if isinstance(nome, str) else None
+
+    def etapa(self, etapa_id):
+        # Aceita o id como veio no JSON ("3" também casava no WHERE id = ?)
+        try:
+            return self.por_id.get(int(etapa_id))
+        except (TypeError, ValueError):
+            return None
+
+    def existe(self, etapa_id):
+        return self.etapa(etapa_id) is not None
+
+
+def versao_atual(conn):
+    try:
+        row = conn.execute('SELECT versao FROM etapa_versao WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        # Banco ainda sem a migração 7: sem como validar, não guarda cache
+        return None
+    return row[0] if row else None
+
+
+def _carregar(conn, versao_etapas):
+    cursor = conn.execute('SELECT id, nome, setor FROM etapa')
+    colunas = [coluna[0] for coluna in cursor.description]
+    return Catalogo(versao_etapas, [dict(zip(colunas, row)) for row in cursor.fetchall()])
+
+
+def _estado(app=None):
+    return db.estado('catalogo', lambda path: {'trava': threading.Lock(), 'catalogo': None}, app)
+
+
+def obter(conn=None):
+    # conn: a conexão da rota, para a versão ser lida na mesma transação
+    if '_kanban_catalogo' in g:
+        return g._kanban_catalogo
+    estado = _estado()
+    conn = conn or get_db_connection(readonly=True)
+    versao_etapas = versao_atual(conn)
+    atual = estado['catalogo']
+    if versao_etapas is None or atual is None or atual.versao != versao_etapas:
+        with estado['trava']:
+            atual = estado['catalogo']
+            if versao_etapas is None or atual is None or atual.versao != versao_etapas:
+                atual = _carregar(conn, versao_etapas)
+                if versao_etapas is not None:
+                    estado['catalogo'] = atual
+    g._kanban_catalogo = atual
+    return atual
+
+
+def invalidar(app=None):
+    estado = _estado(app)
+    with estado['trava']:
+        estado['catalogo'] = None
+    if has_app_context():
+        g.pop('_kanban_catalogo', None)
+
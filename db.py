@@ -0,0 +1,185 @@
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import current_app, g, has_app_context
+
+DEFAULT_DATABASE = 'KanbanProjeto/kanban.db'
+
+# PRAGMAs aplicados em toda conexão nova. WAL deixa leitores e o escritor
+# trabalharem ao mesmo tempo; busy_timeout evita o "database is locked" imediato.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,  # negativo = KiB (~20 MB por conexão)
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+# PRAGMAs que só fazem sentido (ou só são permitidos) em conexões de escrita
+WRITE_ONLY_PRAGMAS = {'journal_mode'}
+
+
+def connect(path, pragmas=None, readonly=False):
+    if readonly:
+        uri = 'file:{}?mode=ro'.format(os.path.abspath(path))
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+
+    for nome, valor in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        if readonly and nome in WRITE_ONLY_PRAGMAS:
+            continue
+        conn.execute(f'PRAGMA {nome} = {valor}')
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+@contextlib.contextmanager
+def snapshot(conn):
+    # Transação só de leitura: todas as consultas do bloco enxergam o mesmo
+    # estado do banco, mesmo com escritas concorrentes (WAL)
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+# Conexões SQLite reaproveitadas entre requisições: cada requisição pega uma
+# conexão do pool e a devolve no teardown do app context, em vez de abrir e
+# fechar o arquivo a cada chamada.
+class ConnectionPool:
+    def __init__(self, path, pragmas=None, readonly=False, size=8):
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.readonly = readonly
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path, self.pragmas, self.readonly)
+
+    def release(self, conn):
+        # Nunca devolver ao pool uma conexão com transação pendente
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def caminho(app=None):
+    # Arquivo do banco deste app context: o da planta (ver plantas.py) ou,
+    # sem planta, o DATABASE
+    if has_app_context() and '_kanban_database' in g:
+        return g._kanban_database
+    return (app or current_app).config['DATABASE']
+
+
+def usar(path):
+    # Troca o banco do app context atual; chamar antes da primeira conexão
+    g._kanban_database = path
+
+
+def _pools(app):
+    return app.extensions.setdefault('kanban_db', {})
+
+
+def get_pool(readonly=False, app=None):
+    app = app or current_app
+    path = caminho(app)
+    pools = _pools(app)
+    key = (path, readonly)
+    if key not in pools:
+        pools[key] = ConnectionPool(
+            path,
+            pragmas=app.config['SQLITE_PRAGMAS'],
+            readonly=readonly,
+            size=app.config['SQLITE_POOL_SIZE'],
+        )
+    return pools[key]
+
+
+def get_db_connection(readonly=False):
+    # Uma conexão por modo (leitura/escrita) por app context; devolvida
+    # ao pool automaticamente em release_db_connections. Se houver um
+    # envoltório registrado (métricas), a requisição recebe a conexão
+    # envolvida e o pool continua lidando com a original.
+    conexoes = g.setdefault('_kanban_conexoes', {})
+    if readonly not in conexoes:
+        pool = get_pool(readonly)
+        conn = pool.acquire()
+        envoltorio = current_app.extensions.get('kanban_db_envoltorio')
+        conexoes[readonly] = (pool, conn, envoltorio(conn) if envoltorio else conn)
+    return conexoes[readonly][2]
+
+
+def release_db_connections(exc=None):
+    conexoes = g.pop('_kanban_conexoes', {})
+    for pool, conn, _ in conexoes.values():
+        pool.release(conn)
+
+
+def close_pools(app, path=None):
+    pools = _pools(app)
+    for chave in [chave for chave in pools if path in (None, chave[0])]:
+        pools.pop(chave).close_all()
+
+
+# Estado de processo que vale para um arquivo de banco só (caches, threads
+# de escrita e de eventos). Cada módulo guarda o seu com estado(nome, ...) e
+# recebe o objeto do banco do app context; descartar() fecha o de um banco
+# quando a planta sai da memória.
+def estado(nome, fabrica, app=None):
+    # fabrica(path) cria o objeto na primeira vez
+    app = app or current_app
+    bancos = app.extensions['kanban_bancos']
+    path = caminho(app)
+    with bancos['trava']:
+        por_nome = bancos['estados'].setdefault(path, {})
+        if nome not in por_nome:
+            por_nome[nome] = fabrica(path)
+        return por_nome[nome]
+
+
+def descartar(app, path=None, nome=None):
+    # Tira do processo o estado `nome` (ou todo, com os pools) de um banco
+    # ou, com path None, de todos; objetos com fechar() são fechados
+    bancos = app.extensions['kanban_bancos']
+    removidos = []
+    with bancos['trava']:
+        for chave in [chave for chave in bancos['estados'] if path in (None, chave)]:
+            if nome is None:
+                removidos.extend(bancos['estados'].pop(chave).values())
+            elif nome in bancos['estados'][chave]:
+                removidos.append(bancos['estados'][chave].pop(nome))
+    for objeto in removidos:
+        fechar = getattr(objeto, 'fechar', None)
+        if fechar is not None:
+            fechar()
+    if nome is None:
+        close_pools(app, path)
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', os.environ.get('KANBAN_DATABASE', DEFAULT_DATABASE))
+    app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_PRAGMAS))
+    app.config.setdefault('SQLITE_POOL_SIZE', int(os.environ.get('KANBAN_POOL_SIZE', 8)))
+    app.extensions['kanban_bancos'] = {'trava': threading.Lock(), 'estados': {}}
+    app.teardown_appcontext(release_db_connections)
@@ -0,0 +1,164 @@
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+
+import db
+import eventos
+
+# Escritor único opcional (group commit). Com KANBAN_GROUP_COMMIT=1 as rotas
+# de escrita mais frequentes não fazem o próprio commit: entregam a operação
+# (uma função que recebe a conexão e não faz commit) a uma fila, e uma
+# thread com a única conexão de escrita do processo junta tudo o que chegar
+# dentro da janela numa transação só. Cada operação roda num SAVEPOINT, então
+# o erro de uma desfaz só a parte dela e volta para quem a enviou; as outras
+# seguem no mesmo commit. Desligado, executar() roda a operação na conexão da
+# requisição e faz o commit na hora, como antes. No modo multiplanta cada
+# arquivo de banco tem o seu escritor.
+
+
+class OperacaoRecusada(Exception):
+    # Erro de validação que só dá para ver dentro da transação (ex.: a linha
+    # sumiu); vira {'error': ...} com o status informado
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class _Pedido:
+    __slots__ = ('operacao', 'resultado', 'erro', 'pronto')
+
+    def __init__(self, operacao):
+        self.operacao = operacao
+        self.resultado = None
+        self.erro = None
+        self.pronto = threading.Event()
+
+
+class Escritor:
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self.janela = app.config['GROUP_COMMIT_JANELA_MS'] / 1000
+        self.max_lote = app.config['GROUP_COMMIT_MAX_LOTE']
+        self._fila = queue.Queue()
+        self._trava = threading.Lock()
+        self._thread = None
+
+    def _iniciar(self):
+        with self._trava:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._rodar, name='escrita', daemon=True)
+                self._thread.start()
+
+    def submeter(self, operacao):
+        self._iniciar()
+        pedido = _Pedido(operacao)
+        self._fila.put(pedido)
+        pedido.pronto.wait()
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def fechar(self):
+        with self._trava:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._fila.put(None)
+            thread.join()
+
+    def _proximo_lote(self):
+        primeiro = self._fila.get()
+        if primeiro is None:
+            return None
+        lote = [primeiro]
+        limite = time.monotonic() + self.janela
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                pedido = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if pedido is None:
+                # Parada pedida no meio da janela: fecha este lote e sai depois
+                self._fila.put(None)
+                break
+            lote.append(pedido)
+        return lote
+
+    def _rodar(self):
+        conn = db.connect(self.path, self.app.config['SQLITE_PRAGMAS'])
+        try:
+            while True:
+                lote = self._proximo_lote()
+                if lote is None:
+                    return
+                # App context novo por lote: catálogo e config valem como
+                # numa requisição
+                with self.app.app_context():
+                    db.usar(self.path)
+                    if self._executar(conn, lote):
+                        eventos.get_broker().acordar()
+        finally:
+            conn.close()
+
+    def _executar(self, conn, lote):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for pedido in lote:
+                conn.execute('SAVEPOINT operacao')
+                try:
+                    pedido.resultado = pedido.operacao(conn)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO operacao')
+                    pedido.erro = e
+                conn.execute('RELEASE operacao')
+            conn.commit()
+            return True
+        except Exception as e:
+            # Sem commit (lock, disco): o lote inteiro falha
+            self.app.logger.exception('Falha no commit do lote de escrita')
+            if conn.in_transaction:
+                conn.rollback()
+            for pedido in lote:
+                pedido.erro = pedido.erro or e
+            return False
+        finally:
+            for pedido in lote:
+                pedido.pronto.set()
+
+
+def executar(operacao):
+    # Roda operacao(conn) e faz o commit, direto ou pelo escritor único;
+    # devolve o que a operação devolver e repassa a exceção dela
+    app = current_app._get_current_object()
+    if app.config['GROUP_COMMIT']:
+        return get_escritor(app).submeter(operacao)
+
+    conn = db.get_db_connection()
+    try:
+        resultado = operacao(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return resultado
+
+
+def get_escritor(app=None):
+    app = app or current_app
+    return db.estado('escritor', lambda path: Escritor(app, path), app)
+
+
+def parar(app):
+    # Para as threads dos escritores (ex.: antes de trocar o DATABASE)
+    db.descartar(app, nome='escritor')
+
+
+def init_app(app):
+    app.config.setdefault('GROUP_COMMIT', os.environ.get('KANBAN_GROUP_COMMIT', '0') == '1')
+    # Quanto o escritor espera por mais operações depois da primeira do lote
+    app.config.setdefault('GROUP_COMMIT_JANELA_MS', float(os.environ.get('KANBAN_GROUP_COMMIT_JANELA_MS', 2)))
+    app.config.setdefault('GROUP_COMMIT_MAX_LOTE', int(os.environ.get('KANBAN_GROUP_COMMIT_MAX_LOTE', 256)))
@@ -0,0 +1,163 @@
+import collections
+import json
+import os
+import threading
+
+from flask import after_this_request, current_app, has_request_context
+
+import db
+
+# Feed de alterações do quadro. As rotas de escrita gravam o evento na
+# tabela eventos dentro da própria transação, então ele só aparece se o
+# commit acontecer. Em cada processo uma única thread vigia a tabela e
+# acorda os clientes de /eventos, que ficam parados numa Condition em vez
+# de consultar o banco cada um por conta própria (um vigia por arquivo de
+# banco no modo multiplanta).
+
+
+def publicar(conn, tipo, dados):
+    cursor = conn.execute(
+        'INSERT INTO eventos (tipo, dados) VALUES (?, ?)',
+        (tipo, json.dumps(dados, separators=(',', ':')))
+    )
+    evento_id = cursor.lastrowid
+
+    retencao = current_app.config['EVENTOS_RETENCAO']
+    if evento_id % 500 == 0:
+        conn.execute('DELETE FROM eventos WHERE id <= ?', (evento_id - retencao,))
+
+    # Depois do commit da rota, acorda o vigia sem esperar o próximo ciclo
+    if has_request_context():
+        broker = get_broker()
+
+        @after_this_request
+        def acordar(response):
+            broker.acordar()
+            return response
+    return evento_id
+
+
+def formatar(evento):
+    evento_id, tipo, dados = evento
+    return f'id: {evento_id}\nevent: {tipo}\ndata: {dados}\n\n'
+
+
+class Broker:
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self.intervalo = app.config['EVENTOS_INTERVALO']
+        self._recentes = collections.deque(maxlen=app.config['EVENTOS_MEMORIA'])
+        self._cond = threading.Condition()
+        self._acordar = threading.Event()
+        self._ultimo_id = None
+        self._assinantes = 0
+        self._thread = None
+        self._fechado = False
+
+    def _connect(self):
+        return db.connect(self.path, self.app.config['SQLITE_PRAGMAS'], readonly=True)
+
+    def _iniciar(self):
+        if self._thread is not None:
+            return
+        conn = self._connect()
+        try:
+            self._ultimo_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM eventos').fetchone()[0]
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._vigiar, name='eventos', daemon=True)
+        self._thread.start()
+
+    def _vigiar(self):
+        conn = self._connect()
+        while True:
+            self._acordar.wait(self.intervalo if self._assinantes else None)
+            self._acordar.clear()
+            if self._fechado:
+                conn.close()
+                return
+            try:
+                novos = conn.execute(
+                    'SELECT id, tipo, dados FROM eventos WHERE id > ? ORDER BY id LIMIT 1000',
+                    (self._ultimo_id,)
+                ).fetchall()
+            except Exception:
+                self.app.logger.exception('Falha ao ler eventos')
+                continue
+            if not novos:
+                continue
+            with self._cond:
+                self._recentes.extend(tuple(row) for row in novos)
+                self._ultimo_id = novos[-1][0]
+                self._cond.notify_all()
+            if len(novos) == 1000:
+                self._acordar.set()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def fechar(self):
+        # Planta saindo da memória: o vigia termina na próxima volta
+        self._fechado = True
+        self._acordar.set()
+
+    def assinar(self, desde=None, heartbeat=15):
+        # Gerador de mensagens SSE a partir do evento seguinte a `desde`
+        with self._cond:
+            self._iniciar()
+            self._assinantes += 1
+            ultimo = self._ultimo_id if desde is None else desde
+        self._acordar.set()
+        try:
+            # Primeira linha sai na hora para o servidor já enviar os headers
+            yield 'retry: 3000\n\n'
+            if ultimo < self._ultimo_id and not self._em_memoria(ultimo):
+                ultimo, mensagens = self._recuperar(ultimo)
+                yield from mensagens
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._ultimo_id > ultimo, heartbeat)
+                    pendentes = [e for e in self._recentes if e[0] > ultimo]
+                if not pendentes:
+                    yield ': ping\n\n'
+                    continue
+                for evento in pendentes:
+                    yield formatar(evento)
+                ultimo = pendentes[-1][0]
+        finally:
+            with self._cond:
+                self._assinantes -= 1
+
+    def _em_memoria(self, ultimo):
+        with self._cond:
+            return bool(self._recentes) and self._recentes[0][0] <= ultimo + 1
+
+    def _recuperar(self, ultimo):
+        # Cliente voltando de uma desconexão mais longa que a memória: lê
+        # do banco o que ainda existe ou pede para ele recarregar tudo
+        conn = self._connect()
+        try:
+            eventos = [tuple(row) for row in conn.execute(
+                'SELECT id, tipo, dados FROM eventos WHERE id > ? AND id <= ? ORDER BY id',
+                (ultimo, self._ultimo_id)
+            )]
+        finally:
+            conn.close()
+        if not eventos or eventos[0][0] > ultimo + 1:
+            return self._ultimo_id, [f'id: {self._ultimo_id}\nevent: reset\ndata: {{}}\n\n']
+        return eventos[-1][0], [formatar(e) for e in eventos]
+
+
+def get_broker():
+    app = current_app._get_current_object()
+    return db.estado('eventos', lambda path: Broker(app, path), app)
+
+
+def init_app(app):
+    # Eventos mantidos na tabela, para clientes retomarem com Last-Event-ID
+    app.config.setdefault('EVENTOS_RETENCAO', int(os.environ.get('KANBAN_EVENTOS_RETENCAO', 10000)))
+    # Eventos mantidos em memória para o fan-out
+    app.config.setdefault('EVENTOS_MEMORIA', 1000)
+    # Intervalo (s) com que o vigia olha a tabela por eventos de outros processos
+    app.config.setdefault('EVENTOS_INTERVALO', 0.5)
@@ -0,0 +1,117 @@
+import csv
+import io
+import tempfile
+import threading
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+import db
+import serializacao
+
+# Exportação das listas direto do cursor: as linhas saem em lotes de
+# fetchmany, dentro de um snapshot, e nunca ficam todas na memória. O CSV
+# vai para a resposta lote a lote; o XLSX usa o modo write-only do openpyxl
+# (as linhas vão para um arquivo temporário) e o .xlsx pronto é enviado em
+# pedaços a partir do disco, já que o zip só fecha no save().
+
+LOTE_LINHAS = 2000
+PEDACO_BYTES = 64 * 1024
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Exemplos dos templates de importação, na ordem das colunas
+TEMPLATES = {
+    'funcionarios': {
+        'nome': 'Nome do Funcionário',
+        'etapa': 'Nome da Etapa',
+        'producao_media': 100,
+    },
+    'produtos': {
+        'OS': 1001,
+        'produto': 'Nome do Produto',
+        'estampa': 'Descrição da Estampa',
+        'quantidade': 100,
+        'data_entrega': '2023-12-31',
+        'cliente_final': 'Nome do Cliente',
+        'etapa': 'Nome da Etapa',
+    },
+}
+
+_templates = {}
+_trava_templates = threading.Lock()
+
+
+def _lotes(conn, sql, params):
+    cursor = serializacao.cursor_tuplas(conn)
+    with db.snapshot(conn):
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(LOTE_LINHAS)
+            if not rows:
+                break
+            yield rows
+
+
+def gerar_csv(conn, colunas, sql, params):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow(colunas.chaves)
+    for rows in _lotes(conn, sql, params):
+        escritor.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _celula(valor):
+    # O openpyxl recusa caracteres de controle dentro do texto
+    if isinstance(valor, str) and ILLEGAL_CHARACTERS_RE.search(valor):
+        return ILLEGAL_CHARACTERS_RE.sub('', valor)
+    return valor
+
+
+def _planilha(linhas, titulo):
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet(titulo)
+    for row in linhas:
+        planilha.append([_celula(valor) for valor in row])
+    return workbook
+
+
+def gerar_xlsx(conn, colunas, sql, params, titulo):
+    def linhas():
+        yield colunas.chaves
+        for rows in _lotes(conn, sql, params):
+            yield from rows
+
+    with tempfile.TemporaryFile() as arquivo:
+        _planilha(linhas(), titulo).save(arquivo)
+        arquivo.seek(0)
+        while True:
+            pedaco = arquivo.read(PEDACO_BYTES)
+            if not pedaco:
+                break
+            yield pedaco
+
+
+def gerar(formato, conn, colunas, sql, params, titulo):
+    if formato == 'csv':
+        return gerar_csv(conn, colunas, sql, params)
+    return gerar_xlsx(conn, colunas, sql, params, titulo)
+
+
+def template(entidade):
+    # Gerado uma vez por processo e servido da memória
+    with _trava_templates:
+        if entidade not in _templates:
+            exemplo = TEMPLATES[entidade]
+            buffer = io.BytesIO()
+            _planilha([list(exemplo), list(exemplo.values())], 'Sheet1').save(buffer)
+            _templates[entidade] = buffer.getvalue()
+        return _templates[entidade]
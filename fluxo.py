@@ -0,0 +1,43 @@
+import catalogo
+
+# Fluxo das ordens pelo chão de fábrica (o mesmo de MAIN_STAGES e
+# PRODUCTION_SUB_STAGES em page.tsx)
+ETAPAS_PRINCIPAIS = ['OS no email', 'OS na fabrica', 'Producao', 'Embalagem', 'Romaneio']
+SUB_ETAPAS_PRODUCAO = ['Fechar fronha', 'Bainha lencol', 'Elastico', 'Cortar canto', 'Bainha fronha']
+
+ETAPA_PRODUCAO = 'Producao'
+ETAPA_APOS_PRODUCAO = 'Embalagem'
+
+
+def avancar_ordens_concluidas(conn, ordem_ids):
+    # Move para Embalagem as ordens em Producao que não têm mais tarefas em
+    # aberto. Roda na transação de quem alterou as tarefas; devolve a lista
+    # de (ordem_id, nova etapa_id) das ordens movidas.
+    ordem_ids = list(set(ordem_ids))
+    if not ordem_ids:
+        return []
+
+    etapas = catalogo.obter(conn)
+    producao_id = etapas.id_por_nome(ETAPA_PRODUCAO)
+    destino_id = etapas.id_por_nome(ETAPA_APOS_PRODUCAO)
+    if producao_id is None or destino_id is None:
+        return []
+
+    marcadores = ', '.join('?' * len(ordem_ids))
+    prontas = [row[0] for row in conn.execute(f'''
+        SELECT op.id
+        FROM ordem_producao op
+        JOIN ordem_tarefas_resumo r ON r.ordem_id = op.id
+        WHERE op.id IN ({marcadores})
+          AND op.etapa_id = ?
+          AND r.total > 0
+          AND r.abertas = 0
+    ''', (*ordem_ids, producao_id)).fetchall()]
+    if not prontas:
+        return []
+
+    marcadores = ', '.join('?' * len(prontas))
+    conn.execute(f'''
+        UPDATE ordem_producao SET etapa_id = ? WHERE id IN ({marcadores})
+    ''', (destino_id, *prontas))
+    return [(ordem_id, destino_id) for ordem_id in prontas]
@@ -0,0 +1,345 @@
+import contextlib
+import datetime
+import json
+import tempfile
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import catalogo
+import eventos
+import versao
+
+# Importação em lote das planilhas: etapas resolvidas pelo catálogo, OS
+# duplicadas encontradas com uma única consulta e as linhas válidas
+# inseridas com executemany numa só transação. As mensagens de erro por
+# linha são as mesmas do antigo loop com iterrows, com uma regra a mais: OS
+# e quantidade precisam ser inteiras e producao_media um número. O loop
+# gravava 'abc' ou 6.5 como texto/real nessas colunas, o que quebrava a
+# busca por OS e as contas de carga e de alocação; essas linhas agora
+# voltam como erro de tipo. producao_media fracionária continua aceita.
+
+COLUNAS_PRODUTOS = ['OS', 'produto', 'estampa', 'quantidade', 'data_entrega', 'etapa']
+COLUNAS_FUNCIONARIOS = ['nome', 'etapa', 'producao_media']
+
+INSERT_PRODUTO = '''
+    INSERT INTO ordem_producao (OS, produto, estampa, quantidade, data_entrega, cliente_final, etapa_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_FUNCIONARIO = '''
+    INSERT INTO funcionarios (nome, etapa_id, producao_media)
+    VALUES (?, ?, ?)
+'''
+
+# Acima disso um upload cru de XLSX vai para disco (o formato zip exige seek)
+LIMITE_XLSX_EM_MEMORIA = 8 * 1024 * 1024
+
+
+class ColunasFaltando(Exception):
+    pass
+
+
+def verificar_colunas(df, colunas):
+    if not all(col in df.columns for col in colunas):
+        raise ColunasFaltando(', '.join(colunas))
+
+
+def ler_planilha(stream, extensao):
+    if extensao == 'csv':
+        return pd.read_csv(stream)
+    return pd.read_excel(stream)
+
+
+def ler_em_lotes(stream, extensao, tamanho_lote):
+    # Gera DataFrames de no máximo tamanho_lote linhas sem carregar o
+    # arquivo inteiro: CSV com o leitor em chunks do pandas e XLSX com o
+    # iterador de linhas do openpyxl em modo read-only
+    if extensao == 'csv':
+        yield from pd.read_csv(stream, chunksize=tamanho_lote)
+    elif extensao == 'xlsx':
+        yield from _ler_xlsx_em_lotes(stream, tamanho_lote)
+    else:
+        # .xls não tem leitor incremental; lê uma vez e fatia
+        df = pd.read_excel(stream)
+        for inicio in range(0, len(df), tamanho_lote):
+            yield df.iloc[inicio:inicio + tamanho_lote]
+
+
+def _ler_xlsx_em_lotes(stream, tamanho_lote):
+    if not _seekable(stream):
+        copia = tempfile.SpooledTemporaryFile(max_size=LIMITE_XLSX_EM_MEMORIA)
+        while True:
+            bloco = stream.read(1024 * 1024)
+            if not bloco:
+                break
+            copia.write(bloco)
+        copia.seek(0)
+        stream = copia
+
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        linhas = workbook.active.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        colunas = [str(c) if c is not None else f'Unnamed: {i}' for i, c in enumerate(cabecalho)]
+        lote = []
+        for linha in linhas:
+            if all(v is None for v in linha):
+                continue
+            # Como o read_excel do pandas: número inteiro guardado como
+            # float (7.0) volta a ser int
+            lote.append(tuple(int(v) if isinstance(v, float) and v.is_integer() else v for v in linha))
+            if len(lote) == tamanho_lote:
+                yield pd.DataFrame(lote, columns=colunas)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, columns=colunas)
+    finally:
+        workbook.close()
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except AttributeError:
+        return False
+
+
+def resolver_etapas(conn, serie):
+    # Nome -> id pelo catálogo em memória; nome desconhecido vira NaN
+    por_nome = catalogo.obter(conn).por_nome
+    return serie.astype(object).map(por_nome).astype('float64')
+
+
+def os_existentes(conn, numeros):
+    # Uma consulta só, qualquer que seja o tamanho da planilha. A OS de uma
+    # ordem arquivada também conta: repetida, a ordem não poderia voltar
+    valores = np.unique(numeros.to_numpy(dtype='int64'))
+    if not len(valores):
+        return set()
+    rows = conn.execute('''
+        SELECT OS FROM ordem_producao WHERE OS IN (SELECT value FROM json_each(?))
+        UNION ALL
+        SELECT OS FROM ordem_producao_arquivo WHERE OS IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(valores.tolist()),) * 2).fetchall()
+    return {row[0] for row in rows}
+
+
+def validar_inteiros(serie):
+    numeros = pd.to_numeric(serie, errors='coerce')
+    validos = numeros.notna() & np.isfinite(numeros) & (numeros == np.floor(numeros))
+    return numeros, validos
+
+
+def texto_data(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime('%Y-%m-%d').astype(object)
+    return serie.map(lambda v: v.strftime('%Y-%m-%d') if isinstance(v, datetime.date) else v)
+
+
+def nativos(serie):
+    # Converte para tipos do Python (sqlite3 não aceita escalares do numpy)
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def numeros_nativos(serie):
+    # Inteiros continuam inteiros; só o que tem fração vai como float
+    return [int(v) if v == int(v) else v for v in pd.to_numeric(serie).astype('float64').tolist()]
+
+
+def _erros_de_tipo(df, tabela, obrigatorias, inteiras, numericas=()):
+    # Mensagem do primeiro problema de cada linha, no formato do SQLite
+    mensagens = pd.Series(None, index=df.index, dtype=object)
+    for coluna in reversed(obrigatorias):
+        if coluna in inteiras or coluna in numericas:
+            numeros, validos = validar_inteiros(df[coluna])
+            if coluna in numericas:
+                validos = numeros.notna() & np.isfinite(numeros)
+            invalidos = df[coluna].notna() & ~validos
+            mensagens[invalidos] = [
+                f"datatype mismatch: {tabela}.{coluna} = '{v}'" for v in df.loc[invalidos, coluna]
+            ]
+        faltando = df[coluna].isna()
+        mensagens[faltando] = f'NOT NULL constraint failed: {tabela}.{coluna}'
+    return mensagens
+
+
+def _inserir(conn, sql, linhas, posicoes, mensagem_erro):
+    # executemany num savepoint; se alguma linha falhar, refaz linha a linha
+    # para atribuir o erro à linha certa
+    erros = {}
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    conn.execute('SAVEPOINT importacao')
+    try:
+        conn.executemany(sql, linhas)
+        conn.execute('RELEASE importacao')
+        if linhas:
+            versao.bump(conn)
+        return len(linhas), erros
+    except Exception:
+        conn.execute('ROLLBACK TO importacao')
+        conn.execute('RELEASE importacao')
+
+    inseridos = 0
+    for pos, linha in zip(posicoes, linhas):
+        try:
+            conn.execute(sql, linha)
+            inseridos += 1
+        except Exception as e:
+            erros[pos] = mensagem_erro(pos, e)
+    if inseridos:
+        versao.bump(conn)
+    return inseridos, erros
+
+
+def importar_produtos(conn, df):
+    df = df.reset_index(drop=True)
+    posicoes = np.arange(len(df))
+
+    os_num, os_valido = validar_inteiros(df['OS'])
+    ja_no_banco = os_valido & os_num.isin(os_existentes(conn, os_num[os_valido]))
+
+    etapa_id = resolver_etapas(conn, df['etapa'])
+    etapa_ok = etapa_id.notna()
+
+    erro_tipo = _erros_de_tipo(
+        df, 'ordem_producao',
+        ['OS', 'produto', 'estampa', 'quantidade', 'data_entrega'],
+        {'OS', 'quantidade'},
+    )
+    candidato = ~ja_no_banco & etapa_ok & erro_tipo.isna()
+
+    # Uma OS repetida na planilha conta como existente a partir da primeira
+    # linha dela que seria de fato inserida
+    primeira = pd.Series(posicoes[candidato]).groupby(os_num[candidato].to_numpy()).min()
+    primeira_da_os = os_num.map(primeira)
+    repetida = ~ja_no_banco & primeira_da_os.notna() & (posicoes > primeira_da_os)
+
+    existente = ja_no_banco | repetida
+    inserir = candidato & ~repetida
+
+    erros = {}
+    for pos in np.flatnonzero(existente):
+        erros[pos] = f"OS '{int(os_num.iat[pos])}' já existe no sistema. Não é possível duplicar."
+    for pos in np.flatnonzero(~existente & ~etapa_ok):
+        erros[pos] = f"Etapa '{df.at[pos, 'etapa']}' não encontrada para produto '{df.at[pos, 'produto']}'"
+    for pos in np.flatnonzero(~existente & etapa_ok & erro_tipo.notna()):
+        erros[pos] = f"Erro ao inserir produto '{df.at[pos, 'produto']}': {erro_tipo[pos]}"
+
+    validos = df[inserir]
+    if 'cliente_final' in df.columns:
+        cliente_final = validos['cliente_final'].fillna('')
+    else:
+        cliente_final = pd.Series('', index=validos.index)
+    linhas = list(zip(
+        os_num[inserir].astype('int64').tolist(),
+        nativos(validos['produto']),
+        nativos(validos['estampa']),
+        pd.to_numeric(validos['quantidade']).astype('int64').tolist(),
+        nativos(texto_data(validos['data_entrega'])),
+        nativos(cliente_final),
+        etapa_id[inserir].astype('int64').tolist(),
+    ))
+
+    inseridos, erros_insert = _inserir(
+        conn, INSERT_PRODUTO, linhas, np.flatnonzero(inserir),
+        lambda pos, e: f"Erro ao inserir produto '{df.at[pos, 'produto']}': {str(e)}",
+    )
+    if inseridos:
+        eventos.publicar(conn, 'produtos_importados', {'quantidade': inseridos})
+    erros.update(erros_insert)
+    return inseridos, [erros[pos] for pos in sorted(erros)]
+
+
+def importar_funcionarios(conn, df):
+    df = df.reset_index(drop=True)
+
+    etapa_id = resolver_etapas(conn, df['etapa'])
+    etapa_ok = etapa_id.notna()
+    erro_tipo = _erros_de_tipo(df, 'funcionarios', ['nome', 'producao_media'], set(), {'producao_media'})
+    inserir = etapa_ok & erro_tipo.isna()
+
+    erros = {}
+    for pos in np.flatnonzero(~etapa_ok):
+        erros[pos] = f"Etapa '{df.at[pos, 'etapa']}' não encontrada para funcionário '{df.at[pos, 'nome']}'"
+    for pos in np.flatnonzero(etapa_ok & erro_tipo.notna()):
+        erros[pos] = f"Erro ao inserir funcionário '{df.at[pos, 'nome']}': {erro_tipo[pos]}"
+
+    validos = df[inserir]
+    linhas = list(zip(
+        nativos(validos['nome']),
+        etapa_id[inserir].astype('int64').tolist(),
+        numeros_nativos(validos['producao_media']),
+    ))
+
+    inseridos, erros_insert = _inserir(
+        conn, INSERT_FUNCIONARIO, linhas, np.flatnonzero(inserir),
+        lambda pos, e: f"Erro ao inserir funcionário '{df.at[pos, 'nome']}': {str(e)}",
+    )
+    if inseridos:
+        eventos.publicar(conn, 'funcionarios_importados', {'quantidade': inseridos})
+    erros.update(erros_insert)
+    return inseridos, [erros[pos] for pos in sorted(erros)]
+
+
+def limitar_erros(erros, max_erros):
+    # Primeiras max_erros mensagens e quantas ficaram de fora
+    if max_erros is None or len(erros) <= max_erros:
+        return erros, 0
+    return erros[:max_erros], len(erros) - max_erros
+
+
+def importar_em_lotes(conn, lotes, colunas, importar_lote, trava=None, progresso=None, max_erros=None):
+    # Valida e grava lote a lote, com um commit por lote: a memória fica
+    # limitada pelo tamanho do lote, não pelo tamanho do arquivo. Das
+    # mensagens de erro só as primeiras max_erros são guardadas; as outras
+    # são só contadas.
+    inicio = time.perf_counter()
+    processadas = inseridas = omitidos = 0
+    erros = []
+    for lote in lotes:
+        verificar_colunas(lote, colunas)
+        with trava or contextlib.nullcontext():
+            n, erros_lote = importar_lote(conn, lote)
+            conn.commit()
+        processadas += len(lote)
+        inseridas += n
+        restantes = None if max_erros is None else max_erros - len(erros)
+        erros_lote, omitidos_lote = limitar_erros(erros_lote, restantes)
+        erros.extend(erros_lote)
+        omitidos += omitidos_lote
+        if progresso:
+            progresso(len(lote), n, erros_lote, omitidos_lote)
+    return {
+        'inseridas': inseridas,
+        'erros': erros,
+        'erros_omitidos': omitidos,
+        'linhas_processadas': processadas,
+        'linhas_rejeitadas': processadas - inseridas,
+        'tempo_segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def contar_linhas(arquivo, extensao):
+    # Total aproximado de linhas de dados, para o progresso dos jobs
+    try:
+        if extensao == 'csv':
+            linhas = 0
+            for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+                linhas += bloco.count(b'\n')
+            return max(linhas - 1, 0)
+        if extensao == 'xlsx':
+            workbook = openpyxl.load_workbook(arquivo, read_only=True)
+            try:
+                max_row = workbook.active.max_row
+            finally:
+                workbook.close()
+            return max(max_row - 1, 0) if max_row else None
+        return None
+    finally:
+        arquivo.seek(0)
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+import eventos
+import importacao
+import metricas
+import plantas
+from db import get_db_connection
+
+# Uploads acima disso vão para disco enquanto esperam na fila
+LIMITE_UPLOAD_EM_MEMORIA = 8 * 1024 * 1024
+
+
+class ImportJob:
+    def __init__(self, entidade, extensao):
+        self.id = uuid.uuid4().hex
+        self.entidade = entidade
+        self.extensao = extensao
+        self.estado = 'na_fila'
+        self.total = None
+        self.processadas = 0
+        self.inseridas = 0
+        self.erros = []
+        self.erros_omitidos = 0
+        self.erro = None
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.finalizado_em = None
+
+    @property
+    def finalizado(self):
+        return self.estado in ('concluido', 'falhou')
+
+    def to_dict(self):
+        fim = self.finalizado_em or time.time()
+        duracao = fim - self.iniciado_em if self.iniciado_em else 0
+        return {
+            'id': self.id,
+            'entidade': self.entidade,
+            'estado': self.estado,
+            'progresso': {
+                'linhas_processadas': self.processadas,
+                'total': self.total
+            },
+            'linhas_inseridas': self.inseridas,
+            'linhas_rejeitadas': self.processadas - self.inseridas,
+            'linhas_por_segundo': round(self.processadas / duracao, 1) if duracao > 0 else 0,
+            'tempo_segundos': round(duracao, 3),
+            'message': (f'{self.inseridas} {self.entidade} importados com sucesso'
+                        if self.estado == 'concluido' else None),
+            'error': self.erro,
+            'errors': list(self.erros),
+            'erros_omitidos': self.erros_omitidos
+        }
+
+
+# Fila de importações: o upload é copiado para um arquivo temporário e
+# processado por um pool de threads, então a requisição volta na hora e o
+# job continua mesmo se o cliente desconectar. A trava de escrita impede
+# que dois jobs intercalem lotes (e verificações de OS) um do outro.
+class JobManager:
+    def __init__(self, app, workers, retencao):
+        self.app = app
+        self.retencao = retencao
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='importacao')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.trava_escrita = threading.Lock()
+
+    def submit(self, stream, extensao, entidade, colunas, importar_lote, tamanho_lote):
+        arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_UPLOAD_EM_MEMORIA)
+        shutil.copyfileobj(stream, arquivo)
+        arquivo.seek(0)
+
+        job = ImportJob(entidade, extensao)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, plantas.atual(), arquivo, colunas, importar_lote, tamanho_lote)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        limite = time.time() - self.retencao
+        vencidos = [job_id for job_id, job in self._jobs.items()
+                    if job.finalizado and job.finalizado_em < limite]
+        for job_id in vencidos:
+            del self._jobs[job_id]
+
+    def _progresso(self, job):
+        def atualizar(processadas, inseridas, erros, omitidos):
+            with self._lock:
+                job.processadas += processadas
+                job.inseridas += inseridas
+                job.erros.extend(erros)
+                job.erros_omitidos += omitidos
+        return atualizar
+
+    def _run(self, job, planta, arquivo, colunas, importar_lote, tamanho_lote):
+        job.iniciado_em = time.time()
+        job.estado = 'executando'
+        estado = 'falhou'
+        try:
+            with self.app.app_context():
+                # O job segura a planta de quem o enviou aberta até acabar
+                plantas.abrir(planta)
+                job.total = importacao.contar_linhas(arquivo, job.extensao)
+                conn = get_db_connection()
+                with metricas.importacao(job.entidade, 'job') as medicao:
+                    resultado = importacao.importar_em_lotes(
+                        conn,
+                        importacao.ler_em_lotes(arquivo, job.extensao, tamanho_lote),
+                        colunas,
+                        importar_lote,
+                        trava=self.trava_escrita,
+                        progresso=self._progresso(job),
+                        max_erros=self.app.config['IMPORT_MAX_ERRORS'],
+                    )
+                    medicao.linhas(resultado['linhas_processadas'], resultado['inseridas'])
+                eventos.publicar(conn, 'importacao_concluida', {
+                    'entidade': job.entidade,
+                    'inseridas': resultado['inseridas'],
+                    'rejeitadas': resultado['linhas_rejeitadas'],
+                    'job_id': job.id
+                })
+                conn.commit()
+                eventos.get_broker().acordar()
+            estado = 'concluido'
+        except importacao.ColunasFaltando as e:
+            job.erro = f'O arquivo deve conter as colunas: {e}'
+        except Exception as e:
+            job.erro = f'Erro ao processar o arquivo: {str(e)}'
+        finally:
+            arquivo.close()
+            job.finalizado_em = time.time()
+            job.estado = estado
+
+
+def get_manager():
+    return current_app.extensions['kanban_jobs']
+
+
+def init_app(app):
+    app.config.setdefault('IMPORT_JOB_WORKERS', int(os.environ.get('KANBAN_IMPORT_JOB_WORKERS', 2)))
+    # Segundos que um job finalizado continua consultável
+    app.config.setdefault('IMPORT_JOB_RETENTION', int(os.environ.get('KANBAN_IMPORT_JOB_RETENTION', 3600)))
+    app.extensions['kanban_jobs'] = JobManager(
+        app,
+        workers=app.config['IMPORT_JOB_WORKERS'],
+        retencao=app.config['IMPORT_JOB_RETENTION'],
+    )
@@ -0,0 +1,407 @@
+import bisect
+import contextlib
+import functools
+import os
+import re
+import threading
+import time
+
+from flask import Response, current_app, g, request
+
+import plantas
+
+# Métricas no formato texto do Prometheus (GET /metrics), sem dependência
+# externa: latência e contagem por rota, quantidade e tempo de SQL por
+# requisição (medidos numa casca em volta da conexão de get_db_connection),
+# log de consultas lentas e vazão das importações. KANBAN_METRICS=0 desliga
+# tudo: nem os hooks nem a casca da conexão são instalados.
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_COMANDOS = (1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+# nome -> (tipo, ajuda, buckets)
+METRICAS = {
+    'kanban_http_requests_total': (
+        'counter', 'Requisições atendidas por rota, método e status.', None),
+    'kanban_http_request_duration_seconds': (
+        'histogram', 'Tempo total da requisição, incluindo serialização e compressão.', BUCKETS_SEGUNDOS),
+    'kanban_http_request_sql_seconds': (
+        'histogram', 'Tempo gasto no SQLite por requisição (execute + fetch).', BUCKETS_SEGUNDOS),
+    'kanban_http_request_sql_statements': (
+        'histogram', 'Comandos SQL executados por requisição.', BUCKETS_COMANDOS),
+    'kanban_sql_slow_queries_total': (
+        'counter', 'Comandos SQL acima de SQL_SLOW_QUERY_MS.', None),
+    'kanban_imports_total': (
+        'counter', 'Importações concluídas por entidade e modo.', None),
+    'kanban_import_rows_total': (
+        'counter', 'Linhas importadas por entidade, modo e resultado.', None),
+    'kanban_import_seconds_total': (
+        'counter', 'Tempo total das importações.', None),
+    'kanban_import_sql_seconds_total': (
+        'counter', 'Parte do tempo das importações gasta no SQLite.', None),
+}
+
+
+class Registro:
+    # Contadores e histogramas em memória, por conjunto de labels; um lock
+    # só, segurado pelo tempo de uma soma
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+
+    def contar(self, nome, valor=1, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **labels):
+        buckets = METRICAS[nome][2]
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histograma[0][bisect.bisect_left(buckets, valor)] += 1
+            histograma[1] += valor
+            histograma[2] += 1
+
+    def exportar(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {chave: ([*h[0]], h[1], h[2]) for chave, h in self._histogramas.items()}
+
+        linhas = []
+        for nome, (tipo, ajuda, buckets) in METRICAS.items():
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+            if tipo == 'counter':
+                for (metrica, labels), valor in sorted(contadores.items()):
+                    if metrica == nome:
+                        linhas.append(f'{nome}{_labels(labels)} {_numero(valor)}')
+                continue
+            for (metrica, labels), (contagens, soma, total) in sorted(histogramas.items()):
+                if metrica != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip((*buckets, '+Inf'), contagens):
+                    acumulado += contagem
+                    le = limite if limite == '+Inf' else _numero(limite)
+                    linhas.append(f'{nome}_bucket{_labels(labels + (("le", le),))} {acumulado}')
+                linhas.append(f'{nome}_sum{_labels(labels)} {_numero(soma)}')
+                linhas.append(f'{nome}_count{_labels(labels)} {total}')
+        return '\n'.join(linhas) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pares = ','.join(
+        '{}="{}"'.format(chave, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for chave, valor in labels
+    )
+    return '{' + pares + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def get_registro(app=None):
+    return (app or current_app).extensions['kanban_metricas']
+
+
+def ativo(app=None):
+    return (app or current_app).config['METRICS_ENABLED']
+
+
+# --- SQL ---
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ESPACOS = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=256)
+def normalizar_sql(sql):
+    # Literais viram ?, listas de ? viram uma só e o espaço em branco é
+    # colapsado: a mesma consulta sempre sai com o mesmo texto no log
+    sql = _LITERAIS.sub('?', sql)
+    sql = _LISTAS.sub('(?, ...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+class EstatisticasSQL:
+    # Acumulado do app context (uma requisição ou um job de importação)
+    def __init__(self, app):
+        self.comandos = 0
+        self.segundos = 0.0
+        limite = app.config['SQL_SLOW_QUERY_MS']
+        self.limite = limite / 1000 if limite else None
+        self.registro = get_registro(app)
+        self.logger = app.logger
+
+
+def _estatisticas():
+    if '_kanban_sql' not in g:
+        g._kanban_sql = EstatisticasSQL(current_app)
+    return g._kanban_sql
+
+
+def _tamanho(parametros):
+    try:
+        return len(parametros)
+    except TypeError:
+        return '?'
+
+
+class _Cursor:
+    # Mede execute/executemany e os fetch (é neles que o SQLite anda pelas
+    # linhas de um SELECT). O comando "termina" no fim das linhas, no
+    # próximo execute ou quando o cursor é descartado; aí entra no log de
+    # lentas se passou do limite.
+    __slots__ = ('_cursor', '_estatisticas', '_sql', '_parametros', '_segundos')
+
+    def __init__(self, cursor, estatisticas):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_estatisticas', estatisticas)
+        object.__setattr__(self, '_sql', None)
+        object.__setattr__(self, '_parametros', 0)
+        object.__setattr__(self, '_segundos', 0.0)
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __setattr__(self, nome, valor):
+        # row_factory e afins vão para o cursor de verdade
+        setattr(self._cursor, nome, valor)
+
+    def _iniciar(self, sql, parametros):
+        self._concluir()
+        object.__setattr__(self, '_sql', sql)
+        object.__setattr__(self, '_parametros', parametros)
+        self._estatisticas.comandos += 1
+
+    def _medir(self, inicio):
+        segundos = time.perf_counter() - inicio
+        object.__setattr__(self, '_segundos', self._segundos + segundos)
+        self._estatisticas.segundos += segundos
+
+    def _concluir(self):
+        sql = self._sql
+        if sql is None:
+            return
+        estatisticas = self._estatisticas
+        if estatisticas.limite is not None and self._segundos >= estatisticas.limite:
+            estatisticas.registro.contar('kanban_sql_slow_queries_total')
+            estatisticas.logger.warning(
+                'SQL lento: %.1f ms, %s parâmetros: %s',
+                self._segundos * 1000, self._parametros, normalizar_sql(sql)
+            )
+        object.__setattr__(self, '_sql', None)
+        object.__setattr__(self, '_segundos', 0.0)
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql, _tamanho(parametros))
+        inicio = time.perf_counter()
+        try:
+            self._cursor.execute(sql, parametros)
+        finally:
+            self._medir(inicio)
+        return self
+
+    def executemany(self, sql, parametros):
+        if hasattr(parametros, '__len__'):
+            self._iniciar(sql, f'{len(parametros)} x {_tamanho(parametros[0]) if parametros else 0}')
+        else:
+            self._iniciar(sql, '?')
+        inicio = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, parametros)
+        finally:
+            self._medir(inicio)
+        return self
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._medir(inicio)
+        if row is None:
+            self._concluir()
+        return row
+
+    def fetchmany(self, *args):
+        inicio = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._medir(inicio)
+        if not rows:
+            self._concluir()
+        return rows
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._medir(inicio)
+        self._concluir()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        except StopIteration:
+            self._medir(inicio)
+            self._concluir()
+            raise
+        self._medir(inicio)
+        return row
+
+    def close(self):
+        self._concluir()
+        self._cursor.close()
+
+    def __del__(self):
+        try:
+            self._concluir()
+        except Exception:
+            pass
+
+
+class Conexao:
+    # Casca da conexão do pool: o resto do código continua vendo a API do
+    # sqlite3 (commit, rollback, in_transaction, row_factory...)
+    __slots__ = ('_conn', '_estatisticas')
+
+    def __init__(self, conn, estatisticas):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_estatisticas', estatisticas)
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def __setattr__(self, nome, valor):
+        setattr(self._conn, nome, valor)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self, *args):
+        return _Cursor(self._conn.cursor(*args), self._estatisticas)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def executescript(self, script):
+        cursor = self.cursor()
+        cursor._iniciar(script, 0)
+        inicio = time.perf_counter()
+        try:
+            cursor._cursor.executescript(script)
+        finally:
+            cursor._medir(inicio)
+        return cursor
+
+
+def envolver_conexao(conn):
+    return Conexao(conn, _estatisticas())
+
+
+# --- Requisições ---
+
+def _rota():
+    return request.url_rule.rule if request.url_rule is not None else 'nao_encontrada'
+
+
+def _registrar_requisicao(status):
+    inicio = g.pop('_kanban_inicio', None)
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    registro = get_registro()
+    rota, metodo = _rota(), request.method
+    registro.contar('kanban_http_requests_total', rota=rota, metodo=metodo, status=status)
+    registro.observar('kanban_http_request_duration_seconds', duracao, rota=rota, metodo=metodo)
+    estatisticas = g.get('_kanban_sql')
+    comandos, segundos = (estatisticas.comandos, estatisticas.segundos) if estatisticas else (0, 0.0)
+    registro.observar('kanban_http_request_sql_seconds', segundos, rota=rota, metodo=metodo)
+    registro.observar('kanban_http_request_sql_statements', comandos, rota=rota, metodo=metodo)
+
+
+def _antes():
+    g._kanban_inicio = time.perf_counter()
+
+
+def _depois(response):
+    _registrar_requisicao(response.status_code)
+    return response
+
+
+def _teardown(exc=None):
+    # Exceção não tratada: o after_request não roda
+    if exc is not None:
+        _registrar_requisicao(500)
+
+
+# --- Importações ---
+
+class MedicaoImportacao:
+    def __init__(self):
+        self.processadas = 0
+        self.inseridas = 0
+
+    def linhas(self, processadas, inseridas):
+        self.processadas = processadas
+        self.inseridas = inseridas
+
+
+@contextlib.contextmanager
+def importacao(entidade, modo):
+    # Em volta de uma importação inteira (dentro de um app context): conta
+    # linhas inseridas/rejeitadas, tempo total e quanto dele foi SQLite; o
+    # resto é leitura da planilha (pandas) e validação
+    medicao = MedicaoImportacao()
+    if not ativo():
+        yield medicao
+        return
+    estatisticas = _estatisticas()
+    sql_antes = estatisticas.segundos
+    inicio = time.perf_counter()
+    yield medicao
+    registro = get_registro()
+    registro.contar('kanban_imports_total', entidade=entidade, modo=modo)
+    registro.contar('kanban_import_rows_total', medicao.inseridas,
+                    entidade=entidade, modo=modo, resultado='inserida')
+    registro.contar('kanban_import_rows_total', medicao.processadas - medicao.inseridas,
+                    entidade=entidade, modo=modo, resultado='rejeitada')
+    registro.contar('kanban_import_seconds_total', time.perf_counter() - inicio, entidade=entidade, modo=modo)
+    registro.contar('kanban_import_sql_seconds_total', estatisticas.segundos - sql_antes,
+                    entidade=entidade, modo=modo)
+
+
+def exportar():
+    return Response(get_registro().exportar(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('KANBAN_METRICS', '1') != '0')
+    # Comandos que levam mais que isso (ms) vão para o log; 0 desliga o log
+    app.config.setdefault('SQL_SLOW_QUERY_MS', float(os.environ.get('KANBAN_SQL_SLOW_QUERY_MS', 100)))
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['kanban_metricas'] = Registro()
+    app.extensions['kanban_db_envoltorio'] = envolver_conexao
+    app.before_request(_antes)
+    app.after_request(_depois)
+    app.teardown_request(_teardown)
+    # O registro é do processo, somando todas as plantas
+    app.add_url_rule('/metrics', 'metricas', plantas.sem_planta(exportar))
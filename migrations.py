@@ -0,0 +1,537 @@
+import click
+from flask.cli import with_appcontext
+
+from db import get_db_connection
+from versao import PROXIMA_VERSAO
+
+
+class MigrationError(Exception):
+    pass
+
+
+# A versão do schema fica em PRAGMA user_version. Cada migração recebe um
+# cursor dentro de uma transação e só é marcada como aplicada se terminar.
+MIGRATIONS = []
+
+
+def migration(versao):
+    def registrar(func):
+        MIGRATIONS.append((versao, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return registrar
+
+
+@migration(1)
+def indices_consultas_principais(cursor):
+    duplicadas = cursor.execute('''
+        SELECT OS FROM ordem_producao GROUP BY OS HAVING COUNT(*) > 1
+    ''').fetchall()
+    if duplicadas:
+        lista = ', '.join(str(row['OS']) for row in duplicadas)
+        raise MigrationError(f'Não é possível tornar OS única: OS duplicadas no banco ({lista})')
+
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ordem_producao_os ON ordem_producao(OS)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ordem_producao_etapa ON ordem_producao(etapa_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_ordem ON tarefas(ordem_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_etapa_status ON tarefas(etapa_id, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_funcionarios_etapa ON funcionarios(etapa_id)')
+
+
+@migration(2)
+def versao_dados(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS versao_dados (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            versao INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO versao_dados (id, versao) VALUES (1, 0)')
+
+
+@migration(3)
+def resumo_tarefas_por_ordem(cursor):
+    # Total e tarefas em aberto por ordem, mantidos por triggers, para o
+    # avanço automático não precisar varrer as tarefas da ordem
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ordem_tarefas_resumo (
+            ordem_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            abertas INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_tarefas_insert
+        AFTER INSERT ON tarefas
+        BEGIN
+            INSERT OR IGNORE INTO ordem_tarefas_resumo (ordem_id) VALUES (NEW.ordem_id);
+            UPDATE ordem_tarefas_resumo
+            SET total = total + 1,
+                abertas = abertas + (COALESCE(NEW.status, '') != 'concluido')
+            WHERE ordem_id = NEW.ordem_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_tarefas_delete
+        AFTER DELETE ON tarefas
+        BEGIN
+            UPDATE ordem_tarefas_resumo
+            SET total = total - 1,
+                abertas = abertas - (COALESCE(OLD.status, '') != 'concluido')
+            WHERE ordem_id = OLD.ordem_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_tarefas_update
+        AFTER UPDATE OF status, ordem_id ON tarefas
+        BEGIN
+            UPDATE ordem_tarefas_resumo
+            SET total = total - 1,
+                abertas = abertas - (COALESCE(OLD.status, '') != 'concluido')
+            WHERE ordem_id = OLD.ordem_id;
+            INSERT OR IGNORE INTO ordem_tarefas_resumo (ordem_id) VALUES (NEW.ordem_id);
+            UPDATE ordem_tarefas_resumo
+            SET total = total + 1,
+                abertas = abertas + (COALESCE(NEW.status, '') != 'concluido')
+            WHERE ordem_id = NEW.ordem_id;
+        END
+    ''')
+    cursor.execute('DELETE FROM ordem_tarefas_resumo')
+    cursor.execute('''
+        INSERT INTO ordem_tarefas_resumo (ordem_id, total, abertas)
+        SELECT ordem_id, COUNT(*), SUM(COALESCE(status, '') != 'concluido')
+        FROM tarefas
+        GROUP BY ordem_id
+    ''')
+
+
+@migration(4)
+def tabela_eventos(cursor):
+    # Feed de alterações para /eventos; o id é o Last-Event-ID do SSE
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            criado_em TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# Tabelas acompanhadas por /sync: cada linha guarda a versão de dados em que
+# mudou pela última vez e cada delete deixa um registro em remocoes
+TABELAS_SINCRONIZADAS = ('ordem_producao', 'tarefas', 'funcionarios')
+
+
+@migration(5)
+def versao_por_linha(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS remocoes (
+            tabela TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            versao INTEGER NOT NULL,
+            PRIMARY KEY (tabela, registro_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_remocoes_versao ON remocoes(versao)')
+
+    atual = cursor.execute('SELECT versao FROM versao_dados WHERE id = 1').fetchone()[0]
+    for tabela in TABELAS_SINCRONIZADAS:
+        cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN versao INTEGER NOT NULL DEFAULT 0')
+        cursor.execute(f'UPDATE {tabela} SET versao = ?', (atual,))
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_versao ON {tabela}(versao)')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_versao_insert
+            AFTER INSERT ON {tabela}
+            BEGIN
+                UPDATE {tabela} SET versao = {PROXIMA_VERSAO} WHERE id = NEW.id;
+                DELETE FROM remocoes WHERE tabela = '{tabela}' AND registro_id = NEW.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_versao_update
+            AFTER UPDATE ON {tabela}
+            WHEN NEW.versao IS OLD.versao
+            BEGIN
+                UPDATE {tabela} SET versao = {PROXIMA_VERSAO} WHERE id = NEW.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_versao_delete
+            AFTER DELETE ON {tabela}
+            BEGIN
+                INSERT OR REPLACE INTO remocoes (tabela, registro_id, versao)
+                VALUES ('{tabela}', OLD.id, {PROXIMA_VERSAO});
+            END
+        ''')
+
+
+
+@migration(6)
+def carga_aberta_por_ordem(cursor):
+    # Quantidade das tarefas em aberto por (ordem, etapa), mantida por
+    # triggers, para a previsão de entrega não precisar varrer as tarefas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ordem_carga_aberta (
+            ordem_id INTEGER NOT NULL,
+            etapa_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (ordem_id, etapa_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_carga_insert
+        AFTER INSERT ON tarefas
+        WHEN COALESCE(NEW.status, '') != 'concluido'
+        BEGIN
+            INSERT OR IGNORE INTO ordem_carga_aberta (ordem_id, etapa_id) VALUES (NEW.ordem_id, NEW.etapa_id);
+            UPDATE ordem_carga_aberta
+            SET quantidade = quantidade + COALESCE(NEW.quantidade, 0)
+            WHERE ordem_id = NEW.ordem_id AND etapa_id = NEW.etapa_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_carga_delete
+        AFTER DELETE ON tarefas
+        WHEN COALESCE(OLD.status, '') != 'concluido'
+        BEGIN
+            UPDATE ordem_carga_aberta
+            SET quantidade = quantidade - COALESCE(OLD.quantidade, 0)
+            WHERE ordem_id = OLD.ordem_id AND etapa_id = OLD.etapa_id;
+            DELETE FROM ordem_carga_aberta
+            WHERE ordem_id = OLD.ordem_id AND etapa_id = OLD.etapa_id AND quantidade = 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_carga_update
+        AFTER UPDATE OF status, quantidade, ordem_id, etapa_id ON tarefas
+        BEGIN
+            UPDATE ordem_carga_aberta
+            SET quantidade = quantidade - COALESCE(OLD.quantidade, 0)
+            WHERE ordem_id = OLD.ordem_id AND etapa_id = OLD.etapa_id
+              AND COALESCE(OLD.status, '') != 'concluido';
+            DELETE FROM ordem_carga_aberta
+            WHERE ordem_id = OLD.ordem_id AND etapa_id = OLD.etapa_id AND quantidade = 0;
+            INSERT OR IGNORE INTO ordem_carga_aberta (ordem_id, etapa_id)
+            SELECT NEW.ordem_id, NEW.etapa_id WHERE COALESCE(NEW.status, '') != 'concluido';
+            UPDATE ordem_carga_aberta
+            SET quantidade = quantidade + COALESCE(NEW.quantidade, 0)
+            WHERE ordem_id = NEW.ordem_id AND etapa_id = NEW.etapa_id
+              AND COALESCE(NEW.status, '') != 'concluido';
+        END
+    ''')
+    cursor.execute('''
+        INSERT INTO ordem_carga_aberta (ordem_id, etapa_id, quantidade)
+        SELECT ordem_id, etapa_id, SUM(COALESCE(quantidade, 0))
+        FROM tarefas
+        WHERE COALESCE(status, '') != 'concluido'
+        GROUP BY ordem_id, etapa_id
+    ''')
+
+
+@migration(7)
+def versao_catalogo_etapas(cursor):
+    # Contador próprio do cadastro de etapas, mudado por triggers, para o
+    # cache do catálogo (catalogo.py) de cada processo saber quando recarregar
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS etapa_versao (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            versao INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO etapa_versao (id, versao) VALUES (1, 0)')
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_etapa_versao_{evento.lower()}
+            AFTER {evento} ON etapa
+            BEGIN
+                UPDATE etapa_versao SET versao = versao + 1 WHERE id = 1;
+            END
+        ''')
+
+
+# Etapas terminais: ordens nelas podem ir para o arquivo (arquivo.py)
+ETAPAS_TERMINAIS = "(SELECT id FROM etapa WHERE setor = 'Fim')"
+
+
+@migration(8)
+def arquivo_de_ordens(cursor):
+    # Quando cada ordem entrou numa etapa do setor 'Fim', mantido por
+    # triggers, e as tabelas frias para onde vão as ordens finalizadas há
+    # mais tempo, com as tarefas delas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ordem_finalizada (
+            ordem_id INTEGER PRIMARY KEY,
+            finalizada_em TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ordem_finalizada_em ON ordem_finalizada(finalizada_em)')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_finalizada_insert
+        AFTER INSERT ON ordem_producao
+        WHEN NEW.etapa_id IN {ETAPAS_TERMINAIS}
+        BEGIN
+            INSERT OR REPLACE INTO ordem_finalizada (ordem_id, finalizada_em) VALUES (NEW.id, CURRENT_TIMESTAMP);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_finalizada_update
+        AFTER UPDATE OF etapa_id ON ordem_producao
+        WHEN NEW.etapa_id IS NOT OLD.etapa_id
+        BEGIN
+            DELETE FROM ordem_finalizada
+            WHERE ordem_id = NEW.id AND COALESCE(NEW.etapa_id, 0) NOT IN {ETAPAS_TERMINAIS};
+            INSERT OR IGNORE INTO ordem_finalizada (ordem_id, finalizada_em)
+            SELECT NEW.id, CURRENT_TIMESTAMP WHERE NEW.etapa_id IN {ETAPAS_TERMINAIS};
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ordem_finalizada_delete
+        AFTER DELETE ON ordem_producao
+        BEGIN
+            DELETE FROM ordem_finalizada WHERE ordem_id = OLD.id;
+        END
+    ''')
+    # Sem a data real de quem já estava finalizado: conta a partir de agora
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO ordem_finalizada (ordem_id, finalizada_em)
+        SELECT id, CURRENT_TIMESTAMP FROM ordem_producao WHERE etapa_id IN {ETAPAS_TERMINAIS}
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ordem_producao_arquivo (
+            id INTEGER PRIMARY KEY,
+            OS INTEGER NOT NULL,
+            produto TEXT NOT NULL,
+            estampa TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            data_entrega TEXT NOT NULL,
+            cliente_final TEXT,
+            etapa_id INTEGER,
+            finalizada_em TEXT,
+            arquivado_em TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ordem_producao_arquivo_os ON ordem_producao_arquivo(OS)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas_arquivo (
+            id INTEGER PRIMARY KEY,
+            ordem_id INTEGER NOT NULL,
+            etapa_id INTEGER NOT NULL,
+            descricao TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            status TEXT,
+            data_criacao TEXT,
+            data_atualizacao TEXT,
+            arquivado_em TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_arquivo_ordem ON tarefas_arquivo(ordem_id)')
+
+
+# Entidades acompanhadas pelo log de transições: tabela, ordem da linha,
+# colunas que disparam o registro, status (NULL nas ordens) e quando a linha
+# ocupa a etapa (tarefa concluída já saiu)
+ENTIDADES_TRANSICAO = {
+    'ordem': ('ordem_producao', '{r}.id', 'etapa_id', 'NULL', '{r}.etapa_id IS NOT NULL'),
+    'tarefa': ('tarefas', '{r}.ordem_id', 'etapa_id, status', '{r}.status',
+               "{r}.etapa_id IS NOT NULL AND COALESCE({r}.status, '') != 'concluido'"),
+}
+
+
+# Com uma linha em transicao_silencio os triggers do log não disparam
+SILENCIO_TRANSICOES = 'NOT EXISTS (SELECT 1 FROM transicao_silencio)'
+
+
+@migration(9)
+def log_de_transicoes(cursor):
+    # Log só de inserção com toda troca de etapa/status de ordens e tarefas.
+    # estadia guarda onde cada linha está e desde quando, para o trigger
+    # calcular a permanência na saída; sai_de/entra_em dizem de qual etapa
+    # saiu e em qual entrou (NULL quando não houve saída/entrada). Os
+    # resumos por hora e dia (transicoes.py) são consolidados a partir daqui.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transicoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            momento TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            entidade TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            ordem_id INTEGER,
+            evento TEXT NOT NULL,
+            de_etapa_id INTEGER,
+            para_etapa_id INTEGER,
+            de_status TEXT,
+            para_status TEXT,
+            sai_de INTEGER,
+            entra_em INTEGER,
+            quantidade_saida INTEGER,
+            quantidade_entrada INTEGER,
+            permanencia_segundos REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transicoes_ordem ON transicoes(ordem_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estadia (
+            entidade TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            etapa_id INTEGER NOT NULL,
+            quantidade INTEGER,
+            desde TEXT,
+            PRIMARY KEY (entidade, registro_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Arquivar e restaurar só trocam a ordem de tabela: não são entrada nem
+    # saída de etapa. Essas transações gravam uma linha em
+    # transicao_silencio e a apagam antes do commit (transicoes.silencio),
+    # então nenhuma outra conexão a vê, e os triggers não disparam; estadia
+    # fica como estava e a permanência continua contando depois de uma
+    # restauração.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transicao_silencio (
+            id INTEGER PRIMARY KEY CHECK (id = 1)
+        )
+    ''')
+
+    for entidade, (tabela, ordem, colunas, status, ativa) in ENTIDADES_TRANSICAO.items():
+        novo = {chave: valor.format(r='NEW') for chave, valor in (('ordem', ordem), ('status', status), ('ativa', ativa))}
+        velho = {chave: valor.format(r='OLD') for chave, valor in (('ordem', ordem), ('status', status))}
+        # Saiu: estava numa etapa e agora está em outra ou não ocupa mais nenhuma
+        saiu = f"s.etapa_id IS NOT NULL AND (NOT ({novo['ativa']}) OR NEW.etapa_id IS NOT s.etapa_id)"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transicao_{entidade}_insert
+            AFTER INSERT ON {tabela}
+            WHEN {SILENCIO_TRANSICOES}
+            BEGIN
+                INSERT INTO transicoes (entidade, registro_id, ordem_id, evento, para_etapa_id, para_status,
+                                        entra_em, quantidade_entrada)
+                VALUES ('{entidade}', NEW.id, {novo['ordem']}, 'criacao', NEW.etapa_id, {novo['status']},
+                        CASE WHEN {novo['ativa']} THEN NEW.etapa_id END, NEW.quantidade);
+                INSERT OR REPLACE INTO estadia (entidade, registro_id, etapa_id, quantidade, desde)
+                SELECT '{entidade}', NEW.id, NEW.etapa_id, NEW.quantidade, CURRENT_TIMESTAMP
+                WHERE {novo['ativa']};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transicao_{entidade}_update
+            AFTER UPDATE OF {colunas} ON {tabela}
+            WHEN (NEW.etapa_id IS NOT OLD.etapa_id OR {novo['status']} IS NOT {velho['status']})
+              AND {SILENCIO_TRANSICOES}
+            BEGIN
+                INSERT INTO transicoes (entidade, registro_id, ordem_id, evento, de_etapa_id, para_etapa_id,
+                                        de_status, para_status, sai_de, entra_em, quantidade_saida,
+                                        quantidade_entrada, permanencia_segundos)
+                SELECT '{entidade}', NEW.id, {novo['ordem']}, 'alteracao', OLD.etapa_id, NEW.etapa_id,
+                       {velho['status']}, {novo['status']},
+                       CASE WHEN {saiu} THEN s.etapa_id END,
+                       CASE WHEN {novo['ativa']} AND (s.etapa_id IS NULL OR NEW.etapa_id IS NOT s.etapa_id)
+                            THEN NEW.etapa_id END,
+                       CASE WHEN {saiu} THEN s.quantidade END,
+                       NEW.quantidade,
+                       CASE WHEN {saiu} THEN (julianday(CURRENT_TIMESTAMP) - julianday(s.desde)) * 86400 END
+                FROM (SELECT 1) LEFT JOIN estadia s ON s.entidade = '{entidade}' AND s.registro_id = NEW.id;
+                DELETE FROM estadia
+                WHERE entidade = '{entidade}' AND registro_id = NEW.id
+                  AND (NOT ({novo['ativa']}) OR etapa_id IS NOT NEW.etapa_id);
+                INSERT OR IGNORE INTO estadia (entidade, registro_id, etapa_id, quantidade, desde)
+                SELECT '{entidade}', NEW.id, NEW.etapa_id, NEW.quantidade, CURRENT_TIMESTAMP
+                WHERE {novo['ativa']};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transicao_{entidade}_delete
+            AFTER DELETE ON {tabela}
+            WHEN {SILENCIO_TRANSICOES}
+            BEGIN
+                INSERT INTO transicoes (entidade, registro_id, ordem_id, evento, de_etapa_id, de_status,
+                                        sai_de, quantidade_saida, permanencia_segundos)
+                SELECT '{entidade}', OLD.id, {velho['ordem']}, 'remocao', OLD.etapa_id, {velho['status']},
+                       s.etapa_id, s.quantidade, (julianday(CURRENT_TIMESTAMP) - julianday(s.desde)) * 86400
+                FROM (SELECT 1) LEFT JOIN estadia s ON s.entidade = '{entidade}' AND s.registro_id = OLD.id;
+                DELETE FROM estadia WHERE entidade = '{entidade}' AND registro_id = OLD.id;
+            END
+        ''')
+        # Quem já estava numa etapa entra sem data (permanência desconhecida)
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO estadia (entidade, registro_id, etapa_id, quantidade, desde)
+            SELECT '{entidade}', id, etapa_id, quantidade, NULL FROM {tabela} WHERE {ativa.format(r=tabela)}
+        ''')
+
+    # Resumos consolidados (transicoes.py): peças/itens que entraram e
+    # saíram de cada etapa por período, histograma das permanências por
+    # faixa, até onde o log já foi lido e o WIP de partida de cada etapa
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transicao_resumo (
+            granularidade TEXT NOT NULL,
+            periodo TEXT NOT NULL,
+            etapa_id INTEGER NOT NULL,
+            pecas_entrada INTEGER NOT NULL DEFAULT 0,
+            pecas_saida INTEGER NOT NULL DEFAULT 0,
+            itens_entrada INTEGER NOT NULL DEFAULT 0,
+            itens_saida INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularidade, periodo, etapa_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transicao_permanencia (
+            granularidade TEXT NOT NULL,
+            periodo TEXT NOT NULL,
+            etapa_id INTEGER NOT NULL,
+            faixa INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularidade, periodo, etapa_id, faixa)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transicao_consolidacao (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            ultimo_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO transicao_consolidacao (id, ultimo_id) VALUES (1, 0)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transicao_wip_inicial (
+            etapa_id INTEGER PRIMARY KEY,
+            pecas INTEGER NOT NULL,
+            itens INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO transicao_wip_inicial (etapa_id, pecas, itens)
+        SELECT etapa_id, SUM(COALESCE(quantidade, 0)), COUNT(*) FROM estadia GROUP BY etapa_id
+    ''')
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    aplicadas = []
+    for versao, func in MIGRATIONS:
+        if versao <= schema_version(conn):
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            func(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {versao}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(versao)
+    return aplicadas
+
+
+@click.command('migrar')
+@with_appcontext
+def migrar_command():
+    conn = get_db_connection()
+    aplicadas = migrate(conn)
+    if aplicadas:
+        click.echo('Migrações aplicadas: ' + ', '.join(str(v) for v in aplicadas))
+    click.echo(f'Versão do schema: {schema_version(conn)}')
+
+
+def init_app(app):
+    app.cli.add_command(migrar_command)
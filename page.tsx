@@ -1,5 +1,5 @@
 "use client";
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect } from 'react';
 import { 
   DndContext, 
   DragEndEvent, 
@@ -85,23 +85,32 @@ export default function Home() {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const [stagesData, ordersData, employeesData, tasksData] = await Promise.all([
-          api.fetchStages(),
-          api.fetchOrders(),
-          api.fetchEmployees(),
-          api.fetchTasks()
-        ]);
+        const board = await api.fetchBoard();
+        const groups = [...board.etapas, board.sem_etapa];
+        const ordersData = groups.flatMap(group => group.ordens);
         
-        setStages(stagesData as Stage[]);
-        setOrders(ordersData as Order[]);
-        setEmployees(employeesData as Employee[]);
-        setTasks(tasksData as Task[]);
+        setStages(board.etapas.map(({ ordens, funcionarios, ...stage }) => stage) as Stage[]);
+        setOrders(ordersData.map(({ tarefas, ...order }) => order).sort((a, b) => a.id - b.id) as Order[]);
+        setEmployees(groups.flatMap(group => group.funcionarios).sort((a, b) => a.id - b.id) as Employee[]);
+        setTasks(ordersData.flatMap(order => order.tarefas).sort((a, b) => a.id - b.id) as Task[]);
       } catch (error) {
         console.error('Error fetching data:', error);
       }
     };
     
     fetchData();
+    
+    // Recarrega quando o backend avisa de uma alteração (agrupando rajadas)
+    let refreshTimer: ReturnType<typeof setTimeout> | null = null;
+    const unsubscribe = api.subscribeEvents(() => {
+      if (refreshTimer) clearTimeout(refreshTimer);
+      refreshTimer = setTimeout(fetchData, 300);
+    });
+    
+    return () => {
+      if (refreshTimer) clearTimeout(refreshTimer);
+      unsubscribe();
+    };
   }, []);
 
   const handleDragEnd = async (event: DragEndEvent) => {
@@ -244,6 +253,7 @@ export default function Home() {
           task.id === taskId ? { ...task, status } : task
         )
       );
+      applyOrderAdvance(updatedTask.ordem_avancada);
       
       // Opcional: mostrar uma mensagem de sucesso
       if (status === 'concluido') {
@@ -261,56 +271,21 @@ export default function Home() {
     setShowCreateTasksModal(true);
   };
 
-  const checkAndMoveCompletedOrders = useCallback(async () => {
-    // Encontrar a etapa "Embalagem"
-    const embalagemStage = stages.find(s => s.nome === 'Embalagem');
-    if (!embalagemStage) return;
-
-    // Para cada ordem na etapa "Producao"
-    const producaoStage = stages.find(s => s.nome === 'Producao');
-    if (!producaoStage) return;
-
-    const ordersInProducao = orders.filter(o => o.etapa_id === producaoStage.id);
-    
-    for (const order of ordersInProducao) {
-      // Verificar se todas as tarefas desta ordem estão concluídas
-      const orderTasks = tasks.filter(t => t.ordem_id === order.id);
-      const allTasksCompleted = orderTasks.length > 0 && orderTasks.every(t => t.status === 'concluido');
-      
-      if (allTasksCompleted) {
-        console.log(`Todas as tarefas da ordem #${order.OS} foram concluídas. Movendo para Embalagem.`);
-        
-        try {
-          // Atualizar no backend
-          await api.updateOrder(order.id, { etapa_id: embalagemStage.id });
-          
-          // Atualizar estado local
-          setOrders(prev => 
-            prev.map(o => 
-              o.id === order.id ? { ...o, etapa_id: embalagemStage.id } : o
-            )
-          );
-        } catch (error) {
-          console.error('Erro ao mover ordem para Embalagem:', error);
-        }
-      }
-    }
-  }, [orders, tasks, stages]);
-
-  useEffect(() => {
-    // Verificar quando o componente montar
-    checkAndMoveCompletedOrders();
-    
-    // Também verificar sempre que as tarefas forem atualizadas
-    const intervalId = setInterval(checkAndMoveCompletedOrders, 5000); // Verificar a cada 5 segundos
-    
-    return () => clearInterval(intervalId);
-  }, [checkAndMoveCompletedOrders]);
+  // O backend move a ordem para Embalagem na mesma transação em que a última
+  // tarefa em aberto é concluída e devolve o movimento em `ordem_avancada`
+  const applyOrderAdvance = (ordemAvancada?: { ordem_id: number; etapa_id: number } | null) => {
+    if (!ordemAvancada) return;
+    setOrders(prev =>
+      prev.map(o =>
+        o.id === ordemAvancada.ordem_id ? { ...o, etapa_id: ordemAvancada.etapa_id } : o
+      )
+    );
+  };
 
   const handleTaskComplete = async (taskId: number) => {
     try {
       // Atualizar a tarefa no backend
-      await api.updateTask(taskId, { status: 'concluido' });
+      const updatedTask = await api.updateTask(taskId, { status: 'concluido' });
       
       // Atualizar o estado local
       setTasks(prev => 
@@ -319,36 +294,7 @@ export default function Home() {
         )
       );
       
-      // Verificar se todas as tarefas da ordem foram concluídas
-      const completedTask = tasks.find(t => t.id === taskId);
-      if (completedTask) {
-        const orderTasks = tasks.filter(t => t.ordem_id === completedTask.ordem_id);
-        const allTasksCompleted = orderTasks.every(t => 
-          t.id === taskId ? true : t.status === 'concluido'
-        );
-        
-        if (allTasksCompleted) {
-          // Encontrar a ordem
-          const order = orders.find(o => o.id === completedTask.ordem_id);
-          if (order) {
-            // Encontrar a etapa "Embalagem"
-            const embalagemStage = stages.find(s => s.nome === 'Embalagem');
-            if (embalagemStage) {
-              console.log(`Todas as tarefas da ordem #${order.OS} foram concluídas. Movendo para Embalagem.`);
-              
-              // Atualizar no backend
-              await api.updateOrder(order.id, { etapa_id: embalagemStage.id });
-              
-              // Atualizar estado local
-              setOrders(prev => 
-                prev.map(o => 
-                  o.id === order.id ? { ...o, etapa_id: embalagemStage.id } : o
-                )
-              );
-            }
-          }
-        }
-      }
+      applyOrderAdvance(updatedTask.ordem_avancada);
     } catch (error) {
       console.error('Erro ao concluir tarefa:', error);
       alert('Erro ao concluir tarefa. Verifique o console para mais detalhes.');
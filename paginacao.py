@@ -0,0 +1,114 @@
+import base64
+import binascii
+import datetime
+import json
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+# Cada filtro recebe o valor da query string e devolve (condição SQL, params)
+
+def igual(coluna, tipo=int):
+    def filtro(valor):
+        return f'{coluna} = ?', [tipo(valor)]
+    return filtro
+
+
+def em_lista(coluna, tipo=int):
+    # Aceita um valor ou vários separados por vírgula: ?etapa_id=3,4
+    def filtro(valor):
+        valores = [tipo(v) for v in valor.split(',')]
+        return f"{coluna} IN ({', '.join('?' * len(valores))})", valores
+    return filtro
+
+
+def data_de(coluna):
+    def filtro(valor):
+        return f'{coluna} >= ?', [_data(valor)]
+    return filtro
+
+
+def data_ate(coluna):
+    # Inclusivo, mesmo quando a coluna guarda data e hora
+    def filtro(valor):
+        return f"{coluna} < date(?, '+1 day')", [_data(valor)]
+    return filtro
+
+
+def opcoes(condicoes):
+    def filtro(valor):
+        if valor not in condicoes:
+            raise ValueError(valor)
+        return condicoes[valor], []
+    return filtro
+
+
+def _data(valor):
+    return datetime.date.fromisoformat(valor).isoformat()
+
+
+def montar_filtros(args, filtros):
+    condicoes, params = [], []
+    for nome, filtro in filtros.items():
+        valor = args.get(nome)
+        if valor is None or valor == '':
+            continue
+        try:
+            condicao, valores = filtro(valor)
+        except ValueError:
+            raise ParametroInvalido(f"Valor inválido para '{nome}': {valor}")
+        condicoes.append(condicao)
+        params.extend(valores)
+    return condicoes, params
+
+
+def encode_cursor(ultimo_id):
+    dados = json.dumps({'id': ultimo_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(dados).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return int(json.loads(dados)['id'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ParametroInvalido('Cursor inválido')
+
+
+def consultar(conn, sql, coluna_id, args, filtros, limite_maximo):
+    # Aplica os filtros em SQL e, se houver ?limit, pagina por keyset em
+    # coluna_id. Devolve (linhas, próximo cursor, se a resposta é paginada).
+    condicoes, params = montar_filtros(args, filtros)
+
+    limit = args.get('limit')
+    paginado = limit is not None
+    if paginado:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ParametroInvalido(f"Valor inválido para 'limit': {limit}")
+        if limit < 1:
+            raise ParametroInvalido("'limit' deve ser maior que zero")
+        limit = min(limit, limite_maximo)
+
+        cursor = args.get('cursor')
+        if cursor:
+            condicoes.append(f'{coluna_id} > ?')
+            params.append(decode_cursor(cursor))
+
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(f'({c})' for c in condicoes)
+    sql += f' ORDER BY {coluna_id}'
+    if paginado:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    proximo = None
+    if paginado and len(rows) > limit:
+        rows = rows[:limit]
+        # id é a primeira coluna do SELECT (vale para Row e para tuplas)
+        proximo = encode_cursor(rows[-1][0])
+    return rows, proximo, paginado
@@ -0,0 +1,228 @@
+import collections
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, g, jsonify, request
+from flask.cli import with_appcontext
+
+import db
+
+# Modo multiplanta: com PLANTAS_DIR configurado, cada planta tem o próprio
+# arquivo SQLite (<PLANTAS_DIR>/<planta>.db). A planta vem no prefixo
+# /plantas/<planta>/... da URL ou no header X-Planta, e o app context da
+# requisição (e dos jobs e threads que ela dispara) passa a usar o banco
+# dela: pools, catálogo, escritor e feed de eventos são por arquivo (ver
+# db.estado). Uma planta é preparada (seed das etapas e migrações) na
+# primeira vez que o processo a abre; acima de PLANTAS_MAX_ABERTAS as menos
+# usadas recentemente, sem requisição em andamento, são fechadas. Sem
+# PLANTAS_DIR nada muda: todo mundo usa o DATABASE.
+
+HEADER = 'X-Planta'
+NOME_VALIDO = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+PREFIXO = 'plantas'
+
+
+class Planta:
+    def __init__(self, nome, path):
+        self.nome = nome
+        self.path = path
+        self.em_uso = 0
+        self.pronta = False
+        self.trava = threading.Lock()
+
+
+class Registro:
+    def __init__(self, app):
+        self.app = app
+        self._abertas = collections.OrderedDict()
+        self._trava = threading.Lock()
+        self._executor = None
+
+    def caminho(self, nome):
+        return os.path.join(self.app.config['PLANTAS_DIR'], nome + '.db')
+
+    def nomes(self):
+        # Plantas declaradas em PLANTAS e as que já têm arquivo na pasta
+        nomes = set(self.app.config['PLANTAS'])
+        pasta = self.app.config['PLANTAS_DIR']
+        if os.path.isdir(pasta):
+            nomes.update(arquivo[:-3] for arquivo in os.listdir(pasta)
+                         if arquivo.endswith('.db') and NOME_VALIDO.match(arquivo[:-3]))
+        return sorted(nomes)
+
+    def conhecida(self, nome):
+        return bool(NOME_VALIDO.match(nome)) and (
+            nome in self.app.config['PLANTAS'] or os.path.exists(self.caminho(nome))
+        )
+
+    def abertas(self):
+        with self._trava:
+            return list(self._abertas)
+
+    def entrar(self, nome):
+        with self._trava:
+            planta = self._abertas.get(nome)
+            if planta is None:
+                planta = self._abertas[nome] = Planta(nome, self.caminho(nome))
+            self._abertas.move_to_end(nome)
+            planta.em_uso += 1
+            self._fechar_excedentes()
+        try:
+            with planta.trava:
+                if not planta.pronta:
+                    self.app.extensions['kanban_preparar_banco'](planta.path)
+                    planta.pronta = True
+        except Exception:
+            self.sair(planta)
+            raise
+        return planta
+
+    def sair(self, planta):
+        with self._trava:
+            planta.em_uso -= 1
+            self._fechar_excedentes()
+
+    def _fechar_excedentes(self):
+        # Com a trava: fecha as paradas mais antigas até caber no limite.
+        # Fechar dentro da trava impede que a planta seja reaberta (com
+        # estado novo) enquanto o estado antigo ainda está sendo descartado.
+        excesso = len(self._abertas) - self.app.config['PLANTAS_MAX_ABERTAS']
+        for nome, planta in list(self._abertas.items()):
+            if excesso <= 0:
+                break
+            if planta.em_uso == 0:
+                del self._abertas[nome]
+                db.descartar(self.app, planta.path)
+                excesso -= 1
+
+    def em_paralelo(self, funcao, nomes):
+        # funcao() roda num app context de cada planta, em threads;
+        # devolve [(nome, resultado, erro)] na ordem dos nomes
+        with self._trava:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['PLANTAS_WORKERS'], thread_name_prefix='plantas'
+                )
+
+        def rodar(nome):
+            with self.app.app_context():
+                abrir(nome)
+                return funcao()
+
+        futuros = [(nome, self._executor.submit(rodar, nome)) for nome in nomes]
+        resultados = []
+        for nome, futuro in futuros:
+            try:
+                resultados.append((nome, futuro.result(), None))
+            except Exception as e:
+                resultados.append((nome, None, e))
+        return resultados
+
+
+class PrefixoPlanta:
+    # Middleware WSGI: /plantas/<planta>/resto vira /resto com o header
+    # X-Planta; o prefixo vai para o SCRIPT_NAME, então url_for continua
+    # gerando links da mesma planta
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if self.app.config['PLANTAS_DIR']:
+            partes = environ.get('PATH_INFO', '').split('/', 3)
+            if len(partes) >= 3 and partes[1] == PREFIXO and partes[2]:
+                environ['HTTP_X_PLANTA'] = partes[2]
+                environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}/{PREFIXO}/{partes[2]}"
+                environ['PATH_INFO'] = '/' + (partes[3] if len(partes) > 3 else '')
+        return self.wsgi_app(environ, start_response)
+
+
+def ativo(app=None):
+    return bool((app or current_app).config['PLANTAS_DIR'])
+
+
+def get_registro(app=None):
+    return (app or current_app).extensions['kanban_plantas']
+
+
+def atual():
+    # Nome da planta do app context, ou None
+    planta = g.get('_kanban_planta')
+    return planta.nome if planta else None
+
+
+def abrir(nome):
+    # Prende a planta ao app context atual; o teardown a solta. Com nome
+    # None (modo de banco único) não faz nada.
+    if nome is None:
+        return
+    planta = get_registro().entrar(nome)
+    g._kanban_planta = planta
+    db.usar(planta.path)
+
+
+def sem_planta(view):
+    # Marca rotas que não pertencem a uma planta (lista, agregados)
+    view.sem_planta = True
+    return view
+
+
+def _antes():
+    if not ativo() or request.method == 'OPTIONS' or request.endpoint is None:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'sem_planta', False):
+        return None
+    nome = request.headers.get(HEADER) or current_app.config['PLANTA_PADRAO']
+    if not nome:
+        return jsonify({'error': f'Informe a planta (/{PREFIXO}/<planta>/... ou header {HEADER})'}), 400
+    if not get_registro().conhecida(nome):
+        return jsonify({'error': f"Planta '{nome}' não encontrada"}), 404
+    abrir(nome)
+    return None
+
+
+def _soltar(exc=None):
+    planta = g.pop('_kanban_planta', None)
+    if planta is not None:
+        # Conexões voltam ao pool antes de a planta poder ser fechada
+        db.release_db_connections()
+        get_registro().sair(planta)
+
+
+@click.command('preparar-plantas')
+@click.argument('nomes', nargs=-1)
+@with_appcontext
+def preparar_plantas_command(nomes):
+    # Cria (seed das etapas) e migra as plantas dadas, ou todas as conhecidas
+    registro = get_registro()
+    if not ativo():
+        raise click.UsageError('Defina KANBAN_PLANTAS_DIR para usar o modo multiplanta.')
+    for nome in nomes or registro.nomes():
+        if not NOME_VALIDO.match(nome):
+            raise click.BadParameter(f"Nome de planta inválido: '{nome}'")
+        planta = registro.entrar(nome)
+        registro.sair(planta)
+        click.echo(f'{nome}: {planta.path}')
+
+
+def init_app(app):
+    # Pasta com um banco por planta; vazia desliga o modo multiplanta
+    app.config.setdefault('PLANTAS_DIR', os.environ.get('KANBAN_PLANTAS_DIR', ''))
+    # Plantas criadas no primeiro acesso, mesmo sem arquivo ainda
+    app.config.setdefault('PLANTAS', [
+        nome.strip() for nome in os.environ.get('KANBAN_PLANTAS', '').split(',') if nome.strip()
+    ])
+    # Planta das requisições sem prefixo nem header (vazia: responde 400)
+    app.config.setdefault('PLANTA_PADRAO', os.environ.get('KANBAN_PLANTA_PADRAO', ''))
+    app.config.setdefault('PLANTAS_MAX_ABERTAS', int(os.environ.get('KANBAN_PLANTAS_MAX_ABERTAS', 16)))
+    # Threads das consultas agregadas entre plantas
+    app.config.setdefault('PLANTAS_WORKERS', int(os.environ.get('KANBAN_PLANTAS_WORKERS', 4)))
+    app.extensions['kanban_plantas'] = Registro(app)
+    app.wsgi_app = PrefixoPlanta(app, app.wsgi_app)
+    app.before_request(_antes)
+    app.teardown_appcontext(_soltar)
+    app.cli.add_command(preparar_plantas_command)
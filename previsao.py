@@ -0,0 +1,246 @@
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+import catalogo
+import db
+import fluxo
+import serializacao
+import versao
+
+# Previsão de entrega por ordem. Cada etapa do fluxo (ETAPAS_PRINCIPAIS e,
+# dentro de Producao, as sub-etapas em paralelo) é uma fila com vazão igual
+# à soma de producao_media dos funcionários alocados, em unidades por dia
+# corrido. Cada fila atende por ordem de chegada e, no empate (ex.: as
+# ordens que já estão esperando na etapa), por data_entrega e id; a
+# quantidade da ordem conta inteira na etapa atual e nas seguintes e, em
+# Producao, o que pesa são as tarefas em aberto de cada sub-etapa (sem
+# tarefas criadas, a quantidade vai para a fila da própria Producao).
+#
+# O cálculo é feito com arrays sobre todas as ordens abertas de uma vez: um
+# passo por etapa, nenhum por ordem. O resultado fica em cache até a próxima
+# escrita (versao_dados) ou a virada do dia.
+
+
+class Previsao:
+    def __init__(self, versao_dados, data_base, ordens, etapas):
+        self.versao = versao_dados
+        self.data_base = data_base
+        self.ordens = ordens  # dict de arrays, uma posição por ordem aberta
+        self.etapas = etapas
+
+    def ordens_json(self, mascara=None):
+        ordens = self.ordens
+        if mascara is not None:
+            ordens = {chave: valores[mascara] for chave, valores in ordens.items()}
+        prevista = ordens['data_prevista']
+        folga = ordens['folga_dias']
+        colunas = (
+            ordens['id'].tolist(),
+            ordens['OS'].tolist(),
+            ordens['etapa_id'].tolist(),
+            ordens['data_entrega'].tolist(),
+            np.datetime_as_string(prevista).tolist(),
+            np.isnat(prevista).tolist(),
+            np.nan_to_num(folga).astype(np.int64).tolist(),
+            np.isnan(folga).tolist(),
+        )
+        return [{
+            'id': ordem_id,
+            'OS': os_,
+            'etapa_id': etapa_id or None,
+            'data_entrega': entrega,
+            'data_prevista': None if sem_previsao else data_prevista,
+            'folga_dias': None if sem_folga else folga_dias,
+            'atrasada': sem_previsao or (not sem_folga and folga_dias < 0),
+            'sem_capacidade': sem_previsao,
+        } for ordem_id, os_, etapa_id, entrega, data_prevista, sem_previsao, folga_dias, sem_folga in zip(*colunas)]
+
+    def atrasadas(self):
+        # Sem previsão (etapa sem capacidade) também não chega a tempo
+        return np.isnat(self.ordens['data_prevista']) | (np.nan_to_num(self.ordens['folga_dias']) < 0)
+
+    def filtro(self, apenas_atrasadas=False, etapa_ids=None):
+        mascara = np.ones(len(self.ordens['id']), dtype=bool)
+        if apenas_atrasadas:
+            mascara &= self.atrasadas()
+        if etapa_ids:
+            mascara &= np.isin(self.ordens['etapa_id'], etapa_ids)
+        return mascara
+
+    def resumo(self):
+        return {
+            'ordens': len(self.ordens['id']),
+            'atrasadas': int(self.atrasadas().sum()),
+            'sem_capacidade': int(np.isnat(self.ordens['data_prevista']).sum()),
+        }
+
+
+def _fila(chegada, duracao):
+    # Fila FIFO de um servidor. Na ordem de atendimento (chegada; empate
+    # pela ordem das linhas, que já vêm por data_entrega):
+    #   fim[i] = max(fim[i-1], chegada[i]) + duracao[i]
+    # Abrindo a recorrência, fim[i] = P[i] + max(0, max_k<=i(chegada[k] - P[k-1]))
+    # com P = soma acumulada das durações, ou seja, um cumsum e um cummax.
+    # Quem não passa pela fila (duração 0) segue com a própria chegada.
+    atendimento = np.argsort(chegada, kind='stable')
+    chegada, duracao = chegada[atendimento], duracao[atendimento]
+    passa = duracao > 0
+    acumulado = np.cumsum(duracao)
+    folga_inicio = np.where(passa, chegada - (acumulado - duracao), -np.inf)
+    fim = acumulado + np.maximum(np.maximum.accumulate(folga_inicio), 0) if len(duracao) else acumulado
+    resultado = np.empty_like(chegada)
+    resultado[atendimento] = np.where(passa, fim, chegada)
+    return resultado
+
+
+def hoje():
+    return datetime.date.today()
+
+
+def calcular(conn, data_base=None):
+    data_base = data_base or hoje()
+    cursor = serializacao.cursor_tuplas(conn)
+    rows = [(etapa['id'], etapa['nome'], etapa['setor']) for etapa in catalogo.obter(conn).por_id.values()]
+    etapas = {nome: etapa_id for etapa_id, nome, _ in rows}
+    vazao_por_etapa = dict(cursor.execute('SELECT etapa_id, producao_alocada FROM etapa_capacidade').fetchall())
+
+    principais = [nome for nome in fluxo.ETAPAS_PRINCIPAIS if nome in etapas]
+    sub_etapas = [nome for nome in fluxo.SUB_ETAPAS_PRODUCAO if nome in etapas]
+    filas = principais + sub_etapas
+    producao = principais.index(fluxo.ETAPA_PRODUCAO) if fluxo.ETAPA_PRODUCAO in principais else None
+
+    # etapa_id -> posição no fluxo principal e -> coluna de fila. Ordens do
+    # setor 'Fim' (Entregue/Cancelado) ficam de fora (-1); etapa NULL ou
+    # fora do fluxo conta como o início do fluxo.
+    maior_id = max(etapas.values(), default=0)
+    posicao_por_etapa = np.zeros(maior_id + 2, dtype=np.int64)
+    coluna_por_etapa = np.full(maior_id + 2, -1, dtype=np.int64)
+    for etapa_id, _, setor in rows:
+        if setor == 'Fim':
+            posicao_por_etapa[etapa_id] = -1
+    for coluna, nome in enumerate(filas):
+        coluna_por_etapa[etapas[nome]] = coluna
+        posicao_por_etapa[etapas[nome]] = coluna if coluna < len(principais) else producao
+
+    # POST /produtos e PUT /tarefas gravam o que o cliente mandar: a OS vai
+    # como veio (só identifica a ordem), etapa que não é número conta como
+    # o início do fluxo e ordem com quantidade que não é número fica de fora
+    rows = cursor.execute('''
+        SELECT id, CASE WHEN typeof(etapa_id) = 'integer' THEN etapa_id ELSE 0 END, quantidade, OS, data_entrega
+        FROM ordem_producao
+        WHERE typeof(quantidade) IN ('integer', 'real')
+        ORDER BY id
+    ''').fetchall()
+    ordens = np.array([row[:3] for row in rows], dtype=np.int64).reshape(-1, 3)
+    numeros_os = np.array([row[3] for row in rows], dtype=object)
+    entregas = np.array([row[4] for row in rows], dtype=object)
+    posicao = posicao_por_etapa[np.clip(ordens[:, 1], 0, maior_id + 1)]
+    abertas = posicao >= 0
+    ordens, numeros_os, entregas, posicao = ordens[abertas], numeros_os[abertas], entregas[abertas], posicao[abertas]
+
+    # Ordem de atendimento: data de entrega (sem data válida vai para o fim), depois id
+    entrega_dia = pd.to_datetime(pd.Series(entregas, dtype=object), errors='coerce', format='ISO8601') \
+        .to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    chave_entrega = np.where(np.isnat(entrega_dia), np.iinfo(np.int64).max, entrega_dia.astype(np.int64))
+    atendimento = np.lexsort((ordens[:, 0], chave_entrega))
+    ordens, numeros_os, entregas, entrega_dia, posicao = (
+        ordens[atendimento], numeros_os[atendimento], entregas[atendimento], entrega_dia[atendimento],
+        posicao[atendimento]
+    )
+    ids, quantidades = ordens[:, 0], ordens[:, 2].astype(np.float64)
+    n = len(ids)
+
+    # Trabalho restante (unidades) de cada ordem em cada fila
+    trabalho = np.zeros((n, len(filas)))
+    for coluna in range(len(principais)):
+        if coluna != producao:
+            trabalho[:, coluna] = np.where(posicao <= coluna, quantidades, 0)
+
+    if producao is not None and n:
+        linha_por_id = np.full(int(ids.max()) + 1, -1, dtype=np.int64)
+        linha_por_id[ids] = np.arange(n)
+
+        def linhas_de(ordem_ids):
+            conhecidas = ordem_ids < len(linha_por_id)
+            return np.where(conhecidas, linha_por_id[np.where(conhecidas, ordem_ids, 0)], -1)
+
+        com_tarefas = np.zeros(n, dtype=bool)
+        resumo = np.array(cursor.execute('SELECT ordem_id FROM ordem_tarefas_resumo WHERE total > 0').fetchall(),
+                          dtype=np.int64).reshape(-1)
+        linhas = linhas_de(resumo)
+        com_tarefas[linhas[linhas >= 0]] = True
+        ainda_vai = posicao <= producao
+        trabalho[:, producao] = np.where(ainda_vai & ~com_tarefas, quantidades, 0)
+
+        carga = np.array(cursor.execute('''
+            SELECT ordem_id, etapa_id, quantidade FROM ordem_carga_aberta
+            WHERE quantidade > 0 AND typeof(etapa_id) = 'integer'
+        ''').fetchall(), dtype=np.int64).reshape(-1, 3)
+        linhas = linhas_de(carga[:, 0])
+        colunas = coluna_por_etapa[np.clip(carga[:, 1], 0, maior_id + 1)]
+        # Só tarefas das sub-etapas (ou da própria Producao) somam trabalho
+        validas = (linhas >= 0) & ((colunas >= len(principais)) | (colunas == producao))
+        validas[validas] = ainda_vai[linhas[validas]]
+        np.add.at(trabalho, (linhas[validas], colunas[validas]), carga[validas, 2])
+
+    # Fila sem ninguém alocado não anda: as ordens que dependem dela ficam
+    # sem previsão e saem das filas para não atrasar as outras
+    vazao = np.array([float(vazao_por_etapa.get(etapas[nome], 0) or 0) for nome in filas])
+    sem_capacidade = ((trabalho > 0) & (vazao <= 0)).any(axis=1)
+    trabalho[sem_capacidade] = 0
+    duracao = np.divide(trabalho, vazao, out=np.zeros_like(trabalho), where=vazao > 0)
+
+    liberacao = np.zeros(n)
+    for coluna in range(len(principais)):
+        if coluna == producao:
+            fim = _fila(liberacao, duracao[:, coluna])
+            for sub in range(len(principais), len(filas)):
+                fim = np.maximum(fim, _fila(liberacao, duracao[:, sub]))
+            liberacao = fim
+        else:
+            liberacao = _fila(liberacao, duracao[:, coluna])
+
+    data_prevista = np.datetime64(data_base, 'D') + np.ceil(liberacao).astype('timedelta64[D]')
+    data_prevista[sem_capacidade] = np.datetime64('NaT')
+    folga = (entrega_dia - data_prevista).astype(np.float64)
+    folga[np.isnat(entrega_dia) | sem_capacidade] = np.nan
+
+    carga_por_fila = trabalho.sum(axis=0)
+    ordens_por_fila = (trabalho > 0).sum(axis=0)
+    resumo_etapas = [{
+        'etapa_id': etapas[nome],
+        'nome': nome,
+        'producao_diaria': float(vazao[coluna]),
+        'carga': float(carga_por_fila[coluna]),
+        'ordens': int(ordens_por_fila[coluna]),
+        'dias_fila': round(float(carga_por_fila[coluna] / vazao[coluna]), 2) if vazao[coluna] > 0 else None,
+    } for coluna, nome in enumerate(filas)]
+
+    return Previsao(versao.atual(conn), data_base, {
+        'id': ids,
+        'OS': numeros_os,
+        'etapa_id': ordens[:, 1],
+        'data_entrega': entregas,
+        'data_prevista': data_prevista,
+        'folga_dias': folga,
+    }, resumo_etapas)
+
+
+def obter(conn, app):
+    # Cache por (versão dos dados, dia): leitura e versão no mesmo snapshot,
+    # e uma trava para que só uma requisição recalcule de cada vez
+    estado = db.estado('previsao', lambda path: {'trava': threading.Lock(), 'previsao': None}, app)
+    with db.snapshot(conn):
+        chave = (versao.atual(conn), hoje())
+        atual = estado['previsao']
+        if atual is not None and (atual.versao, atual.data_base) == chave:
+            return atual
+        with estado['trava']:
+            atual = estado['previsao']
+            if atual is None or (atual.versao, atual.data_base) != chave:
+                atual = estado['previsao'] = calcular(conn, chave[1])
+            return atual
+
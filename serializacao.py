@@ -0,0 +1,130 @@
+import gzip
+import os
+import re
+import zlib
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+import paginacao
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele fica o json da biblioteca padrão
+    orjson = None
+
+# Camada comum das respostas das listas: as linhas vêm de cursores de tuplas
+# (sem sqlite3.Row) e viram dict com um zip pela especificação de colunas da
+# consulta; o JSON sai pelo orjson quando instalado, com o mesmo texto do
+# provider padrão do Flask, e respostas grandes são comprimidas.
+
+ORJSON_OPCOES = (orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                 | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+# O provider padrão (ensure_ascii) escapa como \uXXXX tudo acima de '~';
+# o orjson só escapa os caracteres de controle
+_NAO_ASCII = re.compile('[^\x00-\x7e]')
+
+
+def _escapar(match):
+    codigo = ord(match.group())
+    if codigo > 0xFFFF:
+        codigo -= 0x10000
+        return '\\u{:04x}\\u{:04x}'.format(0xD800 | (codigo >> 10), 0xDC00 | (codigo & 0x3FF))
+    return '\\u{:04x}'.format(codigo)
+
+
+class JSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        compacto = not ((self.compact is None and self._app.debug) or self.compact is False)
+        if orjson is None or not (compacto and self.sort_keys and self.ensure_ascii):
+            return super().response(*args, **kwargs)
+        dados = self._orjson(self._prepare_response_obj(args, kwargs))
+        if dados is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(dados + b'\n', mimetype=self.mimetype)
+
+    def _orjson(self, obj):
+        # Datas e dataclasses passam pelo default do Flask, como no json;
+        # o que o orjson não aceita (chaves não-str, inteiros enormes) volta
+        # para o caminho padrão
+        try:
+            dados = orjson.dumps(obj, default=self.default, option=ORJSON_OPCOES)
+        except TypeError:
+            return None
+        if not dados.isascii() or b'\x7f' in dados:
+            dados = _NAO_ASCII.sub(_escapar, dados.decode()).encode()
+        return dados
+
+
+class Colunas:
+    # Chave do JSON -> expressão SQL, na ordem do SELECT. A primeira coluna
+    # é sempre o id (usado no cursor da paginação).
+    def __init__(self, **expressoes):
+        self.chaves = tuple(expressoes)
+        self.select = ', '.join(f'{sql} AS "{chave}"' for chave, sql in expressoes.items())
+
+    def objeto(self, row):
+        return dict(zip(self.chaves, row))
+
+    def objetos(self, rows):
+        chaves = self.chaves
+        return [dict(zip(chaves, row)) for row in rows]
+
+    def colunar(self, rows):
+        if not rows:
+            return {chave: [] for chave in self.chaves}
+        return {chave: list(valores) for chave, valores in zip(self.chaves, zip(*rows))}
+
+
+def cursor_tuplas(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def lista(colunas, rows):
+    # ?format=columnar devolve um array por campo em vez de um objeto por linha
+    formato = request.args.get('format', 'json')
+    if formato == 'columnar':
+        return colunas.colunar(rows)
+    if formato != 'json':
+        raise paginacao.ParametroInvalido(f"Valor inválido para 'format': {formato}")
+    return colunas.objetos(rows)
+
+
+# Codificações aceitas; o nome vai como sufixo no ETag da resposta comprimida
+CODIFICACOES = ('gzip', 'deflate')
+
+
+def comprimir(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    dados = response.get_data()
+    if len(dados) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    codificacao = request.accept_encodings.best_match(CODIFICACOES)
+    nivel = current_app.config['COMPRESS_LEVEL']
+    if codificacao == 'gzip':
+        response.set_data(gzip.compress(dados, compresslevel=nivel, mtime=0))
+    elif codificacao == 'deflate':
+        response.set_data(zlib.compress(dados, nivel))
+    else:
+        return response
+    response.headers['Content-Encoding'] = codificacao
+    # Outros bytes, outro ETag forte (versao.condicional aceita as duas formas)
+    etag, fraco = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{codificacao}', weak=fraco)
+    return response
+
+
+def init_app(app):
+    # Respostas menores que isso (bytes) vão sem compressão
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.environ.get('KANBAN_COMPRESS_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESS_LEVEL', int(os.environ.get('KANBAN_COMPRESS_LEVEL', 6)))
+    app.json = JSONProvider(app)
+    app.after_request(comprimir)
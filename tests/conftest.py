@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sem a thread de manutenção: os testes chamam arquivar() e consolidar()
+# quando precisam
+os.environ.setdefault('KANBAN_ARQUIVO_INTERVALO', '0')
+os.environ.setdefault('KANBAN_TRANSICOES_INTERVALO', '0')
+
+import app as kanban  # noqa: E402
+import db  # noqa: E402
+import escrita  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Banco novo por teste; monkeypatch devolve a config no fim
+    monkeypatch.setitem(kanban.app.config, 'DATABASE', str(tmp_path / 'kanban.db'))
+    monkeypatch.setitem(kanban.app.config, 'TESTING', True)
+    kanban.initialize_app()
+    yield kanban.app
+    escrita.parar(kanban.app)
+    db.descartar(kanban.app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn(app):
+    # Conexão direta, fora do pool, para conferir o estado do banco
+    conexao = db.connect(app.config['DATABASE'])
+    yield conexao
+    conexao.close()
+
+
+def criar_produto(client, os_, etapa='Producao', quantidade=10, **extra):
+    resposta = client.post('/produtos', json={
+        'OS': os_, 'produto': 'Lençol', 'estampa': 'Liso', 'quantidade': quantidade,
+        'data_entrega': '2026-01-31', 'etapa': etapa, **extra
+    })
+    assert resposta.status_code == 201, resposta.get_json()
+    return resposta.get_json()
@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+import alocacao
+from conftest import criar_produto
+
+PRODUCAO, EMBALAGEM = 3, 9
+
+
+@pytest.fixture
+def fila_na_producao(client):
+    # Demanda só na Producao e todo mundo parado na Embalagem
+    criar_produto(client, 1, quantidade=100)
+    for nome in ('Ana', 'Bia'):
+        assert client.post('/funcionarios', json={
+            'nome': nome, 'etapa': 'Embalagem', 'producao_media': 10
+        }).status_code == 201
+
+
+def etapas(conn):
+    return dict(conn.execute('SELECT nome, etapa_id FROM funcionarios').fetchall())
+
+
+def test_aplicar_calcula_fora_do_lock_de_escrita(app, client, conn, fila_na_producao, monkeypatch):
+    original = alocacao.otimizar
+
+    def otimizar(*args, **kwargs):
+        # Durante o cálculo outra conexão consegue escrever na hora
+        outra = sqlite3.connect(app.config['DATABASE'], timeout=0)
+        try:
+            outra.execute('BEGIN IMMEDIATE')
+            outra.rollback()
+        finally:
+            outra.close()
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(alocacao, 'otimizar', otimizar)
+    resposta = client.post('/funcionarios/alocacao', json={'etapa_ids': [PRODUCAO, EMBALAGEM], 'aplicar': True})
+    assert resposta.status_code == 200, resposta.get_json()
+    corpo = resposta.get_json()
+    assert corpo['aplicado'] is True
+    assert corpo['movimentos']
+    assert list(etapas(conn).values()).count(PRODUCAO) == len(corpo['movimentos'])
+
+
+def test_aplicar_recusa_plano_de_quem_mudou_de_etapa(app, client, conn, fila_na_producao, monkeypatch):
+    original = alocacao.otimizar
+
+    def otimizar(*args, **kwargs):
+        resultado = original(*args, **kwargs)
+        # Alguém move um dos funcionários do plano entre o cálculo e a gravação
+        conn.execute('UPDATE funcionarios SET etapa_id = 4 WHERE id = ?',
+                     (resultado['movimentos'][0]['funcionario_id'],))
+        conn.commit()
+        return resultado
+
+    monkeypatch.setattr(alocacao, 'otimizar', otimizar)
+    resposta = client.post('/funcionarios/alocacao', json={'etapa_ids': [PRODUCAO, EMBALAGEM], 'aplicar': True})
+    assert resposta.status_code == 409
+    assert resposta.get_json()['conflitos']
+    # Nada do plano foi gravado: só a mudança de fora
+    assert sorted(etapas(conn).values()) == [4, EMBALAGEM]
@@ -0,0 +1,30 @@
+import io
+
+import arquivo
+import db
+from conftest import criar_produto
+
+
+def test_os_arquivada_nao_pode_ser_recriada(app, client, conn):
+    criar_produto(client, 1)
+    client.post('/produtos/mover', json={'etapa': 'Entregue', 'ids': [1]})
+    with app.app_context():
+        assert arquivo.arquivar(db.get_db_connection(), 0, 100) == (1, 0)
+
+    resposta = client.post('/produtos', json={
+        'OS': 1, 'produto': 'Fronha', 'estampa': 'Liso', 'quantidade': 5,
+        'data_entrega': '2026-01-31', 'etapa': 'Producao'
+    })
+    assert resposta.status_code == 409
+    assert resposta.get_json()['error'] == "OS '1' já existe no sistema. Não é possível duplicar."
+
+    for modo in ('arquivo', 'streaming'):
+        planilha = b'OS,produto,estampa,quantidade,data_entrega,etapa\n1,Fronha,Liso,5,2026-01-31,Producao\n'
+        resposta = client.post(f'/importar/produtos?modo={modo}', data={'file': (io.BytesIO(planilha), 'a.csv')},
+                               content_type='multipart/form-data')
+        assert resposta.get_json()['errors'] == ["OS '1' já existe no sistema. Não é possível duplicar."]
+    assert conn.execute('SELECT COUNT(*) FROM ordem_producao').fetchone()[0] == 0
+
+    resposta = client.post('/produtos/1/restaurar')
+    assert resposta.status_code == 200
+    assert [tuple(row) for row in conn.execute('SELECT id, OS, produto FROM ordem_producao')] == [(1, 1, 'Lençol')]
@@ -0,0 +1,55 @@
+from conftest import criar_produto
+
+
+def sem(dicionario, *chaves):
+    return {chave: valor for chave, valor in dicionario.items() if chave not in chaves}
+
+
+def test_board_igual_as_listas(client):
+    for numero, etapa in ((1, 'Producao'), (2, 'Producao'), (3, 'Embalagem'), (4, 'Entregue')):
+        criar_produto(client, numero, etapa=etapa, quantidade=10 * numero)
+    for ordem in (1, 2):
+        assert client.post(f'/produtos/{ordem}/tarefas', json=[
+            {'etapa_id': 4, 'descricao': 'bainha', 'quantidade': 5},
+            {'etapa_id': 7, 'descricao': 'elastico', 'quantidade': 3},
+        ]).status_code == 201
+    client.put('/tarefas/2', json={'status': 'concluido'})
+    for nome, etapa in (('Ana', 'Producao'), ('Bia', 'Embalagem'), ('Caio', 'Bainha lencol')):
+        assert client.post('/funcionarios', json={
+            'nome': nome, 'etapa': etapa, 'producao_media': 5
+        }).status_code == 201
+
+    board = client.get('/board').get_json()
+    etapas = client.get('/etapas').get_json()
+    produtos = client.get('/produtos').get_json()
+    tarefas = client.get('/tarefas').get_json()
+    funcionarios = client.get('/funcionarios').get_json()
+
+    assert [sem(etapa, 'ordens', 'funcionarios') for etapa in board['etapas']] == etapas
+    ordens = [ordem for etapa in board['etapas'] for ordem in etapa['ordens']] + board['sem_etapa']['ordens']
+    assert sorted((sem(ordem, 'tarefas') for ordem in ordens), key=lambda ordem: ordem['id']) == produtos
+    assert sorted((tarefa for ordem in ordens for tarefa in ordem['tarefas']),
+                  key=lambda tarefa: tarefa['id']) == tarefas
+    assert sorted((funcionario for etapa in board['etapas'] for funcionario in etapa['funcionarios']),
+                  key=lambda funcionario: funcionario['id']) == funcionarios
+    for etapa in board['etapas']:
+        assert all(ordem['etapa_id'] == etapa['id'] for ordem in etapa['ordens'])
+        assert all(funcionario['etapa_id'] == etapa['id'] for funcionario in etapa['funcionarios'])
+
+
+def test_board_com_os_filtros_das_listas(client):
+    for numero, etapa in ((1, 'Producao'), (2, 'Embalagem'), (3, 'Producao')):
+        criar_produto(client, numero, etapa=etapa)
+    for ordem in (1, 2, 3):
+        assert client.post(f'/produtos/{ordem}/tarefas', json=[
+            {'etapa_id': 4, 'descricao': 'bainha', 'quantidade': 5},
+        ]).status_code == 201
+    client.put('/tarefas/3', json={'status': 'concluido'})
+
+    board = client.get('/board?etapa_id=3&tarefa_status=pendente').get_json()
+    produtos = client.get('/produtos?etapa_id=3').get_json()
+    tarefas = client.get('/tarefas?ordem_id=1,3&status=pendente').get_json()
+    assert [etapa['id'] for etapa in board['etapas']] == [3]
+    ordens = board['etapas'][0]['ordens']
+    assert [sem(ordem, 'tarefas') for ordem in ordens] == produtos
+    assert [tarefa for ordem in ordens for tarefa in ordem['tarefas']] == tarefas
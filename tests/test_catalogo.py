@@ -0,0 +1,45 @@
+import catalogo
+import db
+
+
+def test_cache_ate_mudar_o_cadastro(app, client, conn):
+    with app.app_context():
+        primeiro = catalogo.obter()
+    with app.app_context():
+        # Sem mudança no cadastro, o mesmo objeto volta do cache
+        assert catalogo.obter() is primeiro
+        assert catalogo.obter().id_por_nome('Costura') is None
+
+    # Outro processo (aqui, outra conexão) cadastra uma etapa: o trigger
+    # sobe etapa_versao e a próxima requisição recarrega
+    conn.execute("INSERT INTO etapa (nome, setor) VALUES ('Costura', 'Producao')")
+    conn.commit()
+    with app.app_context():
+        novo = catalogo.obter()
+        assert novo is not primeiro
+        assert novo.versao == primeiro.versao + 1
+        assert novo.id_por_nome('Costura') == 13
+    assert client.post('/funcionarios', json={
+        'nome': 'Ana', 'etapa': 'Costura', 'producao_media': 5
+    }).status_code == 201
+
+    conn.execute("UPDATE etapa SET nome = 'Costura reta' WHERE id = 13")
+    conn.commit()
+    with app.app_context():
+        assert catalogo.obter().id_por_nome('Costura') is None
+        assert catalogo.obter().etapa(13)['nome'] == 'Costura reta'
+
+
+def test_uma_leitura_por_requisicao(app):
+    with app.app_context():
+        primeiro = catalogo.obter()
+        db.get_db_connection(readonly=True).execute('SELECT 1')
+        # Dentro da mesma requisição nem a versão é relida
+        assert catalogo.obter() is primeiro
+
+
+def test_invalidar(app):
+    with app.app_context():
+        primeiro = catalogo.obter()
+        catalogo.invalidar()
+        assert catalogo.obter() is not primeiro
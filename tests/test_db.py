@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+from flask import g
+
+import db
+
+
+def conexao(readonly=False):
+    # A do pool, sem o envoltório das métricas (um por requisição)
+    db.get_db_connection(readonly)
+    return g._kanban_conexoes[readonly][1]
+
+
+def test_pool_devolve_a_conexao(app):
+    with app.app_context():
+        escrita = conexao()
+        leitura = conexao(readonly=True)
+        # Mesma conexão durante todo o app context
+        assert conexao() is escrita
+        escrita.execute('BEGIN')
+        escrita.execute("INSERT INTO etapa (nome, setor) VALUES ('Teste', 'Inicio')")
+
+    with app.app_context():
+        # Voltou ao pool e é reaproveitada, sem a transação que ficou aberta
+        assert conexao() is escrita
+        assert conexao(readonly=True) is leitura
+        assert not escrita.in_transaction
+        assert escrita.execute("SELECT COUNT(*) FROM etapa WHERE nome = 'Teste'").fetchone()[0] == 0
+
+
+def test_pool_cheio_fecha_o_excedente(app):
+    pool = db.ConnectionPool(app.config['DATABASE'], size=1)
+    primeira, segunda = pool.acquire(), pool.acquire()
+    pool.release(primeira)
+    pool.release(segunda)
+    assert pool.acquire() is primeira
+    with pytest.raises(sqlite3.ProgrammingError):
+        segunda.execute('SELECT 1')
+
+
+def test_conexao_de_leitura_recusa_escrita(app):
+    with app.app_context():
+        leitura = db.get_db_connection(readonly=True)
+        assert leitura.execute('SELECT COUNT(*) FROM etapa').fetchone()[0] == 12
+        with pytest.raises(sqlite3.OperationalError):
+            leitura.execute("INSERT INTO etapa (nome, setor) VALUES ('Teste', 'Inicio')")
+
+    # mode=ro sozinho, sem o query_only, também não grava
+    conexao = sqlite3.connect(f"file:{app.config['DATABASE']}?mode=ro", uri=True)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            conexao.execute("INSERT INTO etapa (nome, setor) VALUES ('Teste', 'Inicio')")
+    finally:
+        conexao.close()
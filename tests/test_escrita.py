@@ -0,0 +1,72 @@
+import sqlite3
+import threading
+
+import pytest
+
+import escrita
+
+INSERT = '''
+    INSERT INTO ordem_producao (OS, produto, estampa, quantidade, data_entrega, etapa_id)
+    VALUES (?, 'Lençol', 'Liso', 1, '2026-01-31', 3)
+'''
+
+
+@pytest.fixture
+def group_commit(app, monkeypatch):
+    # Janela longa para as operações das threads caírem no mesmo lote
+    monkeypatch.setitem(app.config, 'GROUP_COMMIT', True)
+    monkeypatch.setitem(app.config, 'GROUP_COMMIT_JANELA_MS', 300)
+    escrita.parar(app)
+    yield
+    escrita.parar(app)
+
+
+def inserir(*numeros, erro=None):
+    def operacao(conn):
+        for numero in numeros:
+            conn.execute(INSERT, (numero,))
+        if erro is not None:
+            raise erro
+        return numeros
+    return operacao
+
+
+def test_erro_de_uma_operacao_desfaz_so_ela(app, conn, group_commit, monkeypatch):
+    conn.execute(INSERT, (99,))
+    conn.commit()
+    operacoes = {
+        'a': inserir(1),
+        # A segunda linha bate no índice único de OS: a primeira também sai
+        'duplicada': inserir(2, 99),
+        'recusada': inserir(3, erro=escrita.OperacaoRecusada('não', 409)),
+        'b': inserir(4, 5),
+    }
+    resultados = {}
+    lotes = []
+
+    def rodar(nome):
+        with app.app_context():
+            try:
+                resultados[nome] = escrita.executar(operacoes[nome])
+            except Exception as e:
+                resultados[nome] = e
+
+    original = escrita.Escritor._executar
+
+    def executar(self, conexao, lote):
+        lotes.append(len(lote))
+        return original(self, conexao, lote)
+
+    monkeypatch.setattr(escrita.Escritor, '_executar', executar)
+    threads = [threading.Thread(target=rodar, args=(nome,)) for nome in operacoes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert lotes == [4]
+    assert resultados['a'] == (1,)
+    assert resultados['b'] == (4, 5)
+    assert isinstance(resultados['duplicada'], sqlite3.IntegrityError)
+    assert isinstance(resultados['recusada'], escrita.OperacaoRecusada)
+    assert [row[0] for row in conn.execute('SELECT OS FROM ordem_producao ORDER BY OS')] == [1, 4, 5, 99]
@@ -0,0 +1,61 @@
+import csv
+import io
+
+from openpyxl import load_workbook
+
+from conftest import criar_produto
+
+
+def linhas_csv(resposta):
+    return list(csv.reader(io.StringIO(resposta.get_data(as_text=True))))
+
+
+def linhas_xlsx(resposta):
+    planilha = load_workbook(io.BytesIO(resposta.get_data()), read_only=True).active
+    return [list(row) for row in planilha.iter_rows(values_only=True)]
+
+
+def como_csv(valor):
+    return '' if valor is None else str(valor)
+
+
+def como_xlsx(valor):
+    # Texto vazio vira célula vazia na planilha
+    return None if valor == '' else valor
+
+
+def preparar(client):
+    for numero, etapa in ((1, 'Producao'), (2, 'Embalagem'), (3, 'Producao')):
+        criar_produto(client, numero, etapa=etapa, quantidade=10 * numero, cliente_final=f'Cliente {numero}')
+    criar_produto(client, 4, estampa='Xadrez')
+
+
+def test_csv_igual_a_lista(client):
+    preparar(client)
+    for consulta in ('', 'etapa_id=3'):
+        produtos = client.get(f'/produtos?{consulta}').get_json()
+        resposta = client.get(f'/exportar/produtos?{consulta}')
+        assert resposta.status_code == 200
+        assert resposta.mimetype == 'text/csv'
+        cabecalho, *linhas = linhas_csv(resposta)
+        # O JSON sai com as chaves ordenadas; a exportação, na ordem das colunas
+        assert sorted(cabecalho) == list(produtos[0])
+        assert linhas == [[como_csv(produto[chave]) for chave in cabecalho] for produto in produtos]
+    assert len(linhas) == 3
+
+
+def test_xlsx_igual_a_lista(client):
+    preparar(client)
+    for consulta in ('', 'etapa_id=3'):
+        produtos = client.get(f'/produtos?{consulta}').get_json()
+        resposta = client.get(f'/exportar/produtos?formato=xlsx&{consulta}')
+        assert resposta.status_code == 200
+        cabecalho, *linhas = linhas_xlsx(resposta)
+        assert sorted(cabecalho) == list(produtos[0])
+        assert linhas == [[como_xlsx(produto[chave]) for chave in cabecalho] for produto in produtos]
+    assert len(linhas) == 3
+
+
+def test_formato_e_entidade_invalidos(client):
+    assert client.get('/exportar/produtos?formato=pdf').status_code == 400
+    assert client.get('/exportar/etapas').status_code == 404
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from conftest import criar_produto
+
+EMBALAGEM = 9
+
+
+@pytest.fixture
+def ordem_com_tarefas(client):
+    criar_produto(client, 1)
+    assert client.post('/produtos/1/tarefas', json=[
+        {'etapa_id': 4, 'descricao': 'bainha', 'quantidade': 5},
+        {'etapa_id': 7, 'descricao': 'elastico', 'quantidade': 3},
+    ]).status_code == 201
+
+
+def etapa_da_ordem(conn):
+    return conn.execute('SELECT etapa_id FROM ordem_producao WHERE id = 1').fetchone()[0]
+
+
+def test_ultima_tarefa_concluida_avanca_a_ordem(client, conn, ordem_com_tarefas):
+    primeira = client.put('/tarefas/1', json={'status': 'concluido'})
+    assert primeira.get_json()['ordem_avancada'] is None
+    assert etapa_da_ordem(conn) == 3
+
+    ultima = client.put('/tarefas/2', json={'status': 'concluido'})
+    assert ultima.status_code == 200
+    assert ultima.get_json()['ordem_avancada'] == {'ordem_id': 1, 'etapa_id': EMBALAGEM}
+    assert etapa_da_ordem(conn) == EMBALAGEM
+    eventos = conn.execute("SELECT dados FROM eventos WHERE tipo = 'ordem_movida'").fetchall()
+    assert [json.loads(row[0]) for row in eventos] == [{'ordem_id': 1, 'etapa_id': EMBALAGEM}]
+
+
+def test_so_avanca_quem_esta_na_producao(client, conn, ordem_com_tarefas):
+    assert client.patch('/produtos/1', json={'etapa_id': 2}).status_code == 200
+    for tarefa in (1, 2):
+        resposta = client.put(f'/tarefas/{tarefa}', json={'status': 'concluido'})
+        assert resposta.get_json()['ordem_avancada'] is None
+    assert etapa_da_ordem(conn) == 2
+
+
+def test_alterar_so_a_quantidade_nao_avanca(client, conn, ordem_com_tarefas):
+    client.put('/tarefas/1', json={'status': 'concluido'})
+    # Sem mudança de status, a ordem fica onde está
+    assert client.put('/tarefas/2', json={'quantidade': 1}).get_json()['ordem_avancada'] is None
+    assert etapa_da_ordem(conn) == 3
@@ -0,0 +1,87 @@
+import io
+
+import openpyxl
+import pytest
+
+
+def importar(client, rota, csv):
+    resposta = client.post(rota, data={'file': (io.BytesIO(csv.encode()), 'planilha.csv')},
+                           content_type='multipart/form-data')
+    assert resposta.status_code == 201, resposta.get_json()
+    return resposta.get_json()
+
+
+def test_os_e_quantidade_precisam_ser_inteiras(client, conn):
+    resultado = importar(client, '/importar/produtos', (
+        'OS,produto,estampa,quantidade,data_entrega,etapa\n'
+        '1,Lençol,Liso,10,2026-01-31,Producao\n'
+        'abc,Fronha,Liso,10,2026-01-31,Producao\n'
+        '3,Fronha,Liso,6.5,2026-01-31,Producao\n'
+        '7.0,Colcha,Liso,4.0,2026-01-31,Producao\n'
+    ))
+    assert resultado['errors'] == [
+        "Erro ao inserir produto 'Fronha': datatype mismatch: ordem_producao.OS = 'abc'",
+        "Erro ao inserir produto 'Fronha': datatype mismatch: ordem_producao.quantidade = '6.5'",
+    ]
+    linhas = conn.execute('SELECT OS, quantidade, typeof(OS), typeof(quantidade) FROM ordem_producao ORDER BY OS')
+    assert [tuple(row) for row in linhas] == [(1, 10, 'integer', 'integer'), (7, 4, 'integer', 'integer')]
+
+
+def test_producao_media_aceita_fracao(client, conn):
+    resultado = importar(client, '/importar/funcionarios', (
+        'nome,etapa,producao_media\n'
+        'Ana,Producao,6.5\n'
+        'Bia,Producao,8\n'
+        'Caio,Producao,muita\n'
+    ))
+    assert resultado['errors'] == [
+        "Erro ao inserir funcionário 'Caio': datatype mismatch: funcionarios.producao_media = 'muita'",
+    ]
+    linhas = conn.execute('SELECT nome, producao_media, typeof(producao_media) FROM funcionarios ORDER BY id')
+    assert [tuple(row) for row in linhas] == [('Ana', 6.5, 'real'), ('Bia', 8, 'integer')]
+
+
+def planilha_xlsx(linhas):
+    workbook = openpyxl.Workbook()
+    folha = workbook.active
+    folha.append(['OS', 'produto', 'estampa', 'quantidade', 'data_entrega', 'etapa'])
+    for linha in linhas:
+        folha.append(linha)
+    arquivo = io.BytesIO()
+    workbook.save(arquivo)
+    return arquivo.getvalue()
+
+
+@pytest.mark.parametrize('modo', ['arquivo', 'streaming'])
+def test_xlsx_mesmas_mensagens_nos_dois_modos(client, modo):
+    # A OS vazia deixa a coluna como float no DataFrame (7 vira 7.0)
+    conteudo = planilha_xlsx([
+        [7, 'Lençol', 'Liso', 10, '2026-01-31', 'Producao'],
+        [7, 'Fronha', 'Liso', 10, '2026-01-31', 'Producao'],
+        [None, 'Colcha', 'Liso', 10, '2026-01-31', 'Producao'],
+    ])
+    resposta = client.post(f'/importar/produtos?modo={modo}',
+                           data={'file': (io.BytesIO(conteudo), 'planilha.xlsx')},
+                           content_type='multipart/form-data')
+    assert resposta.status_code == 201, resposta.get_json()
+    assert resposta.get_json()['errors'] == [
+        "OS '7' já existe no sistema. Não é possível duplicar.",
+        "Erro ao inserir produto 'Colcha': NOT NULL constraint failed: ordem_producao.OS",
+    ]
+
+
+@pytest.mark.parametrize('modo', ['arquivo', 'streaming'])
+def test_lista_de_erros_tem_limite(app, client, monkeypatch, modo):
+    monkeypatch.setitem(app.config, 'IMPORT_MAX_ERRORS', 2)
+    csv = 'OS,produto,estampa,quantidade,data_entrega,etapa\n' + ''.join(
+        f'{numero},P{numero},Liso,10,2026-01-31,Inexistente\n' for numero in range(5)
+    )
+    resposta = client.post(f'/importar/produtos?modo={modo}&tamanho_lote=2',
+                           data={'file': (io.BytesIO(csv.encode()), 'planilha.csv')},
+                           content_type='multipart/form-data')
+    corpo = resposta.get_json()
+    assert corpo['errors'] == [
+        "Etapa 'Inexistente' não encontrada para produto 'P0'",
+        "Etapa 'Inexistente' não encontrada para produto 'P1'",
+    ]
+    assert corpo['erros_omitidos'] == 3
@@ -0,0 +1,35 @@
+from flask import Flask
+
+import metricas
+from conftest import criar_produto
+
+
+def amostra(client, linha):
+    # O registro é do processo: compara antes e depois em vez do valor
+    for texto in client.get('/metrics').get_data(as_text=True).splitlines():
+        if texto.startswith(linha + ' '):
+            return float(texto.rsplit(' ', 1)[1])
+    return 0.0
+
+
+def test_metrics_contam_requisicoes_e_sql(client):
+    criar_produto(client, 1)
+    requisicoes = 'kanban_http_requests_total{metodo="GET",rota="/produtos",status="200"}'
+    comandos = 'kanban_http_request_sql_statements_sum{metodo="GET",rota="/produtos"}'
+    antes = amostra(client, requisicoes), amostra(client, comandos)
+    client.get('/produtos')
+    client.get('/produtos')
+    depois = amostra(client, requisicoes), amostra(client, comandos)
+    assert depois[0] - antes[0] == 2
+    assert depois[1] - antes[1] >= 2
+
+
+def test_desligado_nao_instala_nada(monkeypatch):
+    monkeypatch.setenv('KANBAN_METRICS', '0')
+    app = Flask('sem_metricas')
+    metricas.init_app(app)
+    assert app.config['METRICS_ENABLED'] is False
+    assert '/metrics' not in {regra.rule for regra in app.url_map.iter_rules()}
+    assert 'kanban_db_envoltorio' not in app.extensions
+    assert not app.before_request_funcs and not app.after_request_funcs
+    assert app.test_client().get('/metrics').status_code == 404
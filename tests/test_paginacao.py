@@ -0,0 +1,44 @@
+import pytest
+
+import paginacao
+from conftest import criar_produto
+
+
+def test_cursor_percorre_todas_as_ordens(client):
+    for numero in range(1, 8):
+        criar_produto(client, numero, etapa='Producao' if numero % 2 else 'Embalagem')
+
+    vistos, cursor = [], ''
+    while True:
+        pagina = client.get(f'/produtos?limit=3&cursor={cursor}').get_json()
+        vistos.extend(produto['OS'] for produto in pagina['items'])
+        cursor = pagina['next_cursor']
+        if cursor is None:
+            break
+    assert vistos == list(range(1, 8))
+
+    # Filtro e cursor juntos: o cursor continua de onde a página parou
+    primeira = client.get('/produtos?limit=2&etapa_id=3').get_json()
+    assert [produto['OS'] for produto in primeira['items']] == [1, 3]
+    segunda = client.get(f"/produtos?limit=2&etapa_id=3&cursor={primeira['next_cursor']}").get_json()
+    assert [produto['OS'] for produto in segunda['items']] == [5, 7]
+    assert segunda['next_cursor'] is None
+
+
+def test_cursor_codifica_o_ultimo_id():
+    assert paginacao.decode_cursor(paginacao.encode_cursor(12345)) == 12345
+
+
+@pytest.mark.parametrize('query, erro', [
+    ('limit=2&cursor=nao-e-cursor', 'Cursor inválido'),
+    ('limit=0', "'limit' deve ser maior que zero"),
+    ('limit=dez', "Valor inválido para 'limit': dez"),
+    ('etapa_id=3,x', "Valor inválido para 'etapa_id': 3,x"),
+    ('data_entrega_ate=31/01/2026', "Valor inválido para 'data_entrega_ate': 31/01/2026"),
+    ('status=perdida', "Valor inválido para 'status': perdida"),
+])
+def test_parametro_invalido_da_400(client, query, erro):
+    criar_produto(client, 1)
+    resposta = client.get(f'/produtos?{query}')
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {'error': erro}
@@ -0,0 +1,120 @@
+import io
+
+import pytest
+
+import arquivo
+import db
+import paginacao
+from conftest import criar_produto
+
+# Toda consulta que as rotas quentes realmente executam (gravadas pelo trace
+# do SQLite, com os parâmetros já no texto) passa por EXPLAIN QUERY PLAN: uma
+# varredura de tabela grande sem estar na lista do caso é índice faltando.
+
+# Tabelas pequenas (e os aliases que as rotas usam para elas)
+PEQUENAS = {'etapa', 'e', 'etapa_capacidade', 'c', 'versao_dados', 'etapa_versao', 'json_each', 'CONSTANT'}
+
+CASOS = [
+    ('GET', '/produtos?etapa_id=3', None, set()),
+    ('GET', '/produtos?OS=2', None, set()),
+    ('GET', '/produtos?data_entrega_ate=2026-01-31&limit=2', None, {'op'}),
+    ('GET', f'/produtos?limit=2&cursor={paginacao.encode_cursor(2)}', None, set()),
+    ('GET', '/produtos?include_archived=1&OS=1', None, set()),
+    ('GET', '/tarefas?ordem_id=2', None, set()),
+    ('GET', '/tarefas?etapa_id=4', None, set()),
+    ('GET', '/tarefas?OS=2', None, set()),
+    # status tem três valores: um índice não ajudaria
+    ('GET', '/tarefas?status=pendente', None, {'t'}),
+    ('GET', '/tarefas?include_archived=1&ordem_id=1', None, set()),
+    ('GET', '/funcionarios?etapa_id=3', None, set()),
+    ('GET', '/etapas/3', None, set()),
+    ('GET', '/produtos/2/tarefas', None, set()),
+    ('GET', '/etapas/4/tarefas', None, set()),
+    ('GET', '/sync?since=3', None, set()),
+    ('GET', '/board?etapa_id=3', None, set()),
+    ('GET', '/produtos/2/historico', None, set()),
+    ('PUT', '/tarefas/2', {'status': 'em_andamento'}, set()),
+    ('PATCH', '/tarefas', [{'id': 2, 'status': 'pendente'}], set()),
+    ('PATCH', '/produtos/3', {'etapa_id': 9}, set()),
+    ('POST', '/produtos/mover', {'etapa': 'Embalagem', 'ids': [3, 4]}, set()),
+    ('POST', '/produtos/mover', {'etapa': 'Producao', 'filtro': {'etapa_id': 9}}, set()),
+    ('POST', '/produtos/1/restaurar', None, set()),
+]
+
+
+@pytest.fixture
+def gravadas(app, client, monkeypatch):
+    # OS 1 arquivada; OS 2 com tarefas; funcionário na Producao
+    for numero in range(1, 6):
+        criar_produto(client, numero)
+    assert client.post('/produtos/1/tarefas', json=[{'etapa_id': 4, 'descricao': 'a', 'quantidade': 1}]).status_code == 201
+    assert client.post('/produtos/2/tarefas', json=[{'etapa_id': 4, 'descricao': 'b', 'quantidade': 2}]).status_code == 201
+    client.post('/funcionarios', json={'nome': 'Ana', 'etapa': 'Producao', 'producao_media': 5})
+    client.post('/produtos/mover', json={'etapa': 'Entregue', 'ids': [1]})
+    with app.app_context():
+        assert arquivo.arquivar(db.get_db_connection(), 0, 100) == (1, 1)
+
+    lista = []
+    original = db.connect
+
+    def connect(*args, **kwargs):
+        conn = original(*args, **kwargs)
+        conn.set_trace_callback(lista.append)
+        return conn
+
+    monkeypatch.setattr(db, 'connect', connect)
+    db.descartar(app)
+    return lista
+
+
+def varreduras(conn, sql):
+    # Nomes em SCAN, menos os de subconsultas já filtradas (CO-ROUTINE,
+    # MATERIALIZE) e os das tabelas pequenas
+    plano = [row['detail'].split() for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+    subconsultas = {partes[1] for partes in plano if partes[0] in ('CO-ROUTINE', 'MATERIALIZE')}
+    return {partes[1] for partes in plano
+            if partes[0] == 'SCAN' and partes[1] not in subconsultas and partes[1] not in PEQUENAS}
+
+
+def problemas(app, lista, permitidas=frozenset()):
+    # Conexão nova: EXPLAIN não lê o banco, então uma conexão aberta antes
+    # de uma mudança de índice ainda planejaria com o schema antigo
+    conn = db.connect(app.config['DATABASE'])
+    try:
+        executadas = list(consultas(lista))
+        assert executadas
+        encontrados = [(sql, sorted(varreduras(conn, sql) - permitidas)) for sql in executadas]
+        return [(sql, tabelas) for sql, tabelas in encontrados if tabelas]
+    finally:
+        conn.close()
+
+
+def consultas(lista):
+    for sql in lista:
+        comando = sql.lstrip().split(None, 1)[0].upper()
+        if comando in ('SELECT', 'WITH', 'UPDATE', 'DELETE') or (comando == 'INSERT' and 'SELECT' in sql.upper()):
+            yield ' '.join(sql.split())
+
+
+@pytest.mark.parametrize('metodo,url,corpo,permitidas', CASOS, ids=[f'{c[0]} {c[1]}' for c in CASOS])
+def test_rotas_quentes_usam_indice(app, client, gravadas, metodo, url, corpo, permitidas):
+    resposta = client.open(url, method=metodo, json=corpo)
+    assert resposta.status_code < 300, resposta.get_json()
+    assert problemas(app, gravadas, permitidas) == []
+
+
+def test_importacao_usa_indice(app, client, gravadas):
+    planilha = b'OS,produto,estampa,quantidade,data_entrega,cliente_final,etapa\n' \
+               b'2,x,y,5,2026-01-01,c,Producao\n10,x,y,5,2026-01-01,c,Producao\n'
+    resposta = client.post('/importar/produtos', data={'file': (io.BytesIO(planilha), 'a.csv')},
+                           content_type='multipart/form-data')
+    assert resposta.status_code == 201, resposta.get_json()
+    assert problemas(app, gravadas) == []
+
+
+def test_arquivamento_usa_indice(app, client, gravadas):
+    client.post('/produtos/mover', json={'etapa': 'Entregue', 'ids': [2]})
+    del gravadas[:]
+    with app.app_context():
+        assert arquivo.arquivar(db.get_db_connection(), 0, 100) == (1, 1)
+    assert problemas(app, gravadas) == []
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import plantas
+
+
+@pytest.fixture
+def multiplanta(app, tmp_path, monkeypatch):
+    # norte e sul declaradas; registro novo para não herdar plantas abertas
+    # (com o caminho de outro teste) do app compartilhado
+    monkeypatch.setitem(app.config, 'PLANTAS_DIR', str(tmp_path / 'plantas'))
+    monkeypatch.setitem(app.config, 'PLANTAS', ['norte', 'sul'])
+    monkeypatch.setitem(app.config, 'PLANTA_PADRAO', '')
+    registro = plantas.Registro(app)
+    monkeypatch.setitem(app.extensions, 'kanban_plantas', registro)
+    yield registro
+    if registro._executor is not None:
+        registro._executor.shutdown()
+
+
+def test_rota_de_planta_sem_planta_responde_400(client, multiplanta):
+    assert client.get('/etapas').status_code == 400
+    assert client.get('/plantas/leste/etapas').status_code == 404
+    assert client.get('/etapas', headers={'X-Planta': 'leste'}).status_code == 404
+
+
+def test_metrics_nao_pede_planta(client, multiplanta):
+    client.get('/plantas/norte/etapas')
+    resposta = client.get('/metrics')
+    assert resposta.status_code == 200
+    assert 'kanban_http_requests_total' in resposta.get_data(as_text=True)
+    assert client.get('/plantas/norte/metrics').status_code == 200
+
+
+def test_cada_planta_tem_o_proprio_banco(client, multiplanta):
+    assert client.post('/plantas/norte/produtos', json={
+        'OS': 7, 'produto': 'Lençol', 'estampa': 'Liso', 'quantidade': 3,
+        'data_entrega': '2026-01-31', 'etapa': 'Producao'
+    }).status_code == 201
+
+    norte = client.get('/plantas/norte/produtos').get_json()
+    assert [produto['OS'] for produto in norte] == [7]
+    pelo_header = client.get('/produtos', headers={'X-Planta': 'norte'}).get_json()
+    assert [produto['OS'] for produto in pelo_header] == [7]
+    assert client.get('/plantas/sul/produtos').get_json() == []
+    assert os.path.exists(multiplanta.caminho('norte'))
+    assert os.path.exists(multiplanta.caminho('sul'))
+
+    agregado = client.get('/agregado/etapas').get_json()
+    assert agregado['falhas'] == []
+    assert [planta['planta'] for planta in agregado['plantas']] == ['norte', 'sul']
+    producao = next(etapa for etapa in agregado['etapas'] if etapa['nome'] == 'Producao')
+    assert producao['total_ordens'] == 1
+
+
+def test_etag_e_da_planta(client, multiplanta):
+    norte = client.get('/plantas/norte/etapas')
+    sul = client.get('/plantas/sul/etapas')
+    assert norte.headers['ETag'] != sul.headers['ETag']
+    assert 'X-Planta' in norte.headers['Vary']
+
+    mesma = client.get('/plantas/norte/etapas', headers={'If-None-Match': norte.headers['ETag']})
+    assert mesma.status_code == 304
+    outra = client.get('/plantas/sul/etapas', headers={'If-None-Match': norte.headers['ETag']})
+    assert outra.status_code == 200
@@ -0,0 +1,41 @@
+import datetime
+
+import previsao
+from conftest import criar_produto
+
+
+def test_304_nao_passa_da_virada_do_dia(client, monkeypatch):
+    criar_produto(client, 1)
+    monkeypatch.setattr(previsao, 'hoje', lambda: datetime.date(2026, 1, 10))
+    primeira = client.get('/previsao')
+    assert primeira.status_code == 200
+    assert primeira.get_json()['data_base'] == '2026-01-10'
+    etag = primeira.headers['ETag']
+    assert client.get('/previsao', headers={'If-None-Match': etag}).status_code == 304
+
+    # Mesma versão dos dados, outro dia: a previsão é outra
+    monkeypatch.setattr(previsao, 'hoje', lambda: datetime.date(2026, 1, 11))
+    segunda = client.get('/previsao', headers={'If-None-Match': etag})
+    assert segunda.status_code == 200
+    assert segunda.get_json()['data_base'] == '2026-01-11'
+    assert segunda.headers['ETag'] != etag
+
+
+def test_escrita_invalida_o_etag(client):
+    criar_produto(client, 1)
+    etag = client.get('/previsao').headers['ETag']
+    criar_produto(client, 2)
+    resposta = client.get('/previsao', headers={'If-None-Match': etag})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['ordens']) == 2
+
+
+def test_os_e_quantidade_fora_do_tipo(client):
+    # POST /produtos grava o que vier: uma linha assim não derruba a previsão
+    criar_produto(client, 1)
+    criar_produto(client, 'A-10')
+    criar_produto(client, 3, quantidade='muitas')
+    resposta = client.get('/previsao')
+    assert resposta.status_code == 200
+    # A OS em texto segue na lista; sem quantidade numérica a ordem sai
+    assert {ordem['OS'] for ordem in resposta.get_json()['ordens']} == {1, 'A-10'}
@@ -0,0 +1,31 @@
+import pytest
+
+from conftest import criar_produto
+
+
+def etapas(conn):
+    return [row[0] for row in conn.execute('SELECT etapa_id FROM ordem_producao ORDER BY id')]
+
+
+@pytest.mark.parametrize('filtro, erro', [
+    # Chave com erro de digitação: sem a checagem o quadro inteiro ia junto
+    ({'etapa': 'Romaneio'}, 'Filtro desconhecido: etapa'),
+    ({'etapa_id': 10, 'data_entrega': '2026-01-31'}, 'Filtro desconhecido: data_entrega'),
+    ({'etapa_id': '', 'OS': None}, "'filtro' não tem nenhuma condição"),
+])
+def test_mover_recusa_filtro_que_nao_filtra(client, conn, filtro, erro):
+    for numero in range(1, 5):
+        criar_produto(client, numero)
+    resposta = client.post('/produtos/mover', json={'etapa': 'Cancelado', 'filtro': filtro})
+    assert resposta.status_code == 400
+    assert resposta.get_json()['error'] == erro
+    assert etapas(conn) == [3, 3, 3, 3]
+
+
+def test_mover_por_filtro(client, conn):
+    for numero in range(1, 5):
+        criar_produto(client, numero, etapa='Romaneio' if numero % 2 else 'Producao')
+    resposta = client.post('/produtos/mover', json={'etapa': 'Entregue', 'filtro': {'etapa_id': 10}})
+    assert resposta.status_code == 200
+    assert resposta.get_json()['ids'] == [1, 3]
+    assert etapas(conn) == [11, 3, 11, 3]
@@ -0,0 +1,40 @@
+import gzip
+import json
+
+import pytest
+
+from conftest import criar_produto
+
+
+@pytest.fixture
+def lista_grande(app, client, monkeypatch):
+    # Qualquer resposta acima de 1 byte é comprimida
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 1)
+    for numero in range(1, 4):
+        criar_produto(client, numero)
+
+
+@pytest.mark.parametrize('codificacao', ['gzip', 'deflate'])
+def test_resposta_comprimida_tem_etag_proprio(client, lista_grande, codificacao):
+    simples = client.get('/produtos', headers={'Accept-Encoding': 'identity'})
+    comprimida = client.get('/produtos', headers={'Accept-Encoding': codificacao})
+    assert 'Content-Encoding' not in simples.headers
+    assert comprimida.headers['Content-Encoding'] == codificacao
+    etag, fraco = simples.get_etag()
+    assert comprimida.get_etag() == (f'{etag}-{codificacao}', fraco)
+
+
+def test_304_aceita_as_duas_formas(client, lista_grande):
+    comprimida = client.get('/produtos', headers={'Accept-Encoding': 'gzip'})
+    assert json.loads(gzip.decompress(comprimida.get_data()))
+    etag_gzip = comprimida.headers['ETag']
+    etag = client.get('/produtos', headers={'Accept-Encoding': 'identity'}).headers['ETag']
+
+    for enviado in (etag_gzip, etag, 'W/' + etag_gzip):
+        resposta = client.get('/produtos', headers={'Accept-Encoding': 'gzip', 'If-None-Match': enviado})
+        assert resposta.status_code == 304
+        assert resposta.headers['ETag'] == enviado.removeprefix('W/')
+
+    criar_produto(client, 9)
+    resposta = client.get('/produtos', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag_gzip})
+    assert resposta.status_code == 200
@@ -0,0 +1,40 @@
+import arquivo
+import db
+from conftest import criar_produto
+
+
+def ids(lista):
+    return sorted(item['id'] for item in lista)
+
+
+def test_arquivo_e_restauracao_no_delta(app, client):
+    for numero in (1, 2):
+        criar_produto(client, numero)
+    assert client.post('/produtos/1/tarefas', json=[
+        {'etapa_id': 4, 'descricao': 'a', 'quantidade': 1},
+        {'etapa_id': 5, 'descricao': 'b', 'quantidade': 1},
+    ]).status_code == 201
+    client.post('/produtos/mover', json={'etapa': 'Entregue', 'ids': [1]})
+    antes = client.get('/sync').get_json()
+    assert antes['completo'] is True
+    assert ids(antes['produtos']) == [1, 2]
+
+    with app.app_context():
+        assert arquivo.arquivar(db.get_db_connection(), 0, 100) == (1, 2)
+    depois_do_arquivo = client.get(f"/sync?since={antes['versao']}").get_json()
+    assert depois_do_arquivo['completo'] is False
+    assert depois_do_arquivo['removidos'] == {'produtos': [1], 'tarefas': [1, 2], 'funcionarios': []}
+    assert depois_do_arquivo['produtos'] == [] and depois_do_arquivo['tarefas'] == []
+
+    assert client.post('/produtos/1/restaurar').status_code == 200
+    depois_da_restauracao = client.get(f"/sync?since={depois_do_arquivo['versao']}").get_json()
+    assert ids(depois_da_restauracao['produtos']) == [1]
+    assert ids(depois_da_restauracao['tarefas']) == [1, 2]
+    assert depois_da_restauracao['removidos'] == {'produtos': [], 'tarefas': [], 'funcionarios': []}
+
+    # Quem ficou parado desde antes do arquivo só vê a ordem de volta, sem a
+    # remoção no mesmo delta
+    atravessando = client.get(f"/sync?since={antes['versao']}").get_json()
+    assert ids(atravessando['produtos']) == [1]
+    assert ids(atravessando['tarefas']) == [1, 2]
+    assert atravessando['removidos'] == {'produtos': [], 'tarefas': [], 'funcionarios': []}
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import criar_produto
+
+
+@pytest.fixture
+def tarefas(client):
+    criar_produto(client, 1)
+    assert client.post('/produtos/1/tarefas', json=[
+        {'etapa_id': 4, 'descricao': 'bainha', 'quantidade': 5},
+        {'etapa_id': 7, 'descricao': 'elastico', 'quantidade': 3},
+        {'etapa_id': 8, 'descricao': 'canto', 'quantidade': 2},
+    ]).status_code == 201
+
+
+def linhas(conn):
+    return [tuple(row) for row in conn.execute('SELECT id, descricao, status FROM tarefas ORDER BY id')]
+
+
+INVALIDOS = [
+    {'id': 2, 'descricao': None},
+    {'id': 3, 'status': ['x']},
+    {'id': 3, 'status': 'feito'},
+    {'id': 2, 'quantidade': True},
+]
+
+
+def test_lote_misto_grava_os_validos(client, conn, tarefas):
+    resposta = client.patch('/tarefas', json=[{'id': 1, 'status': 'concluido'}] + INVALIDOS)
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert [tarefa['id'] for tarefa in corpo['tarefas']] == [1]
+    assert [(erro['indice'], erro['id']) for erro in corpo['errors']] == [(1, 2), (2, 3), (3, 3), (4, 2)]
+    assert corpo['errors'][0]['error'] == 'Descrição inválida'
+    assert corpo['errors'][1]['error'] == 'Status inválido, use um de: pendente, em_andamento, concluido'
+    assert linhas(conn) == [(1, 'bainha', 'concluido'), (2, 'elastico', 'pendente'), (3, 'canto', 'pendente')]
+
+
+def test_lote_misto_tudo_ou_nada(client, conn, tarefas):
+    resposta = client.patch('/tarefas', json={
+        'tarefas': [{'id': 1, 'status': 'concluido'}] + INVALIDOS, 'tudo_ou_nada': True
+    })
+    assert resposta.status_code == 400
+    assert len(resposta.get_json()['errors']) == len(INVALIDOS)
+    assert linhas(conn) == [(1, 'bainha', 'pendente'), (2, 'elastico', 'pendente'), (3, 'canto', 'pendente')]
+
+    resposta = client.patch('/tarefas', json={
+        'tarefas': [{'id': 1, 'status': 'concluido'}, {'id': 2, 'descricao': 'bainha dupla'}], 'tudo_ou_nada': True
+    })
+    assert resposta.status_code == 200
+    assert resposta.get_json()['errors'] == []
+    assert linhas(conn) == [(1, 'bainha', 'concluido'), (2, 'bainha dupla', 'pendente'), (3, 'canto', 'pendente')]
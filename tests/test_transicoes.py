@@ -0,0 +1,79 @@
+import datetime
+
+import arquivo
+import db
+import transicoes
+from conftest import criar_produto
+
+
+def consolidar(app):
+    return arquivo.get_arquivador(app).consolidar()
+
+
+def estadia(conn):
+    return [tuple(row) for row in conn.execute('SELECT entidade, registro_id, etapa_id, desde FROM estadia '
+                                               'ORDER BY entidade, registro_id')]
+
+
+def test_arquivar_e_restaurar_nao_sao_transicoes(app, client, conn):
+    criar_produto(client, 1)
+    assert client.post('/produtos/1/tarefas', json=[
+        {'etapa_id': 4, 'descricao': 'a', 'quantidade': 1},
+        {'etapa_id': 5, 'descricao': 'b', 'quantidade': 1},
+    ]).status_code == 201
+    client.put('/tarefas/2', json={'status': 'concluido'})
+    client.post('/produtos/mover', json={'etapa': 'Entregue', 'ids': [1]})
+    antes = conn.execute('SELECT COUNT(*) FROM transicoes').fetchone()[0]
+    ocupadas = estadia(conn)
+    assert [linha[:3] for linha in ocupadas] == [('ordem', 1, 11), ('tarefa', 1, 4)]
+
+    with app.app_context():
+        assert arquivo.arquivar(db.get_db_connection(), 0, 100) == (1, 2)
+    # Arquivada, a ordem e as tarefas não ocupam mais etapa nenhuma
+    assert estadia(conn) == []
+
+    assert client.post('/produtos/1/restaurar').status_code == 200
+    assert conn.execute('SELECT COUNT(*) FROM transicoes').fetchone()[0] == antes
+    assert conn.execute('SELECT COUNT(*) FROM transicao_silencio').fetchone()[0] == 0
+    # A permanência na etapa final continua contando de quando a ordem
+    # chegou; a da tarefa em aberto fica desconhecida
+    assert estadia(conn) == [ocupadas[0], ('tarefa', 1, 4, None)]
+
+    consolidar(app)
+    etapas = client.get('/indicadores/etapas').get_json()['etapas']
+    entregue = next(etapa for etapa in etapas if etapa['nome'] == 'Entregue')
+    assert entregue['total']['pecas_entrada'] == 10
+    assert entregue['total']['pecas_saida'] == 0
+    assert entregue['total']['wip'] == 10
+
+
+def test_consulta_so_le_os_resumos(app, client, conn):
+    criar_produto(client, 1)
+    hoje = datetime.datetime.now(datetime.timezone.utc).date()
+    url = f'/indicadores/etapas?de={hoje - datetime.timedelta(days=1)}&ate={hoje}'
+    resposta = client.get(url)
+    assert resposta.get_json()['etapas'] == []
+    assert transicoes.consolidado(conn) == 0
+
+    # A thread de manutenção consolida sem escrita nova: o ETag muda junto
+    assert consolidar(app) == 1
+    nova = client.get(url, headers={'If-None-Match': resposta.headers['ETag']})
+    assert nova.status_code == 200
+    assert [etapa['nome'] for etapa in nova.get_json()['etapas']] == ['Producao']
+    assert consolidar(app) == 0
+
+
+def test_etag_inclui_a_janela(client):
+    criar_produto(client, 1)
+    url = '/indicadores/etapas?de=2026-01-01&ate=2026-01-10'
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    outra = client.get('/indicadores/etapas?de=2026-01-01&ate=2026-01-11', headers={'If-None-Match': etag})
+    assert outra.status_code == 200
+
+
+def test_percentil_na_primeira_faixa():
+    assert transicoes.percentil({0: 10}, 50) == 0.0
+    assert transicoes.percentil({0: 10}, 90) == 0.0
+    # Nas outras faixas segue interpolando
+    assert transicoes.percentil({0: 1, 1: 1}, 100) == 75.0
@@ -0,0 +1,79 @@
+import io
+
+import arquivo
+import capacidade
+import db
+from conftest import criar_produto
+
+# As tabelas mantidas por triggers precisam bater com o recálculo a partir
+# das tabelas de origem depois de qualquer sequência de escritas das rotas
+
+RESUMO_RECALCULADO = '''
+    SELECT ordem_id, COUNT(*), SUM(COALESCE(status, '') != 'concluido')
+    FROM tarefas
+    GROUP BY ordem_id
+    ORDER BY ordem_id
+'''
+CARGA_RECALCULADA = '''
+    SELECT ordem_id, etapa_id, SUM(COALESCE(quantidade, 0))
+    FROM tarefas
+    WHERE COALESCE(status, '') != 'concluido'
+    GROUP BY ordem_id, etapa_id
+    ORDER BY ordem_id, etapa_id
+'''
+
+
+def tuplas(conn, sql):
+    return [tuple(row) for row in conn.execute(sql)]
+
+
+def conferir(conn):
+    assert capacidade.check(conn) == []
+    # Ordens sem nenhuma tarefa ficam fora da comparação (resumo zerado)
+    assert tuplas(conn, 'SELECT ordem_id, total, abertas FROM ordem_tarefas_resumo WHERE total > 0 '
+                        'ORDER BY ordem_id') == tuplas(conn, RESUMO_RECALCULADO)
+    assert tuplas(conn, 'SELECT ordem_id, etapa_id, quantidade FROM ordem_carga_aberta '
+                        'ORDER BY ordem_id, etapa_id') == tuplas(conn, CARGA_RECALCULADA)
+
+
+def test_resumos_batem_com_o_recalculo(app, client, conn):
+    for numero in range(1, 5):
+        criar_produto(client, numero, quantidade=10 * numero)
+    for nome, etapa, producao in (('Ana', 'Producao', 5), ('Bia', 'Embalagem', 7), ('Caio', 'Elastico', 3)):
+        assert client.post('/funcionarios', json={
+            'nome': nome, 'etapa': etapa, 'producao_media': producao
+        }).status_code == 201
+    for ordem in (1, 2, 3):
+        assert client.post(f'/produtos/{ordem}/tarefas', json=[
+            {'etapa_id': 4, 'descricao': 'bainha', 'quantidade': 5},
+            {'etapa_id': 7, 'descricao': 'elastico', 'quantidade': 3},
+        ]).status_code == 201
+    conferir(conn)
+
+    # Tarefas: status, quantidade e etapa, uma a uma e em lote
+    assert client.put('/tarefas/1', json={'status': 'em_andamento', 'quantidade': 8}).status_code == 200
+    assert client.put('/tarefas/2', json={'etapa_id': 6}).status_code == 200
+    assert client.patch('/tarefas', json=[
+        {'id': 3, 'status': 'concluido'}, {'id': 4, 'quantidade': 1}
+    ]).status_code == 200
+    conferir(conn)
+
+    # Fechar todas as tarefas da ordem 1 a avança para a Embalagem
+    assert client.patch('/tarefas', json=[{'id': 1, 'status': 'concluido'}, {'id': 2, 'status': 'concluido'}]) \
+        .status_code == 200
+    conferir(conn)
+
+    # Ordens e funcionários trocando de etapa, importação, arquivo e restauração
+    assert client.patch('/produtos/4', json={'etapa_id': 9}).status_code == 200
+    assert client.post('/produtos/mover', json={'etapa': 'Entregue', 'ids': [1, 2]}).status_code == 200
+    assert client.post('/funcionarios/alocacao', json={'aplicar': True}).status_code == 200
+    planilha = b'OS,produto,estampa,quantidade,data_entrega,etapa\n10,x,y,5,2026-01-31,Producao\n'
+    assert client.post('/importar/produtos', data={'file': (io.BytesIO(planilha), 'a.csv')},
+                       content_type='multipart/form-data').status_code == 201
+    conferir(conn)
+
+    with app.app_context():
+        assert arquivo.arquivar(db.get_db_connection(), 0, 100) == (2, 4)
+    conferir(conn)
+    assert client.post('/produtos/2/restaurar').status_code == 200
+    conferir(conn)
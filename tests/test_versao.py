@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import criar_produto
+
+ROTAS = ['/produtos', '/funcionarios', '/tarefas', '/etapas', '/etapas/3', '/etapas/4/tarefas',
+         '/produtos/1/tarefas', '/board']
+
+
+@pytest.fixture
+def quadro(client):
+    criar_produto(client, 1)
+    assert client.post('/produtos/1/tarefas', json=[
+        {'etapa_id': 4, 'descricao': 'bainha', 'quantidade': 5},
+    ]).status_code == 201
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_304_com_o_mesmo_etag(client, quadro, rota):
+    primeira = client.get(rota)
+    assert primeira.status_code == 200
+    assert primeira.headers['Cache-Control'] == 'no-cache'
+    resposta = client.get(rota, headers={'If-None-Match': primeira.headers['ETag']})
+    assert resposta.status_code == 304
+    assert resposta.get_data() == b''
+    assert resposta.headers['ETag'] == primeira.headers['ETag']
+
+
+@pytest.mark.parametrize('escrita', [
+    lambda client: client.put('/tarefas/1', json={'status': 'em_andamento'}),
+    lambda client: client.patch('/produtos/1', json={'etapa_id': 9}),
+    lambda client: client.post('/funcionarios', json={'nome': 'Ana', 'etapa': 'Producao', 'producao_media': 5}),
+])
+def test_escrita_muda_o_etag(client, quadro, escrita):
+    etags = {rota: client.get(rota).headers['ETag'] for rota in ROTAS}
+    assert escrita(client).status_code in (200, 201)
+    for rota, etag in etags.items():
+        resposta = client.get(rota, headers={'If-None-Match': etag})
+        assert resposta.status_code == 200, rota
+        assert resposta.headers['ETag'] != etag
+
+
+def test_escrita_recusada_mantem_o_etag(client, quadro):
+    etag = client.get('/produtos').headers['ETag']
+    assert client.put('/tarefas/99', json={'status': 'concluido'}).status_code == 404
+    assert client.get('/produtos', headers={'If-None-Match': etag}).status_code == 304
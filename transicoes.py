@@ -0,0 +1,272 @@
+import bisect
+import collections
+import contextlib
+import datetime
+import threading
+
+import db
+import paginacao
+import serializacao
+
+# Indicadores por etapa a partir do log de transições (migração 9). Os
+# triggers só acrescentam linhas ao log; consolidar() lê o que entrou desde
+# a última vez (transicao_consolidacao.ultimo_id) e soma nos resumos por
+# hora e por dia: peças e itens que entraram e saíram de cada etapa e o
+# histograma das permanências. A thread de manutenção (arquivo.py) chama
+# consolidar() a cada TRANSICOES_INTERVALO segundos. As consultas de
+# indicadores só leem os resumos, então o custo não cresce com o tamanho
+# do log.
+#
+# Períodos em UTC (CURRENT_TIMESTAMP do SQLite): 'YYYY-MM-DD HH' por hora e
+# 'YYYY-MM-DD' por dia. Mediana e p90 saem do histograma, interpolados
+# dentro da faixa (faixas crescem 25% cada, de 1 minuto a ~1 ano).
+
+LOTE_CONSOLIDACAO = 50000
+
+# Limite superior (segundos) de cada faixa; a última faixa é "acima disso"
+FAIXAS = [60 * 1.25 ** k for k in range(60)]
+
+GRANULARIDADES = {
+    # nome: (tamanho da chave em 'momento', período máximo de uma consulta)
+    'hora': (13, datetime.timedelta(days=31)),
+    'dia': (10, datetime.timedelta(days=366)),
+}
+PERIODO_PADRAO = {'hora': datetime.timedelta(hours=48), 'dia': datetime.timedelta(days=30)}
+
+
+def faixa(segundos):
+    return bisect.bisect_left(FAIXAS, segundos)
+
+
+def _limites(indice):
+    inferior = FAIXAS[indice - 1] if indice > 0 else 0.0
+    superior = FAIXAS[indice] if indice < len(FAIXAS) else FAIXAS[-1] * 1.25
+    return inferior, superior
+
+
+def percentil(histograma, p):
+    # histograma: {faixa: quantidade}; interpolação linear dentro da faixa
+    total = sum(histograma.values())
+    if not total:
+        return None
+    alvo = p / 100 * total
+    acumulado = 0
+    for indice in sorted(histograma):
+        n = histograma[indice]
+        if acumulado + n >= alvo:
+            inferior, superior = _limites(indice)
+            # Abaixo de 1 minuto a interpolação inventaria valores (permanências
+            # zeradas dariam mediana de 30 s): vale o limite inferior
+            if indice == 0:
+                return inferior
+            return round(inferior + (superior - inferior) * (alvo - acumulado) / n, 1)
+        acumulado += n
+    return None
+
+
+@contextlib.contextmanager
+def silencio(conn):
+    # Escritas que não são transições (arquivar/restaurar) ficam fora do
+    # log; a linha só existe dentro da transação de quem a gravou
+    conn.execute('INSERT OR IGNORE INTO transicao_silencio (id) VALUES (1)')
+    try:
+        yield
+    finally:
+        conn.execute('DELETE FROM transicao_silencio')
+
+
+def consolidado(conn):
+    # Até onde o log já está nos resumos
+    return conn.execute('SELECT ultimo_id FROM transicao_consolidacao WHERE id = 1').fetchone()[0]
+
+
+def pendente(conn):
+    # Há log além da marca? Só leitura (MAX do id é a última folha da
+    # árvore), para não abrir transação de escrita a cada passada
+    row = conn.execute('''
+        SELECT (SELECT MAX(id) FROM transicoes) > ultimo_id FROM transicao_consolidacao WHERE id = 1
+    ''').fetchone()
+    return bool(row and row[0])
+
+
+def consolidar(conn, lote=LOTE_CONSOLIDACAO, app=None):
+    # Lê o log a partir da marca, em lotes, e soma nos resumos; devolve
+    # quantas transições foram consolidadas. Uma transação por lote e uma
+    # trava por banco, para não consolidar o mesmo trecho duas vezes.
+    total = 0
+    with db.estado('transicoes', lambda path: threading.Lock(), app):
+        while True:
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            ultimo = conn.execute('SELECT ultimo_id FROM transicao_consolidacao WHERE id = 1').fetchone()[0]
+            rows = serializacao.cursor_tuplas(conn).execute('''
+                SELECT id, momento, sai_de, entra_em, quantidade_saida, quantidade_entrada, permanencia_segundos
+                FROM transicoes
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (ultimo, lote)).fetchall()
+            if not rows:
+                conn.rollback()
+                return total
+
+            resumo = collections.defaultdict(lambda: [0, 0, 0, 0])
+            permanencias = collections.Counter()
+            for _, momento, sai_de, entra_em, saida, entrada, permanencia in rows:
+                for granularidade, (tamanho, _) in GRANULARIDADES.items():
+                    periodo = momento[:tamanho]
+                    if entra_em is not None:
+                        valores = resumo[(granularidade, periodo, entra_em)]
+                        valores[0] += entrada or 0
+                        valores[2] += 1
+                    if sai_de is not None:
+                        valores = resumo[(granularidade, periodo, sai_de)]
+                        valores[1] += saida or 0
+                        valores[3] += 1
+                        if permanencia is not None:
+                            permanencias[(granularidade, periodo, sai_de, faixa(max(permanencia, 0)))] += 1
+
+            conn.executemany('''
+                INSERT INTO transicao_resumo (granularidade, periodo, etapa_id, pecas_entrada, pecas_saida,
+                                              itens_entrada, itens_saida)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (granularidade, periodo, etapa_id) DO UPDATE SET
+                    pecas_entrada = pecas_entrada + excluded.pecas_entrada,
+                    pecas_saida = pecas_saida + excluded.pecas_saida,
+                    itens_entrada = itens_entrada + excluded.itens_entrada,
+                    itens_saida = itens_saida + excluded.itens_saida
+            ''', [(*chave, *valores) for chave, valores in resumo.items()])
+            conn.executemany('''
+                INSERT INTO transicao_permanencia (granularidade, periodo, etapa_id, faixa, quantidade)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (granularidade, periodo, etapa_id, faixa) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade
+            ''', [(*chave, n) for chave, n in permanencias.items()])
+            conn.execute('UPDATE transicao_consolidacao SET ultimo_id = ? WHERE id = 1', (rows[-1][0],))
+            conn.commit()
+            total += len(rows)
+            if len(rows) < lote:
+                return total
+
+
+def _instante(valor, nome, fim=False):
+    # 'YYYY-MM-DD' ou 'YYYY-MM-DDTHH[:MM[:SS]]'; data pura no fim vale o dia todo
+    try:
+        if len(valor) == 10:
+            dia = datetime.datetime.combine(datetime.date.fromisoformat(valor), datetime.time())
+            return dia + datetime.timedelta(days=1) - datetime.timedelta(seconds=1) if fim else dia
+        return datetime.datetime.fromisoformat(valor).replace(tzinfo=None)
+    except ValueError:
+        raise paginacao.ParametroInvalido(f"Valor inválido para '{nome}': {valor}")
+
+
+def opcoes(args, agora=None):
+    granularidade = args.get('granularidade', 'dia')
+    if granularidade not in GRANULARIDADES:
+        raise paginacao.ParametroInvalido(f"Valor inválido para 'granularidade': {granularidade}")
+    agora = agora or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    ate = _instante(args['ate'], 'ate', fim=True) if args.get('ate') else agora
+    de = _instante(args['de'], 'de') if args.get('de') else ate - PERIODO_PADRAO[granularidade]
+    if de > ate:
+        raise paginacao.ParametroInvalido("'de' deve ser anterior a 'ate'")
+    if ate - de > GRANULARIDADES[granularidade][1]:
+        raise paginacao.ParametroInvalido(
+            f"Intervalo maior que {GRANULARIDADES[granularidade][1].days} dias para granularidade '{granularidade}'"
+        )
+    etapa_ids = None
+    if args.get('etapa_id'):
+        try:
+            etapa_ids = [int(v) for v in args['etapa_id'].split(',')]
+        except ValueError:
+            raise paginacao.ParametroInvalido(f"Valor inválido para 'etapa_id': {args['etapa_id']}")
+    return granularidade, de, ate, etapa_ids
+
+
+def indicadores(conn, granularidade, de, ate, etapa_ids=None):
+    # Série por período e total do intervalo, por etapa, só dos resumos. O
+    # WIP ao fim de cada período é o WIP de partida (migração 9) mais o
+    # saldo de tudo o que entrou e saiu até ali.
+    tamanho = GRANULARIDADES[granularidade][0]
+    inicio = de.isoformat(sep=' ')[:tamanho]
+    fim = ate.isoformat(sep=' ')[:tamanho]
+    cursor = serializacao.cursor_tuplas(conn)
+
+    with db.snapshot(conn):
+        wip = collections.Counter(dict(cursor.execute('SELECT etapa_id, pecas FROM transicao_wip_inicial')))
+        # Saldo antes do intervalo: dias inteiros anteriores e, por hora, as
+        # horas do primeiro dia que ficam antes do início
+        for etapa_id, saldo in cursor.execute('''
+            SELECT etapa_id, SUM(pecas_entrada - pecas_saida) FROM transicao_resumo
+            WHERE granularidade = 'dia' AND periodo < ?
+            GROUP BY etapa_id
+        ''', (inicio[:10],)):
+            wip[etapa_id] += saldo
+        if granularidade == 'hora':
+            for etapa_id, saldo in cursor.execute('''
+                SELECT etapa_id, SUM(pecas_entrada - pecas_saida) FROM transicao_resumo
+                WHERE granularidade = 'hora' AND periodo >= ? AND periodo < ?
+                GROUP BY etapa_id
+            ''', (inicio[:10], inicio)):
+                wip[etapa_id] += saldo
+
+        serie = cursor.execute('''
+            SELECT etapa_id, periodo, pecas_entrada, pecas_saida, itens_entrada, itens_saida
+            FROM transicao_resumo
+            WHERE granularidade = ? AND periodo BETWEEN ? AND ?
+            ORDER BY etapa_id, periodo
+        ''', (granularidade, inicio, fim)).fetchall()
+        histogramas = collections.defaultdict(collections.Counter)
+        for etapa_id, periodo, indice, n in cursor.execute('''
+            SELECT etapa_id, periodo, faixa, quantidade
+            FROM transicao_permanencia
+            WHERE granularidade = ? AND periodo BETWEEN ? AND ?
+        ''', (granularidade, inicio, fim)):
+            histogramas[(etapa_id, periodo)][indice] += n
+            histogramas[(etapa_id, None)][indice] += n
+        nomes = dict(cursor.execute('SELECT id, nome FROM etapa').fetchall())
+
+    por_etapa = collections.OrderedDict()
+    for etapa_id, periodo, pecas_entrada, pecas_saida, itens_entrada, itens_saida in serie:
+        if etapa_ids and etapa_id not in etapa_ids:
+            continue
+        wip[etapa_id] += pecas_entrada - pecas_saida
+        histograma = histogramas.get((etapa_id, periodo), {})
+        etapa = por_etapa.setdefault(etapa_id, {
+            'etapa_id': etapa_id,
+            'nome': nomes.get(etapa_id),
+            'total': {'pecas_entrada': 0, 'pecas_saida': 0, 'itens_entrada': 0, 'itens_saida': 0},
+            'serie': [],
+        })
+        for chave, valor in (('pecas_entrada', pecas_entrada), ('pecas_saida', pecas_saida),
+                             ('itens_entrada', itens_entrada), ('itens_saida', itens_saida)):
+            etapa['total'][chave] += valor
+        etapa['serie'].append({
+            'periodo': periodo,
+            'pecas_entrada': pecas_entrada,
+            'pecas_saida': pecas_saida,
+            'itens_entrada': itens_entrada,
+            'itens_saida': itens_saida,
+            'wip': wip[etapa_id],
+            'permanencia_mediana_s': percentil(histograma, 50),
+            'permanencia_p90_s': percentil(histograma, 90),
+        })
+
+    for etapa_id, etapa in por_etapa.items():
+        histograma = histogramas.get((etapa_id, None), {})
+        etapa['total']['wip'] = etapa['serie'][-1]['wip']
+        etapa['total']['permanencia_mediana_s'] = percentil(histograma, 50)
+        etapa['total']['permanencia_p90_s'] = percentil(histograma, 90)
+    return list(por_etapa.values())
+
+
+def historico(conn, ordem_id):
+    # Linhas do log da ordem e das tarefas dela, em ordem
+    cursor = serializacao.cursor_tuplas(conn).execute('''
+        SELECT id, momento, entidade, registro_id, evento, de_etapa_id, para_etapa_id, de_status, para_status,
+               permanencia_segundos
+        FROM transicoes
+        WHERE ordem_id = ?
+        ORDER BY id
+    ''', (ordem_id,))
+    colunas = [coluna[0] for coluna in cursor.description]
+    return [dict(zip(colunas, row)) for row in cursor.fetchall()]
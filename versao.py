@@ -0,0 +1,63 @@
+import functools
+
+from flask import g, make_response, request
+
+import serializacao
+from db import get_db_connection
+
+# Contador global de versão dos dados (tabela versao_dados, migração 2).
+# Toda rota de escrita chama bump() dentro da própria transação; as rotas
+# de leitura usam o valor como ETag e respondem 304 sem consultar nada mais.
+
+
+# Versão que a transação em andamento vai publicar, para os triggers que
+# marcam cada linha alterada (migração 5): como toda escrita chama bump()
+# antes do commit, a linha nunca fica com versão que um cliente já viu
+PROXIMA_VERSAO = '(SELECT versao FROM versao_dados WHERE id = 1) + 1'
+
+
+def bump(conn):
+    conn.execute('UPDATE versao_dados SET versao = versao + 1 WHERE id = 1')
+
+
+def atual(conn):
+    row = conn.execute('SELECT versao FROM versao_dados WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def condicional(view=None, *, sufixo=None):
+    # sufixo(): o que além da versão muda a resposta (ex.: a data de hoje),
+    # acrescentado ao ETag
+    if view is None:
+        return functools.partial(condicional, sufixo=sufixo)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Versão lida antes dos dados: se algo mudar no meio, o ETag fica
+        # mais velho que o conteúdo e o cliente só recarrega de novo
+        etag = str(atual(get_db_connection(readonly=True)))
+        if sufixo is not None:
+            etag = f'{etag}-{sufixo()}'
+        # Cada planta tem o próprio contador: o nome entra no ETag para a
+        # mesma URL com outro X-Planta não responder 304 por engano
+        planta = g.get('_kanban_planta')
+        if planta is not None:
+            etag = f'{planta.nome}-{etag}'
+        # O cliente guarda o ETag com o sufixo da compressão quando a resposta
+        # veio comprimida (serializacao.comprimir); o 304 devolve o que casou.
+        # If-None-Match compara na forma fraca (RFC 9110), W/ também casa.
+        casado = next((variante for variante in [etag] + [f'{etag}-{c}' for c in serializacao.CODIFICACOES]
+                       if request.if_none_match.contains_weak(variante)), None)
+        if casado is not None:
+            response = make_response('', 304)
+            response.set_etag(casado)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        if planta is not None:
+            response.vary.add('X-Planta')
+        return response
+    return wrapper